@@ -1,11 +1,32 @@
+import uuid
+
 from django.contrib import admin
-from .models import HealthAssessment, Question, Answer, TreatmentPlan
+from .models import (
+    ArchivedAssessment, HealthAssessment, Question, Answer, AnswerSubmission, TreatmentPlan, TreatmentPlanJob
+)
+
+class ExactAssessmentSearch:
+    """Search by exact session ID or assessment ID"""
+    search_fields = ['session_id']
+    search_help_text = "Exact session ID or assessment ID"
+
+    def get_search_results(self, request, queryset, search_term):
+        # Exact lookups hit the indexes; substring search over initial_concern scanned the table
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        try:
+            return queryset.filter(id=uuid.UUID(term)), False
+        except ValueError:
+            return queryset.filter(session_id=term), False
 
 @admin.register(HealthAssessment)
-class HealthAssessmentAdmin(admin.ModelAdmin):
+class HealthAssessmentAdmin(ExactAssessmentSearch, admin.ModelAdmin):
     list_display = ['id', 'session_id', 'status', 'created_at']
     list_filter = ['status', 'created_at']
-    search_fields = ['session_id', 'initial_concern']
+    date_hierarchy = 'created_at'
+    # Skip the unfiltered COUNT(*) the changelist otherwise runs on every page
+    show_full_result_count = False
     readonly_fields = ['id', 'created_at', 'updated_at']
 
 @admin.register(Question)
@@ -13,13 +34,49 @@ class QuestionAdmin(admin.ModelAdmin):
     list_display = ['id', 'assessment', 'question_order', 'is_answered']
     list_filter = ['is_answered', 'created_at']
     search_fields = ['question_text']
+    list_select_related = ['assessment']
+    raw_id_fields = ['assessment']
+    show_full_result_count = False
 
 @admin.register(Answer)
 class AnswerAdmin(admin.ModelAdmin):
     list_display = ['id', 'question', 'created_at']
     search_fields = ['answer_text']
+    list_select_related = ['question']
+    raw_id_fields = ['question']
+    show_full_result_count = False
+
+@admin.register(AnswerSubmission)
+class AnswerSubmissionAdmin(admin.ModelAdmin):
+    list_display = ['key', 'question', 'created_at']
+    search_fields = ['key']
+    list_select_related = ['question']
+    raw_id_fields = ['question']
+    readonly_fields = ['created_at']
 
 @admin.register(TreatmentPlan)
 class TreatmentPlanAdmin(admin.ModelAdmin):
     list_display = ['id', 'assessment', 'created_at']
+    list_select_related = ['assessment']
+    raw_id_fields = ['assessment']
     readonly_fields = ['created_at']
+
+@admin.register(TreatmentPlanJob)
+class TreatmentPlanJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'assessment', 'status', 'progress', 'created_at']
+    list_filter = ['status']
+    list_select_related = ['assessment']
+    raw_id_fields = ['assessment']
+    readonly_fields = ['id', 'created_at', 'updated_at']
+
+@admin.register(ArchivedAssessment)
+class ArchivedAssessmentAdmin(ExactAssessmentSearch, admin.ModelAdmin):
+    list_display = ['id', 'session_id', 'created_at', 'archived_at']
+    date_hierarchy = 'archived_at'
+    show_full_result_count = False
+    # The compressed document is read through get_assessment
+    exclude = ['document']
+    readonly_fields = ['id', 'session_id', 'created_at', 'archived_at']
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,97 @@
+"""Archival of finished assessments out of the live tables.
+
+Assessments in ``treatment_generated`` with no activity for
+ARCHIVE_AFTER_DAYS move, one batch per transaction, into
+ArchivedAssessment: a row each, holding the zlib-compressed JSON that
+get_assessment returned for it. The assessment and its questions,
+answers, plan, jobs and idempotency records are then deleted, which
+keeps the live tables and their indexes small.
+
+get_assessment falls back to the archive, so an archived assessment reads
+as before. Archived assessments no longer appear in the listing or the
+export, and their plans are not reused by the plan cache.
+"""
+import json
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import tracing
+from .models import ArchivedAssessment, HealthAssessment
+from .serializers import HealthAssessmentSerializer
+
+
+def compress(data: Dict[str, Any]) -> bytes:
+    return zlib.compress(JSONEncoder().encode(data).encode())
+
+
+def decompress(document: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(document))
+
+
+def load(assessment_id) -> Optional[Dict[str, Any]]:
+    """The archived get_assessment payload, or None if the assessment was never archived"""
+    document = ArchivedAssessment.objects.filter(id=assessment_id).values_list('document', flat=True).first()
+    return decompress(document) if document is not None else None
+
+
+def cutoff(days: int = None) -> datetime:
+    return timezone.now() - timedelta(days=settings.ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+def archive_batch(before: datetime, batch_size: int) -> int:
+    """Archive up to ``batch_size`` finished assessments last updated before ``before``; returns how many"""
+    assessments = list(
+        HealthAssessment.objects.with_details()
+        .filter(status='treatment_generated', updated_at__lt=before)
+        .order_by('updated_at')[:batch_size]
+    )
+    if not assessments:
+        return 0
+
+    ids = [assessment.id for assessment in assessments]
+    # One serializer for the batch builds its fields once instead of per assessment
+    documents = HealthAssessmentSerializer(assessments, many=True).data
+    with tracing.span('archive.batch', size=len(ids)), transaction.atomic():
+        # Write first: SQLite cannot turn a read transaction into a write while another connection writes
+        ArchivedAssessment.objects.bulk_create([
+            ArchivedAssessment(
+                id=assessment.id,
+                session_id=assessment.session_id,
+                created_at=assessment.created_at,
+                document=compress(document),
+            )
+            for assessment, document in zip(assessments, documents)
+        ])
+        # Anything saved since it was read has a newer updated_at; it stays live and its copy goes
+        HealthAssessment.objects.filter(id__in=ids, updated_at__lt=before).delete()
+        kept = list(HealthAssessment.objects.filter(id__in=ids).values_list('id', flat=True))
+        if kept:
+            ArchivedAssessment.objects.filter(id__in=kept).delete()
+    return len(ids) - len(kept)
+
+
+def archive_finished(
+    days: int = None,
+    batch_size: int = None,
+    max_batches: int = None,
+    on_batch: Callable[[int], None] = None
+) -> int:
+    """Archive finished assessments idle for ``days`` in batches until none are left; returns how many"""
+    before = cutoff(days)
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        archived = archive_batch(before, batch_size)
+        if not archived:
+            break
+        total += archived
+        batches += 1
+        if on_batch:
+            on_batch(archived)
+    return total
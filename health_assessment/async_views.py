@@ -0,0 +1,245 @@
+"""Async variants of the assessment endpoints.
+
+DRF 3.14 views are sync-only, so these are plain Django async views. Served
+through ``health_project.asgi`` they release the event loop while waiting on
+the model instead of pinning a worker per in-flight LLM call.
+"""
+import json
+import logging
+import uuid
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from rest_framework import status
+
+from .models import HealthAssessment, Question
+from .serializers import StartAssessmentSerializer, SubmitAnswerSerializer, TreatmentPlanSerializer
+from .services import EKAMCPService
+from .llm_router import get_llm_service
+from .pipeline import (
+    MAX_QUESTIONS, MIN_ANSWERS_FOR_PLAN, reusable_hash, reuse_treatment_plan, save_treatment_plan
+)
+from . import hot_state, plan_cache, speculation, throttling, views
+
+logger = logging.getLogger(__name__)
+
+
+def async_api_view(methods):
+    """Restrict an async view to ``methods`` and exempt it from CSRF like DRF's api_view.
+
+    Like the sync views that call a model, every view here takes a token from
+    the client's ``requests`` and ``model`` buckets and runs in a model-work
+    slot (see throttling.py), answering 429 when either is exhausted.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            wait = await sync_to_async(throttling.take, thread_sensitive=False)(
+                throttling.ModelRateThrottle.scopes, throttling.client_idents(request)
+            )
+            if wait:
+                return throttling.throttled_response(wait)
+            release = await sync_to_async(throttling.admit, thread_sensitive=False)()
+            if release is None:
+                return throttling.throttled_response(throttling.retry_after())
+            try:
+                return await view_func(request, *args, **kwargs)
+            except Http404:
+                return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+            finally:
+                release()
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+def _request_data(request):
+    if not request.body:
+        return {}
+    try:
+        return json.loads(request.body)
+    except ValueError:
+        return None
+
+
+async def _aget_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except queryset.model.DoesNotExist:
+        raise Http404
+
+
+@transaction.atomic
+def _create_assessment(session_id, initial_concern, questions):
+    # The async ORM has no atomic(); run the writes as one sync transaction
+    assessment = HealthAssessment.objects.create(
+        session_id=session_id,
+        initial_concern=initial_concern,
+        status='started'
+    )
+    created_questions = Question.objects.bulk_create([
+        Question(assessment=assessment, question_text=question_text, question_order=i)
+        for i, question_text in enumerate(questions, 1)
+    ])
+    assessment.status = 'in_progress'
+    assessment.save(update_fields=['status', 'updated_at'])
+    return assessment, created_questions
+
+
+@async_api_view(['POST'])
+async def start_assessment(request):
+    """Start a new health assessment"""
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({'detail': 'Malformed JSON'}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = StartAssessmentSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    session_id = data.get('session_id', str(uuid.uuid4()))
+
+    try:
+        llm_service = get_llm_service()
+        questions = await llm_service.agenerate_initial_questions(data['initial_concern'])
+
+        assessment, created_questions = await sync_to_async(_create_assessment)(
+            session_id, data['initial_concern'], questions
+        )
+        question_objs = [{
+            'id': q.id,
+            'question_text': q.question_text,
+            'question_order': q.question_order,
+            'is_answered': q.is_answered
+        } for q in created_questions]
+
+        return JsonResponse({
+            'assessment_id': assessment.id,
+            'session_id': assessment.session_id,
+            'questions': question_objs,
+            'status': 'success'
+        })
+
+    except Exception as e:
+        logger.error(f"Error starting assessment: {str(e)}")
+        return JsonResponse(
+            {'error': 'Failed to start assessment', 'details': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@async_api_view(['POST'])
+async def submit_answer(request):
+    """Submit an answer to a question.
+
+    Records the answer, adds the follow-up and honours ``Idempotency-Key``
+    exactly as the sync view does, running its helpers in a thread; only
+    the model call is awaited here.
+    """
+    data = _request_data(request)
+    if data is None:
+        return JsonResponse({'detail': 'Malformed JSON'}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = SubmitAnswerSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    key = request.headers.get('Idempotency-Key', '')
+    if len(key) > views.IDEMPOTENCY_KEY_MAX_LENGTH:
+        return JsonResponse(
+            {'error': f'Idempotency-Key must be at most {views.IDEMPOTENCY_KEY_MAX_LENGTH} characters.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    question = await _aget_or_404(Question.objects.select_related('assessment'), id=data['question_id'])
+    assessment = question.assessment
+
+    try:
+        if key:
+            replay = await sync_to_async(views._claim_idempotency_key)(key, question)
+            if replay is not None:
+                return views._replay_response(replay, JsonResponse)
+
+        try:
+            state_status, total_questions, answered_questions, pending, newly_answered = await sync_to_async(
+                views._record_answer
+            )(question, data['answer_text'])
+
+            next_question = None
+            llm_service = get_llm_service()
+            if views._needs_followup(newly_answered, total_questions, answered_questions):
+                followup_question_text = await sync_to_async(speculation.take, thread_sensitive=False)(assessment)
+                if followup_question_text is None:
+                    followup_question_text = await llm_service.agenerate_followup_question(assessment)
+
+                next_question, created = await sync_to_async(views._add_followup)(
+                    assessment, total_questions + 1, followup_question_text
+                )
+                total_questions += 1
+                if created and pending is not None:
+                    pending.append(hot_state.question_payload(next_question))
+                else:
+                    pending = None
+            elif total_questions < MAX_QUESTIONS:
+                await sync_to_async(speculation.maybe_start)(llm_service, assessment, answered_questions, total_questions)
+
+            await sync_to_async(views._store_answer_state)(
+                assessment, state_status, total_questions, answered_questions, pending
+            )
+            payload = views._answer_payload(next_question, answered_questions)
+        except Exception:
+            if key:
+                await sync_to_async(views._release_idempotency_key)(key)
+            raise
+
+        if key:
+            await sync_to_async(views._save_idempotent_response)(key, payload)
+        return JsonResponse(payload)
+
+    except Exception as e:
+        logger.error(f"Error submitting answer: {str(e)}")
+        return JsonResponse(
+            {'error': 'Failed to submit answer', 'details': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+@async_api_view(['POST'])
+async def generate_treatment_plan(request, assessment_id):
+    """Generate treatment plan for completed assessment"""
+    assessment = await _aget_or_404(HealthAssessment.objects.all(), id=assessment_id)
+
+    try:
+        answered_questions = await assessment.questions.filter(is_answered=True).acount()
+        if answered_questions < MIN_ANSWERS_FOR_PLAN:
+            return JsonResponse(
+                {'error': 'Not enough questions answered. Minimum 3 required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        digest = plan_cache.transcript_hash(assessment)
+        treatment_plan = await sync_to_async(reuse_treatment_plan)(assessment, digest)
+        cached = treatment_plan is not None
+        if not cached:
+            eka_service = EKAMCPService(get_llm_service())
+            treatment_data = await eka_service.agenerate_treatment_plan(assessment)
+            treatment_plan = await sync_to_async(save_treatment_plan)(
+                assessment, treatment_data, reusable_hash(eka_service, digest)
+            )
+
+        serializer = TreatmentPlanSerializer(treatment_plan)
+        return JsonResponse({
+            'status': 'success',
+            'cached': cached,
+            'treatment_plan': serializer.data
+        })
+
+    except Exception as e:
+        logger.error(f"Error generating treatment plan: {str(e)}")
+        return JsonResponse(
+            {'error': 'Failed to generate treatment plan', 'details': str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
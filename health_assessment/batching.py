@@ -0,0 +1,163 @@
+"""Micro-batching of concurrent initial-question prompts.
+
+With INITIAL_QUESTION_BATCH_WINDOW_MS above zero, cache misses in
+``generate_initial_questions`` are queued per provider instead of calling
+the model directly. A collector thread waits up to the window (or until
+INITIAL_QUESTION_BATCH_SIZE concerns are queued) and dispatches the batch:
+
+- ``prompt`` mode sends one model call covering every concern and splits
+  the reply back per concern; concerns missing from the reply are retried
+  individually.
+- ``fanout`` mode sends one call per concern, at most
+  INITIAL_QUESTION_BATCH_WORKERS at a time, which caps concurrent requests
+  per provider during bursts.
+
+Identical concerns in the same batch share one result. Each waiting
+request gets its own result or the batch's exception back through a
+Future.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Tuple
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    from .llm import LLMService
+
+_lock = threading.Lock()
+_dispatchers: Dict[str, "Dispatcher"] = {}
+_batch_executor = None
+_fanout_executor = None
+
+
+def enabled() -> bool:
+    return settings.INITIAL_QUESTION_BATCH_WINDOW_MS > 0
+
+
+def _executors() -> Tuple[ThreadPoolExecutor, ThreadPoolExecutor]:
+    # Separate pools: batch jobs wait on fan-out calls and must not starve them
+    global _batch_executor, _fanout_executor
+    with _lock:
+        if _batch_executor is None:
+            _batch_executor = ThreadPoolExecutor(
+                max_workers=settings.INITIAL_QUESTION_BATCH_WORKERS,
+                thread_name_prefix='question-batch'
+            )
+            _fanout_executor = ThreadPoolExecutor(
+                max_workers=settings.INITIAL_QUESTION_BATCH_WORKERS,
+                thread_name_prefix='question-fanout'
+            )
+    return _batch_executor, _fanout_executor
+
+
+class Dispatcher:
+    def __init__(self, service: "LLMService"):
+        self.service = service
+        self.batches = 0
+        self.prompts = 0
+        self._stats_lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._collect, name=f'question-batcher-{service.breaker_name}', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._queue.put(None)
+
+    def submit(self, concern: str) -> Future:
+        future = Future()
+        self._queue.put((concern, future))
+        return future
+
+    def _collect(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            closes_at = time.monotonic() + settings.INITIAL_QUESTION_BATCH_WINDOW_MS / 1000
+            while len(batch) < settings.INITIAL_QUESTION_BATCH_SIZE:
+                remaining = closes_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    # Stopped: hand over what was collected, then exit
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            # Dispatch off-thread so the next batch collects while this one waits on the model
+            _executors()[0].submit(self._dispatch, batch)
+
+    def _dispatch(self, batch: List[Tuple[str, Future]]):
+        concerns = list(dict.fromkeys(concern for concern, _ in batch))
+        with self._stats_lock:
+            self.batches += 1
+            self.prompts += len(batch)
+        try:
+            results = dict(zip(concerns, self._generate(concerns)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for concern, future in batch:
+            future.set_result(results[concern])
+
+    def _generate(self, concerns: List[str]) -> List[List[str]]:
+        fanout = _executors()[1]
+        if len(concerns) == 1 or settings.INITIAL_QUESTION_BATCH_MODE == 'fanout':
+            results = [None] * len(concerns)
+        else:
+            results = self.service.initial_questions_batch(concerns)
+        missing = {
+            i: fanout.submit(self.service.initial_questions, concern)
+            for i, concern in enumerate(concerns) if not results[i]
+        }
+        for i, future in missing.items():
+            results[i] = future.result()
+        return results
+
+
+def get_dispatcher(service: "LLMService") -> Dispatcher:
+    with _lock:
+        dispatcher = _dispatchers.get(service.breaker_name)
+        if dispatcher is None:
+            dispatcher = _dispatchers[service.breaker_name] = Dispatcher(service)
+    return dispatcher
+
+
+def submit(service: "LLMService", concern: str) -> Future:
+    """Queue ``concern`` on the service's dispatcher; the Future yields its questions"""
+    return get_dispatcher(service).submit(concern)
+
+
+def max_wait() -> float:
+    """How long a request waits on its batch: the window, the batched call and one individual retry"""
+    return settings.INITIAL_QUESTION_BATCH_WINDOW_MS / 1000 + 2 * settings.LLM_DEADLINES['initial_questions']
+
+
+def stats() -> Dict[str, Dict[str, float]]:
+    with _lock:
+        dispatchers = list(_dispatchers.values())
+    return {
+        d.service.breaker_name: {
+            'batches': d.batches,
+            'prompts': d.prompts,
+            'mean_batch_size': d.prompts / d.batches if d.batches else 0.0,
+        }
+        for d in dispatchers
+    }
+
+
+def reset():
+    with _lock:
+        for dispatcher in _dispatchers.values():
+            dispatcher.stop()
+        _dispatchers.clear()
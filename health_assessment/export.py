@@ -0,0 +1,71 @@
+"""Streaming export of assessments with their questions, answers and plans.
+
+Rows are read with ``QuerySet.iterator(chunk_size=...)``: a server-side
+cursor on PostgreSQL, with questions, answers and plans prefetched one
+chunk at a time. Memory therefore stays flat however many assessments
+match, and the response starts streaming before the last row is read.
+"""
+import csv
+import json
+from typing import Iterator
+
+from django.conf import settings
+from django.db.models import Prefetch, QuerySet
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import HealthAssessment, Question
+from .serializers import HealthAssessmentSerializer
+
+CSV_COLUMNS = [
+    'assessment_id', 'session_id', 'status', 'initial_concern', 'created_at',
+    'question_order', 'question_text', 'answer_text',
+    'diagnosis', 'recommendations', 'medications', 'lifestyle_changes', 'followup_instructions',
+]
+PLAN_LIST_FIELDS = ['recommendations', 'medications', 'lifestyle_changes']
+
+
+def _rows(queryset: QuerySet) -> Iterator[HealthAssessment]:
+    queryset = queryset.select_related('treatment_plan').prefetch_related(
+        Prefetch('questions', queryset=Question.objects.select_related('answer'))
+    ).order_by('created_at', 'id')
+    return queryset.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def ndjson(queryset: QuerySet) -> Iterator[str]:
+    """One assessment per line, shaped like the get_assessment response"""
+    encoder = JSONEncoder()
+    for assessment in _rows(queryset):
+        yield encoder.encode(HealthAssessmentSerializer(assessment).data) + '\n'
+
+
+class _Echo:
+    """File-like object whose write() hands the formatted line back to csv.writer's caller"""
+
+    def write(self, value):
+        return value
+
+
+def csv_rows(queryset: QuerySet) -> Iterator[str]:
+    """One row per question; plan fields repeat on each row, list fields JSON-encoded"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for assessment in _rows(queryset):
+        plan = getattr(assessment, 'treatment_plan', None)
+        plan_values = [
+            plan.diagnosis if plan else '',
+            *(json.dumps(getattr(plan, field)) if plan else '' for field in PLAN_LIST_FIELDS),
+            plan.followup_instructions if plan else '',
+        ]
+        prefix = [
+            assessment.id, assessment.session_id, assessment.status, assessment.initial_concern,
+            assessment.created_at.isoformat(),
+        ]
+        questions = list(assessment.questions.all())
+        if not questions:
+            yield writer.writerow(prefix + ['', '', ''] + plan_values)
+        for question in questions:
+            answer = getattr(question, 'answer', None)
+            yield writer.writerow(
+                prefix + [question.question_order, question.question_text, answer.answer_text if answer else '']
+                + plan_values
+            )
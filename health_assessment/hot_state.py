@@ -0,0 +1,81 @@
+"""Cached per-assessment state for the polling and answering endpoints.
+
+The state is the assessment's status, its question counters and its open
+questions in order, stored under HOT_STATE_CACHE_ALIAS. Reads fall back to
+the database on a miss and fill the cache.
+
+Writes through the views store the new state directly (``store``). Any
+other save or delete of a HealthAssessment, Question or Answer drops the
+entry (see signals.py), so the admin, the shell and bulk jobs cannot
+leave it stale.
+"""
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q
+
+from . import metrics
+from .models import HealthAssessment, Question
+
+
+def _cache():
+    return caches[settings.HOT_STATE_CACHE_ALIAS]
+
+
+def _key(assessment_id) -> str:
+    return f'assessment-state:{assessment_id}'
+
+
+def question_payload(question: Question) -> Dict[str, Any]:
+    """The fields get_next_question returns, as QuestionSerializer renders an open question"""
+    return {
+        'id': question.id,
+        'question_text': question.question_text,
+        'question_order': question.question_order,
+        'is_answered': question.is_answered,
+        'answer': None,
+    }
+
+
+def build(status: str, total: int, answered: int, pending: List[Question]) -> Dict[str, Any]:
+    return {
+        'status': status,
+        'total': total,
+        'answered': answered,
+        'pending': [question_payload(question) for question in pending],
+    }
+
+
+def load(assessment_id) -> Optional[Dict[str, Any]]:
+    row = HealthAssessment.objects.filter(id=assessment_id).annotate(
+        total=Count('questions'),
+        answered=Count('questions', filter=Q(questions__is_answered=True)),
+    ).values('status', 'total', 'answered').first()
+    if row is None:
+        return None
+    pending = Question.objects.filter(assessment_id=assessment_id, is_answered=False)
+    return build(row['status'], row['total'], row['answered'], list(pending))
+
+
+def get(assessment_id) -> Optional[Dict[str, Any]]:
+    """The assessment's state, or None if it does not exist"""
+    state = _cache().get(_key(assessment_id))
+    metrics.CACHE_REQUESTS.inc(cache='hot_state', result='miss' if state is None else 'hit')
+    if state is None:
+        state = load(assessment_id)
+        if state is not None:
+            store(assessment_id, state)
+    return state
+
+
+def store(assessment_id, state: Dict[str, Any]):
+    _cache().set(_key(assessment_id), state, settings.HOT_STATE_TTL)
+
+
+def invalidate(assessment_id):
+    _cache().delete(_key(assessment_id))
+
+
+def next_question(state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    return state['pending'][0] if state['pending'] else None
@@ -0,0 +1,267 @@
+import asyncio
+import logging
+import re
+from typing import Iterator, List
+
+from asgiref.sync import sync_to_async
+
+from . import batching, metrics, prompt_budget, resilience, transcript
+from .models import HealthAssessment
+from .question_cache import get_question_cache
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_QUESTIONS = [
+    "How long have you been experiencing this concern?",
+    "On a scale of 1-10, how would you rate the severity?",
+    "Does anything make it better or worse?",
+    "Have you taken any medications for this?",
+    "Do you have any family history of similar conditions?"
+]
+
+FALLBACK_FOLLOWUP_QUESTION = "Is there anything else about your symptoms that you think might be important?"
+
+# Standing instructions for follow-up questions, sent as the system prompt where the provider has one
+FOLLOWUP_SYSTEM_PROMPT = """You are conducting a medical assessment. Given the conversation so far,
+generate ONE more specific follow-up question that would help better understand
+the patient's condition. The question should:
+1. Build on previous answers
+2. Help clarify any ambiguities
+3. Gather additional relevant information
+4. Be clear and specific
+
+Return only the question, nothing else."""
+
+# Section header of each concern in a batched initial-questions reply
+BATCH_SECTION = re.compile(r'^\s*#+\s*Concern\s+(\d+)\s*:?\s*$', re.MULTILINE | re.IGNORECASE)
+
+
+def with_system(prompt: str, system: str = None) -> str:
+    """Fold the system prompt into the user prompt for providers without a system role"""
+    return f"{system}\n\n{prompt}" if system else prompt
+
+
+class LLMService:
+    """Prompting and parsing shared by the question-generation providers.
+
+    Subclasses implement ``complete``/``acomplete`` against their SDK,
+    honouring ``timeout`` in seconds; both must raise on failure so the
+    public methods can fall back. The public methods go through ``call``,
+    ``acall`` and ``open_stream``, which add deadlines, retries and the
+    provider's circuit breaker (see resilience.py).
+
+    ``system`` carries standing instructions. Providers with a system role
+    send it there; the others prepend it with ``with_system``.
+    """
+    provider_name = 'LLM'
+    initial_question_count = 5
+    initial_questions_max_tokens = 1000
+    followup_max_tokens = 300
+
+    def complete(self, prompt: str, max_tokens: int, timeout: float = None, system: str = None) -> str:
+        raise NotImplementedError
+
+    async def acomplete(self, prompt: str, max_tokens: int, timeout: float = None, system: str = None) -> str:
+        raise NotImplementedError
+
+    def stream(self, prompt: str, max_tokens: int, timeout: float = None, system: str = None) -> Iterator[str]:
+        """Yield the completion in chunks; providers without streaming yield it whole"""
+        yield self.complete(prompt, max_tokens, timeout=timeout, system=system)
+
+    @property
+    def breaker_name(self) -> str:
+        return type(self).__name__
+
+    def call(self, operation: str, prompt: str, max_tokens: int, system: str = None) -> str:
+        """complete() under the operation's deadline, retries and circuit breaker"""
+        self._count_tokens(operation, 'prompt', with_system(prompt, system))
+        text = resilience.call(
+            self.breaker_name, operation,
+            lambda timeout: self.complete(prompt, max_tokens, timeout=timeout, system=system)
+        )
+        self._count_tokens(operation, 'completion', text)
+        return text
+
+    async def acall(self, operation: str, prompt: str, max_tokens: int, system: str = None) -> str:
+        self._count_tokens(operation, 'prompt', with_system(prompt, system))
+        text = await resilience.acall(
+            self.breaker_name, operation,
+            lambda timeout: self.acomplete(prompt, max_tokens, timeout=timeout, system=system)
+        )
+        self._count_tokens(operation, 'completion', text)
+        return text
+
+    def open_stream(self, operation: str, prompt: str, max_tokens: int, system: str = None) -> Iterator[str]:
+        """stream() under the operation's deadline and circuit breaker; never retried"""
+        self._count_tokens(operation, 'prompt', with_system(prompt, system))
+        chunks = resilience.stream(
+            self.breaker_name, operation,
+            lambda timeout: self.stream(prompt, max_tokens, timeout=timeout, system=system)
+        )
+        return self._counted(operation, chunks)
+
+    def _count_tokens(self, operation: str, direction: str, text: str):
+        # Estimated locally; retried attempts of one call are counted once
+        metrics.LLM_TOKENS.inc(
+            prompt_budget.count_tokens(text or ''),
+            provider=self.breaker_name, operation=operation, direction=direction
+        )
+
+    def _counted(self, operation: str, chunks: Iterator[str]) -> Iterator[str]:
+        for chunk in chunks:
+            self._count_tokens(operation, 'completion', chunk)
+            yield chunk
+
+    def generate_initial_questions(self, concern: str) -> List[str]:
+        """Generate initial questions based on the patient's concern"""
+        cache = get_question_cache()
+        if cache:
+            cached = cache.get(self._cache_namespace(), concern)
+            if cached is not None:
+                return cached
+
+        try:
+            if batching.enabled():
+                questions = batching.submit(self, concern).result(timeout=batching.max_wait())
+            else:
+                questions = self.initial_questions(concern)
+        except Exception as e:
+            logger.error(f"Error generating questions with {self.provider_name}: {str(e)}")
+            metrics.LLM_FALLBACKS.inc(operation='initial_questions')
+            return list(FALLBACK_QUESTIONS)
+
+        if cache and questions:
+            cache.set(self._cache_namespace(), concern, questions)
+        return questions
+
+    async def agenerate_initial_questions(self, concern: str) -> List[str]:
+        """Async variant of generate_initial_questions"""
+        cache = get_question_cache()
+        if cache:
+            cached = await sync_to_async(cache.get, thread_sensitive=False)(self._cache_namespace(), concern)
+            if cached is not None:
+                return cached
+
+        try:
+            if batching.enabled():
+                future = asyncio.wrap_future(batching.submit(self, concern))
+                questions = await asyncio.wait_for(future, timeout=batching.max_wait())
+            else:
+                prompt = self._initial_questions_prompt(concern)
+                text = await self.acall('initial_questions', prompt, self.initial_questions_max_tokens)
+                questions = self._parse_questions(text)
+        except Exception as e:
+            logger.error(f"Error generating questions with {self.provider_name}: {str(e)}")
+            metrics.LLM_FALLBACKS.inc(operation='initial_questions')
+            return list(FALLBACK_QUESTIONS)
+
+        if cache and questions:
+            await sync_to_async(cache.set, thread_sensitive=False)(self._cache_namespace(), concern, questions)
+        return questions
+
+    def initial_questions(self, concern: str) -> List[str]:
+        """One model call for one concern; raises on failure"""
+        text = self.call('initial_questions', self._initial_questions_prompt(concern), self.initial_questions_max_tokens)
+        return self._parse_questions(text)
+
+    def initial_questions_batch(self, concerns: List[str]) -> List[List[str]]:
+        """One model call covering several concerns; concerns the reply skips come back empty"""
+        text = self.call(
+            'initial_questions',
+            self._batch_initial_questions_prompt(concerns),
+            self.initial_questions_max_tokens * len(concerns)
+        )
+        return self._parse_batch(text, len(concerns))
+
+    def generate_followup_question(self, assessment: HealthAssessment) -> str:
+        """Generate a follow-up question based on previous answers"""
+        return self.generate_followup_from_prompt(self.build_followup_prompt(assessment))
+
+    def build_followup_prompt(self, assessment: HealthAssessment) -> str:
+        return self._followup_prompt(self._build_conversation_context(assessment))
+
+    def generate_followup_from_prompt(self, prompt: str) -> str:
+        """Run a prompt from build_followup_prompt; needs no database access"""
+        try:
+            return self.call('followup_question', prompt, self.followup_max_tokens, system=FOLLOWUP_SYSTEM_PROMPT).strip()
+        except Exception as e:
+            logger.error(f"Error generating follow-up question: {str(e)}")
+            metrics.LLM_FALLBACKS.inc(operation='followup_question')
+            return FALLBACK_FOLLOWUP_QUESTION
+
+    async def agenerate_followup_question(self, assessment: HealthAssessment) -> str:
+        """Async variant of generate_followup_question"""
+        prompt = self.build_followup_prompt(assessment)
+        try:
+            text = await self.acall('followup_question', prompt, self.followup_max_tokens, system=FOLLOWUP_SYSTEM_PROMPT)
+            return text.strip()
+        except Exception as e:
+            logger.error(f"Error generating follow-up question: {str(e)}")
+            metrics.LLM_FALLBACKS.inc(operation='followup_question')
+            return FALLBACK_FOLLOWUP_QUESTION
+
+    def stream_followup_question(self, assessment: HealthAssessment) -> Iterator[str]:
+        """Stream a follow-up question as it is generated; raises on failure"""
+        return self.open_stream(
+            'followup_question', self.build_followup_prompt(assessment), self.followup_max_tokens,
+            system=FOLLOWUP_SYSTEM_PROMPT
+        )
+
+    def _cache_namespace(self) -> str:
+        # Providers ask for different question counts, so entries are not interchangeable
+        return f"{type(self).__name__}:{self.initial_question_count}"
+
+    def _initial_questions_prompt(self, concern: str) -> str:
+        return f"""
+        You are a medical AI assistant helping to conduct a health assessment.
+        A patient has expressed the following concern: "{concern}"
+
+        Generate {self.initial_question_count} relevant, specific medical questions to better understand their condition.
+        The questions should be:
+        1. Clear and easy to understand
+        2. Medically relevant
+        3. Help narrow down potential causes
+        4. Appropriate for a non-medical person to answer
+
+        Return only the questions, one per line, without numbering.
+        """
+
+    def _batch_initial_questions_prompt(self, concerns: List[str]) -> str:
+        numbered = '\n'.join(f'        Concern {i}: "{concern}"' for i, concern in enumerate(concerns, 1))
+        return f"""
+        You are a medical AI assistant helping to conduct health assessments.
+        Several patients have each expressed a concern:
+
+{numbered}
+
+        For each concern, generate {self.initial_question_count} relevant, specific medical questions to better understand that patient's condition.
+        The questions should be:
+        1. Clear and easy to understand
+        2. Medically relevant
+        3. Help narrow down potential causes
+        4. Appropriate for a non-medical person to answer
+
+        Start each patient's questions with a line "### Concern <number>", then return
+        only the questions, one per line, without numbering.
+        """
+
+    def _followup_prompt(self, conversation_context: str) -> str:
+        # The instructions travel separately as FOLLOWUP_SYSTEM_PROMPT
+        return f"Conversation so far:\n\n{conversation_context}"
+
+    def _parse_questions(self, text: str) -> List[str]:
+        questions = [q.strip() for q in text.strip().split('\n') if q.strip()]
+        return questions[:self.initial_question_count]
+
+    def _parse_batch(self, text: str, count: int) -> List[List[str]]:
+        results = [[] for _ in range(count)]
+        parts = BATCH_SECTION.split(text)
+        for number, body in zip(parts[1::2], parts[2::2]):
+            index = int(number) - 1
+            if 0 <= index < count:
+                results[index] = self._parse_questions(body)
+        return results
+
+    def _build_conversation_context(self, assessment: HealthAssessment) -> str:
+        """Build conversation context for the model"""
+        return transcript.render_context(assessment)
@@ -0,0 +1,230 @@
+"""Provider selection for the LLM-backed services.
+
+``get_llm_service()`` returns the service named by the LLM_SERVICE setting.
+Setting it to ``router`` returns the process-wide LLMRouter, which spreads
+calls over LLM_ROUTER_PROVIDERS by observed latency and error rate. When
+the chosen provider runs past its own LLM_HEDGE_PERCENTILE latency, the
+router sends the same prompt to the next provider and uses whichever
+answer arrives first.
+"""
+import asyncio
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Awaitable, Callable, Dict, Iterator, List
+
+from django.conf import settings
+
+from .gemeni_service import GeminiService, GeminiServiceAdvanced
+from .llm import LLMService
+from .resilience import LLMUnavailableError, get_breaker
+from .services import ClaudeService
+
+logger = logging.getLogger(__name__)
+
+SERVICES = {
+    'gemini': GeminiService,
+    'gemini-advanced': GeminiServiceAdvanced,
+    'claude': ClaudeService,
+}
+
+# Samples needed before a provider's own latency percentile drives hedging
+MIN_SAMPLES = 5
+ERROR_ALPHA = 0.1
+ERROR_PENALTY = 4.0
+
+
+class ProviderStats:
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.error_rate = 0.0
+        self.calls = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool):
+        with self._lock:
+            self.calls += 1
+            if ok:
+                self.latencies.append(latency)
+            else:
+                self.errors += 1
+            self.error_rate += ERROR_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def percentile(self, pct: int) -> float:
+        with self._lock:
+            samples = list(self.latencies)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return statistics.quantiles(samples, n=100, method='inclusive')[pct - 1]
+
+    def score(self) -> float:
+        """Lower is better; providers without enough samples go first so they get measured"""
+        p50 = self.percentile(50)
+        if p50 is None:
+            return 0.0
+        return p50 * (1 + ERROR_PENALTY * self.error_rate)
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'error_rate': self.error_rate,
+            'p50_s': self.percentile(50),
+            'p95_s': self.percentile(95),
+        }
+
+
+class LLMRouter(LLMService):
+    provider_name = 'router'
+
+    def __init__(self, provider_names: List[str]):
+        self.providers = {name: SERVICES[name]() for name in provider_names}
+        self.stats = {name: ProviderStats(settings.LLM_ROUTER_WINDOW) for name in provider_names}
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.LLM_ROUTER_WORKERS,
+            thread_name_prefix='llm-router'
+        )
+
+    def ranked(self) -> List[str]:
+        """Providers by score, leaving out those whose circuit is open"""
+        available = [name for name in self.providers if not get_breaker(self.providers[name].breaker_name).is_open()]
+        return sorted(available, key=lambda name: self.stats[name].score())
+
+    def hedge_delay(self, name: str) -> float:
+        observed = self.stats[name].percentile(settings.LLM_HEDGE_PERCENTILE)
+        return max(observed or 0.0, settings.LLM_HEDGE_MIN_DELAY)
+
+    def _timed(self, name: str, attempt: Callable[[LLMService], str]) -> str:
+        started = time.monotonic()
+        try:
+            text = attempt(self.providers[name])
+        except Exception:
+            self.stats[name].record(time.monotonic() - started, ok=False)
+            raise
+        self.stats[name].record(time.monotonic() - started, ok=True)
+        return text
+
+    async def _atimed(self, name: str, attempt: Callable[[LLMService], Awaitable[str]]) -> str:
+        started = time.monotonic()
+        try:
+            text = await attempt(self.providers[name])
+        except Exception:
+            self.stats[name].record(time.monotonic() - started, ok=False)
+            raise
+        self.stats[name].record(time.monotonic() - started, ok=True)
+        return text
+
+    def _hedged(self, attempt: Callable[[LLMService], str]) -> str:
+        candidates = self.ranked()
+        pending = {}
+        last_error = LLMUnavailableError("Every LLM provider's circuit is open")
+        while candidates or pending:
+            if candidates:
+                name = candidates.pop(0)
+                pending[self._executor.submit(self._timed, name, attempt)] = name
+                # Give the newest request until its tail latency before hedging with the next provider
+                timeout = self.hedge_delay(name) if candidates else None
+            else:
+                timeout = None
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    logger.error(f"LLM provider {name} failed: {str(e)}")
+                    last_error = e
+        raise last_error
+
+    async def _ahedged(self, attempt: Callable[[LLMService], Awaitable[str]]) -> str:
+        candidates = self.ranked()
+        pending = {}
+        last_error = LLMUnavailableError("Every LLM provider's circuit is open")
+        try:
+            while candidates or pending:
+                if candidates:
+                    name = candidates.pop(0)
+                    pending[asyncio.ensure_future(self._atimed(name, attempt))] = name
+                    timeout = self.hedge_delay(name) if candidates else None
+                else:
+                    timeout = None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    name = pending.pop(task)
+                    try:
+                        return task.result()
+                    except Exception as e:
+                        logger.error(f"LLM provider {name} failed: {str(e)}")
+                        last_error = e
+            raise last_error
+        finally:
+            # Unlike threads, losing async requests can be cancelled
+            for task in pending:
+                task.cancel()
+
+    def _failover_stream(self, attempt: Callable[[LLMService], Iterator[str]]) -> Iterator[str]:
+        # A stream cannot be hedged once tokens are out; fail over only before the first chunk
+        last_error = LLMUnavailableError("Every LLM provider's circuit is open")
+        for name in self.ranked():
+            started = time.monotonic()
+            emitted = False
+            try:
+                for chunk in attempt(self.providers[name]):
+                    emitted = True
+                    yield chunk
+            except Exception as e:
+                self.stats[name].record(time.monotonic() - started, ok=False)
+                if emitted:
+                    raise
+                logger.error(f"LLM provider {name} failed: {str(e)}")
+                last_error = e
+                continue
+            self.stats[name].record(time.monotonic() - started, ok=True)
+            return
+        raise last_error
+
+    def complete(self, prompt: str, max_tokens: int = 1000, timeout: float = None, system: str = None) -> str:
+        return self._hedged(lambda provider: provider.complete(prompt, max_tokens, timeout=timeout, system=system))
+
+    async def acomplete(self, prompt: str, max_tokens: int = 1000, timeout: float = None, system: str = None) -> str:
+        return await self._ahedged(lambda provider: provider.acomplete(prompt, max_tokens, timeout=timeout, system=system))
+
+    def stream(self, prompt: str, max_tokens: int = 1000, timeout: float = None, system: str = None) -> Iterator[str]:
+        return self._failover_stream(lambda provider: provider.stream(prompt, max_tokens, timeout=timeout, system=system))
+
+    # Each provider applies its own deadline, retries and breaker, so the router adds none of its own
+    def call(self, operation: str, prompt: str, max_tokens: int, system: str = None) -> str:
+        return self._hedged(lambda provider: provider.call(operation, prompt, max_tokens, system=system))
+
+    async def acall(self, operation: str, prompt: str, max_tokens: int, system: str = None) -> str:
+        return await self._ahedged(lambda provider: provider.acall(operation, prompt, max_tokens, system=system))
+
+    def open_stream(self, operation: str, prompt: str, max_tokens: int, system: str = None) -> Iterator[str]:
+        return self._failover_stream(lambda provider: provider.open_stream(operation, prompt, max_tokens, system=system))
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {name: stats.snapshot() for name, stats in self.stats.items()}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> LLMRouter:
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = LLMRouter(settings.LLM_ROUTER_PROVIDERS)
+    return _router
+
+
+def get_llm_service() -> LLMService:
+    """Return the service selected by the LLM_SERVICE setting"""
+    if settings.LLM_SERVICE == 'router':
+        return get_router()
+    return SERVICES[settings.LLM_SERVICE]()
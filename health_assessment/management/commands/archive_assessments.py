@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from health_assessment import archive
+from health_assessment.models import HealthAssessment
+
+
+class Command(BaseCommand):
+    help = (
+        "Move assessments with a treatment plan and no activity for --days into the compressed "
+        "archive, one batch per transaction. get_assessment keeps serving them from there. "
+        "Celery beat runs the same job daily (archive_assessments_task)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ARCHIVE_AFTER_DAYS, help="Idle days before archiving")
+        parser.add_argument('--batch-size', type=int, default=settings.ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None, help="Stop after this many batches")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the assessments that would move")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            count = HealthAssessment.objects.filter(
+                status='treatment_generated', updated_at__lt=archive.cutoff(options['days'])
+            ).count()
+            self.stdout.write(f"{count} assessments would be archived")
+            return
+
+        archived = archive.archive_finished(
+            options['days'], options['batch_size'], options['max_batches'],
+            on_batch=lambda count: self.stdout.write(f"Archived a batch of {count}")
+        )
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} assessments"))
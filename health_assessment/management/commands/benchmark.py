@@ -0,0 +1,212 @@
+import json
+import resource
+import statistics
+import subprocess
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from health_assessment import mock_llm
+from health_assessment.models import HealthAssessment
+
+CONCERNS = [
+    "Headache for 3 days",
+    "Persistent dry cough at night",
+    "Lower back pain after lifting",
+    "Itchy rash on both arms",
+    "Feeling tired all the time",
+]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def percentile(quantiles, pct):
+    return quantiles[pct - 1] if quantiles else 0.0
+
+
+class Recorder:
+    """Collects latency and query counts per endpoint across worker threads"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def call(self, endpoint, method, *args, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = method(*args, **kwargs)
+            elapsed = time.perf_counter() - started
+        with self._lock:
+            if response.status_code >= 400:
+                self.errors[endpoint] += 1
+            else:
+                self.samples[endpoint].append((elapsed, len(queries)))
+        return response
+
+    def summary(self, wall_time):
+        endpoints = {}
+        for endpoint in sorted(set(self.samples) | set(self.errors)):
+            latencies = [latency for latency, _ in self.samples[endpoint]]
+            queries = [count for _, count in self.samples[endpoint]]
+            quantiles = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+            endpoints[endpoint] = {
+                'count': len(latencies),
+                'errors': self.errors[endpoint],
+                'throughput': len(latencies) / wall_time if wall_time else 0.0,
+                'p50_ms': percentile(quantiles, 50) * 1000,
+                'p95_ms': percentile(quantiles, 95) * 1000,
+                'p99_ms': percentile(quantiles, 99) * 1000,
+                'mean_queries': statistics.mean(queries) if queries else 0.0,
+                'max_queries': max(queries) if queries else 0,
+            }
+        return endpoints
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive the full start -> answer x N -> treatment-plan flow against the mock LLM "
+        "and report throughput, p50/p95/p99 latency, DB queries and memory per endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--assessments', type=int, default=50, help="Number of complete flows to run")
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--answers', type=int, default=4, help="Answers submitted per assessment (min 3)")
+        parser.add_argument('--latency', type=float, default=0.2, help="Mock model latency in seconds")
+        parser.add_argument('--jitter', type=float, default=0.05, help="Uniform +/- jitter on the latency")
+        parser.add_argument('--failure-rate', type=float, default=0.0, help="Fraction of model calls that fail")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--question-cache', action='store_true', help="Leave the initial-question cache on")
+        parser.add_argument(
+            '--throttle', action='store_true',
+            help="Leave rate limiting and admission control on; every flow counts as the same client"
+        )
+        parser.add_argument('--label', default=None, help="Name for this run; defaults to the git commit")
+        parser.add_argument('--output', help="Write the JSON report to this file")
+        parser.add_argument('--compare', help="JSON report from an earlier run to diff against")
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark rows instead of deleting them")
+
+    def handle(self, *args, **options):
+        behaviour = mock_llm.install(options['latency'], options['jitter'], options['failure_rate'], options['seed'])
+        overrides = {} if options['question_cache'] else {'QUESTION_CACHE_BACKEND': ''}
+        if not options['throttle']:
+            overrides['THROTTLE_BACKEND'] = ''
+
+        recorder = Recorder()
+        tracemalloc.start()
+        began = time.perf_counter()
+        try:
+            with override_settings(**overrides):
+                self.run(recorder, options)
+        finally:
+            wall_time = time.perf_counter() - began
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            if not options['keep']:
+                HealthAssessment.objects.filter(session_id__startswith='bench-').delete()
+
+        report = {
+            'label': options['label'] or git_commit(),
+            'commit': git_commit(),
+            'config': {key: options[key] for key in ('assessments', 'concurrency', 'answers', 'latency', 'jitter', 'failure_rate', 'seed')},
+            'database': connection.vendor,
+            'wall_time_s': wall_time,
+            'flows_per_s': options['assessments'] / wall_time if wall_time else 0.0,
+            'model_calls': behaviour.calls,
+            'memory': {
+                'python_peak_mb': peak / 2 ** 20,
+                'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            },
+            'endpoints': recorder.summary(wall_time),
+        }
+
+        self.print_report(report)
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.print_comparison(json.load(f), report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+
+    def run(self, recorder, options):
+        queue = list(range(options['assessments']))
+        lock = threading.Lock()
+
+        def worker():
+            client = Client()
+            try:
+                while True:
+                    with lock:
+                        if not queue:
+                            return
+                        index = queue.pop()
+                    self.run_flow(client, recorder, CONCERNS[index % len(CONCERNS)], max(options['answers'], 3))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def run_flow(self, client, recorder, concern, answers):
+        response = recorder.call(
+            'start_assessment', client.post, '/api/assessment/start/',
+            {'initial_concern': concern, 'session_id': f"bench-{uuid.uuid4()}"},
+            content_type='application/json'
+        )
+        if response.status_code != 200:
+            return
+        assessment_id = response.json()['assessment_id']
+
+        for _ in range(answers):
+            response = recorder.call('get_next_question', client.get, f'/api/assessment/{assessment_id}/next-question/')
+            if response.status_code != 200:
+                break
+            recorder.call(
+                'submit_answer', client.post, '/api/answer/submit/',
+                {'question_id': response.json()['id'], 'answer_text': "It started on Monday and is getting worse"},
+                content_type='application/json'
+            )
+
+        recorder.call('generate_treatment_plan', client.post, f'/api/treatment-plan/{assessment_id}/')
+        recorder.call('get_assessment', client.get, f'/api/assessment/{assessment_id}/')
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{report['label']} on {report['database']}: {report['flows_per_s']:.2f} flows/s, "
+            f"{report['model_calls']} model calls, peak python memory {report['memory']['python_peak_mb']:.1f}MB, "
+            f"max RSS {report['memory']['max_rss_mb']:.1f}MB"
+        )
+        self.stdout.write(f"{'endpoint':<26}{'count':>7}{'err':>5}{'req/s':>8}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'queries':>9}")
+        for name, stats in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:<26}{stats['count']:>7}{stats['errors']:>5}{stats['throughput']:>8.1f}"
+                f"{stats['p50_ms']:>9.1f}{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['mean_queries']:>9.1f}"
+            )
+
+    def print_comparison(self, baseline, report):
+        self.stdout.write(f"\nvs {baseline['label']} ({baseline['commit']}):")
+        for name, stats in report['endpoints'].items():
+            before = baseline['endpoints'].get(name)
+            if not before:
+                continue
+            deltas = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'mean_queries'):
+                change = (stats[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+                deltas.append(f"{key} {change:+.0f}%")
+            self.stdout.write(f"  {name:<26}" + '  '.join(deltas))
@@ -0,0 +1,133 @@
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+
+from health_assessment import mock_llm
+from health_assessment.gemeni_service import GeminiService
+from health_assessment.models import HealthAssessment, Question
+
+
+def legacy_start(concern):
+    """The start flow as it was: model call inside the transaction, per-row inserts"""
+    question_ids = []
+    with transaction.atomic():
+        assessment = HealthAssessment.objects.create(
+            session_id=f"bench-{uuid.uuid4()}",
+            initial_concern=concern,
+            status='started'
+        )
+        questions = GeminiService().generate_initial_questions(concern)
+        for i, question_text in enumerate(questions, 1):
+            question = Question.objects.create(assessment=assessment, question_text=question_text, question_order=i)
+            question_ids.append(question.id)
+        assessment.status = 'in_progress'
+        assessment.save()
+    return question_ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure start_assessment (and optionally submit_answer) write throughput under "
+        "concurrent requests using the mock LLM. Compare database setups by running it "
+        "under different DATABASE_URL / SQLITE_JOURNAL_MODE values."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=200, help="Total starts across all threads")
+        parser.add_argument('--latency', type=float, default=0.2, help="Mock model latency in seconds")
+        parser.add_argument('--answers', action='store_true', help="Also answer every question of each started assessment")
+        parser.add_argument('--legacy', action='store_true', help="Benchmark the pre-bulk_create flow for comparison")
+        parser.add_argument('--batch-window', type=int, default=0, help="Micro-batch window in ms for initial questions")
+        parser.add_argument('--batch-mode', choices=['prompt', 'fanout'], default='prompt')
+        parser.add_argument('--keep', action='store_true', help="Keep the benchmark rows instead of deleting them")
+
+    def handle(self, *args, **options):
+        behaviour = mock_llm.install(latency=options['latency'])
+        # Every start should reach the (mock) model, so keep the question cache and the
+        # per-client rate limits (all threads share one address) out of it
+        with override_settings(
+            QUESTION_CACHE_BACKEND='',
+            THROTTLE_BACKEND='',
+            INITIAL_QUESTION_BATCH_WINDOW_MS=options['batch_window'],
+            INITIAL_QUESTION_BATCH_MODE=options['batch_mode'],
+        ):
+            result = self.run(options['concurrency'], options['requests'], options['legacy'], options['answers'])
+        mode = 'legacy' if options['legacy'] else 'current'
+        self.stdout.write(
+            f"{mode} on {connection.vendor} ({self.journal_mode()}): "
+            f"{result['ok']} ok / {result['failed']} failed in {result['elapsed']:.2f}s "
+            f"-> {result['throughput']:.1f} flows/s, "
+            f"p50 {result['p50'] * 1000:.0f}ms, p95 {result['p95'] * 1000:.0f}ms, "
+            f"{behaviour.calls} model calls"
+        )
+        if not options['keep']:
+            HealthAssessment.objects.filter(session_id__startswith='bench-').delete()
+
+    def journal_mode(self):
+        if connection.vendor != 'sqlite':
+            return 'n/a'
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            return cursor.fetchone()[0]
+
+    def run(self, concurrency, total, legacy, answers):
+        latencies, failures = [], []
+        lock = threading.Lock()
+        per_thread = [total // concurrency + (1 if i < total % concurrency else 0) for i in range(concurrency)]
+
+        def worker(count):
+            client = Client()
+            try:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    try:
+                        if legacy:
+                            question_ids = legacy_start("Headache for 3 days")
+                            ok = True
+                        else:
+                            response = client.post(
+                                '/api/assessment/start/',
+                                {'initial_concern': "Headache for 3 days", 'session_id': f"bench-{uuid.uuid4()}"},
+                                content_type='application/json'
+                            )
+                            ok = response.status_code == 200
+                            question_ids = [q['id'] for q in response.json().get('questions', [])]
+                        if ok and answers:
+                            # Answer all but the last question so no follow-up is generated
+                            for question_id in question_ids[:-1]:
+                                response = client.post(
+                                    '/api/answer/submit/',
+                                    {'question_id': question_id, 'answer_text': "Since Monday"},
+                                    content_type='application/json'
+                                )
+                                ok = ok and response.status_code == 200
+                    except Exception:
+                        ok = False
+                    with lock:
+                        (latencies if ok else failures).append(time.perf_counter() - started)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(count,)) for count in per_thread]
+        began = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - began
+
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else [0.0] * 99
+        return {
+            'ok': len(latencies),
+            'failed': len(failures),
+            'elapsed': elapsed,
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'p50': quantiles[49],
+            'p95': quantiles[94],
+        }
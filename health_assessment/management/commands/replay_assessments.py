@@ -0,0 +1,69 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+from health_assessment import replay
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay assessments from a JSONL file through the question and treatment plan services, "
+        "without HTTP or database writes. Each input line is "
+        '{"id": ..., "initial_concern": "...", "answers": ["...", ...]}. Results stream to --output '
+        "as JSON lines, which --resume reads back to skip finished cases."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="JSONL file of cases")
+        parser.add_argument('--output', required=True, help="JSONL file for the results")
+        parser.add_argument('--concurrency', type=int, default=8, help="Cases replayed at once")
+        parser.add_argument('--resume', action='store_true', help="Append to --output, skipping cases it has results for")
+        parser.add_argument('--question-cache', action='store_true', help="Leave the initial-question cache on")
+        parser.add_argument('--progress-every', type=int, default=500, help="Report progress every this many cases")
+
+    def handle(self, *args, **options):
+        done = replay.completed_lines(options['output']) if options['resume'] else set()
+        if done:
+            self.stdout.write(f"Resuming: {len(done)} cases already done")
+        # Replays measure the model, so fresh questions for every case unless asked otherwise
+        overrides = {} if options['question_cache'] else {'QUESTION_CACHE_BACKEND': ''}
+
+        started = time.perf_counter()
+        with override_settings(**overrides), open(options['output'], 'a' if options['resume'] else 'w') as out:
+            replayed, failed = self.run(replay.read_cases(options['input'], done), out, options)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Replayed {replayed} cases ({failed} failed) in {elapsed:.1f}s "
+            f"-> {replayed / elapsed if elapsed else 0:.1f} cases/s"
+        ))
+
+    def run(self, cases, out, options):
+        encoder = JSONEncoder()
+        replayed = failed = 0
+
+        def write(future):
+            nonlocal replayed, failed
+            record = future.result()
+            # Flushed per record: the file is the checkpoint
+            out.write(encoder.encode(record) + '\n')
+            out.flush()
+            replayed += 1
+            failed += bool(record['error'])
+            if replayed % options['progress_every'] == 0:
+                self.stdout.write(f"{replayed} cases replayed, {failed} failed")
+
+        # Keep a bounded number of cases in flight so the input is read as it is consumed
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            pending = set()
+            for line, text in cases:
+                if len(pending) >= options['concurrency'] * 2:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        write(future)
+                pending.add(pool.submit(replay.run_case, line, text))
+            for future in wait(pending).done:
+                write(future)
+        return replayed, failed
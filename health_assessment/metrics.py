@@ -0,0 +1,191 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are defined once below and updated where the work
+happens: model call attempts in resilience.py, token estimates and
+fallbacks in the services, cache lookups in hot_state.py,
+question_cache.py and plan_cache.py, rate limiting and admission in
+throttling.py, and per-request latency and query counts in
+middleware.RequestMetricsMiddleware. Values live in the process, so scrape
+every worker (as with the Prometheus client outside multiprocess mode).
+
+State other modules already keep (circuit breakers, batching, router
+stats) is read when ``/metrics`` is scraped and rendered as gauges (see
+views.prometheus_metrics).
+"""
+import bisect
+import threading
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 45)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterator[Tuple[str, Sequence[str], LabelValues, float]]:
+        raise NotImplementedError
+
+    def reset(self):
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for name, label_names, values, value in self.samples():
+            lines.append(f'{name}{_format_labels(label_names, values)} {_format_value(value)}')
+        return '\n'.join(lines)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, value in items:
+            yield self.name, self.labels, values, value
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Gauge(Counter):
+    """A value read at scrape time; built per scrape for state other modules keep"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._values.get(self._key(labels))
+            return sum(series[0]) if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        bucket_labels = self.labels + ('le',)
+        for values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                yield f'{self.name}_bucket', bucket_labels, values + (_format_value(float(bound)),), cumulative
+            yield f'{self.name}_sum', self.labels, values, total
+            yield f'{self.name}_count', self.labels, values, cumulative
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+LLM_LATENCY = Histogram(
+    'llm_request_duration_seconds', 'Model call attempts by provider, operation and outcome',
+    ['provider', 'operation', 'outcome']
+)
+LLM_TOKENS = Counter(
+    'llm_tokens_total', 'Estimated tokens sent to (prompt) and received from (completion) models',
+    ['provider', 'operation', 'direction']
+)
+LLM_FALLBACKS = Counter(
+    'llm_fallbacks_total', 'Responses served from fallback content instead of model output', ['operation']
+)
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by view (time to first byte for streams)',
+    ['view', 'method', 'status']
+)
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Database queries per request by view', ['view'], buckets=QUERY_BUCKETS
+)
+REQUEST_DB_TIME = Histogram(
+    'http_request_db_duration_seconds', 'Time spent in database queries per request by view', ['view']
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'Lookups in the application caches by result', ['cache', 'result']
+)
+THROTTLE_DECISIONS = Counter(
+    'throttle_decisions_total', 'Token bucket checks per client by scope and result', ['scope', 'result']
+)
+ADMISSION_WAIT = Histogram(
+    'model_admission_wait_seconds', 'Time spent queueing for a model-work slot by result', ['result']
+)
+
+REGISTRY: List[Metric] = [
+    LLM_LATENCY, LLM_TOKENS, LLM_FALLBACKS, REQUEST_LATENCY, REQUEST_QUERIES, REQUEST_DB_TIME, CACHE_REQUESTS,
+    THROTTLE_DECISIONS, ADMISSION_WAIT,
+]
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def render(extra: Iterable[Metric] = ()) -> str:
+    return '\n'.join(metric.render() for metric in [*REGISTRY, *extra]) + '\n'
+
+
+def reset():
+    for metric in REGISTRY:
+        metric.reset()
@@ -0,0 +1,78 @@
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+from . import metrics, tracing
+
+
+class QueryCounter:
+    """Database execute wrapper that counts queries and the time spent in them"""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.seconds += time.perf_counter() - started
+
+
+class RequestMetricsMiddleware:
+    """Record latency, database queries and database time per view, and open the request's root span.
+
+    Works in both handler modes, so under ASGI async views are awaited on
+    the event loop rather than run through a thread. Queries are counted on
+    this thread's connections, so they are recorded for requests served
+    sync (WSGI); under ASGI the ORM runs on other threads and only latency
+    is recorded. Streaming responses are measured up to the first byte.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with tracing.span('http.request', method=request.method, path=request.path) as span, ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(counter))
+            response = self.get_response(request)
+            view = self._finish_span(span, request, response)
+            span.set('db.queries', counter.queries)
+
+        self._observe_latency(started, view, request, response)
+        metrics.REQUEST_QUERIES.observe(counter.queries, view=view)
+        metrics.REQUEST_DB_TIME.observe(counter.seconds, view=view)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with tracing.span('http.request', method=request.method, path=request.path) as span:
+            response = await self.get_response(request)
+            view = self._finish_span(span, request, response)
+
+        self._observe_latency(started, view, request, response)
+        return response
+
+    def _finish_span(self, span, request, response) -> str:
+        view = request.resolver_match.url_name if request.resolver_match else 'unmatched'
+        span.set('view', view)
+        span.set('status_code', response.status_code)
+        return view
+
+    def _observe_latency(self, started, view, request, response):
+        metrics.REQUEST_LATENCY.observe(
+            time.perf_counter() - started, view=view, method=request.method, status=response.status_code
+        )
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_assessment', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreatmentPlanJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('progress', models.PositiveSmallIntegerField(default=0)),
+                ('stage', models.CharField(blank=True, max_length=50)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('assessment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='plan_jobs', to='health_assessment.healthassessment')),
+            ],
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_assessment', '0002_treatmentplanjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthassessment',
+            index=models.Index(fields=['status', 'created_at'], name='health_asse_status_f1e83b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['assessment', 'is_answered'], name='health_asse_assessm_3b22a6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='question',
+            index=models.Index(fields=['assessment', 'question_order'], name='health_asse_assessm_229ee8_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 00:52
+
+from django.db import migrations, models
+
+
+def build_transcripts(apps, schema_editor):
+    HealthAssessment = apps.get_model('health_assessment', 'HealthAssessment')
+    Answer = apps.get_model('health_assessment', 'Answer')
+    transcripts = {}
+    answers = Answer.objects.filter(question__is_answered=True).select_related('question').order_by(
+        'question__assessment_id', 'question__question_order'
+    )
+    for answer in answers.iterator():
+        question = answer.question
+        transcripts.setdefault(question.assessment_id, []).append({
+            'question_id': question.id,
+            'order': question.question_order,
+            'question': question.question_text,
+            'answer': answer.answer_text,
+        })
+    for assessment_id, entries in transcripts.items():
+        HealthAssessment.objects.filter(id=assessment_id).update(transcript=entries)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_assessment', '0003_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='healthassessment',
+            name='transcript',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(build_transcripts, migrations.RunPython.noop),
+    ]
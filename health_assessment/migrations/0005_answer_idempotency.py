@@ -0,0 +1,50 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def renumber_duplicate_orders(apps, schema_editor):
+    # Racing submissions could give two follow-ups the same slot; number them in creation order
+    Question = apps.get_model('health_assessment', 'Question')
+    duplicated = Question.objects.values('assessment_id', 'question_order').annotate(
+        rows=models.Count('id')
+    ).filter(rows__gt=1).values_list('assessment_id', flat=True).distinct()
+    for assessment_id in list(duplicated):
+        questions = Question.objects.filter(assessment_id=assessment_id).order_by('question_order', 'id')
+        for order, question in enumerate(questions, 1):
+            if question.question_order != order:
+                Question.objects.filter(id=question.id).update(question_order=order)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_assessment', '0004_assessment_transcript'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnswerSubmission',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('response', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(renumber_duplicate_orders, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='question',
+            name='health_asse_assessm_229ee8_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='question',
+            constraint=models.UniqueConstraint(fields=('assessment', 'question_order'), name='unique_question_order'),
+        ),
+        migrations.AddField(
+            model_name='answersubmission',
+            name='question',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submissions', to='health_assessment.question'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_assessment', '0005_answer_idempotency'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='healthassessment',
+            index=models.Index(fields=['created_at', 'id'], name='health_asse_created_6a0e67_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_assessment', '0006_assessment_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treatmentplan',
+            name='transcript_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('health_assessment', '0007_treatment_plan_transcript_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAssessment',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('session_id', models.CharField(db_index=True, max_length=100)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('document', models.BinaryField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='healthassessment',
+            index=models.Index(fields=['status', 'updated_at'], name='health_asse_status_7b5b9d_idx'),
+        ),
+    ]
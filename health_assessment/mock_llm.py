@@ -0,0 +1,130 @@
+"""Local stand-ins for the Gemini and Claude SDK clients.
+
+``install()`` swaps them into the provider registry so the whole service
+layer, including EKAMCPService, talks to them instead of the network.
+Latency and failures are injectable to reproduce slow or flaky providers.
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from . import providers
+
+QUESTIONS_REPLY = "How long have you had this?\nHow severe is it on a scale of 1-10?\nDoes anything make it better or worse?\nHave you taken anything for it?\nAny relevant medical history?"
+FOLLOWUP_REPLY = "Have you noticed any other symptoms alongside this?"
+PLAN_REPLY = json.dumps({
+    "diagnosis": "Likely a benign, self-limiting condition; consult a doctor if it persists.",
+    "recommendations": ["Rest", "Stay hydrated", "Keep a symptom diary"],
+    "medications": ["Over-the-counter pain relief as directed on the package"],
+    "lifestyle_changes": ["Regular sleep schedule", "Limit screen time"],
+    "followup_instructions": "See your physician if symptoms persist beyond a week."
+})
+
+
+class MockProviderError(Exception):
+    pass
+
+
+class MockBehaviour:
+    """Latency and failure profile shared by the mock clients"""
+
+    def __init__(self, latency=0.2, jitter=0.0, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_delay(self):
+        with self._lock:
+            self.calls += 1
+            failed = self._random.random() < self.failure_rate
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        return delay, failed
+
+    def reply(self, prompt):
+        delay, failed = self.next_delay()
+        time.sleep(delay)
+        if failed:
+            raise MockProviderError("Injected provider failure")
+        return self.text_for(prompt)
+
+    async def areply(self, prompt):
+        delay, failed = self.next_delay()
+        await asyncio.sleep(delay)
+        if failed:
+            raise MockProviderError("Injected provider failure")
+        return self.text_for(prompt)
+
+    @staticmethod
+    def text_for(prompt):
+        if 'treatment plan' in prompt:
+            return PLAN_REPLY
+        if 'ONE more' in prompt:
+            return FOLLOWUP_REPLY
+        concerns = re.findall(r'^\s*Concern (\d+):', prompt, re.MULTILINE)
+        if concerns:
+            return '\n'.join(f"### Concern {number}\n{QUESTIONS_REPLY}" for number in concerns)
+        return QUESTIONS_REPLY
+
+
+def _chunks(text, size=16):
+    return [SimpleNamespace(text=text[i:i + size]) for i in range(0, len(text), size)]
+
+
+class MockGenerativeModel:
+    """Mimics google.generativeai.GenerativeModel"""
+
+    def __init__(self, behaviour):
+        self.behaviour = behaviour
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        text = self.behaviour.reply(prompt)
+        return _chunks(text) if stream else SimpleNamespace(text=text)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return SimpleNamespace(text=await self.behaviour.areply(prompt))
+
+
+class _MockMessages:
+    def __init__(self, behaviour, is_async):
+        self.behaviour = behaviour
+        self.is_async = is_async
+
+    def create(self, messages, stream=False, system='', **kwargs):
+        prompt = f"{system}\n\n{messages[-1]['content']}"
+        if self.is_async:
+            return self._acreate(prompt)
+        text = self.behaviour.reply(prompt)
+        if stream:
+            return [SimpleNamespace(type='content_block_delta', delta=chunk) for chunk in _chunks(text)]
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+    async def _acreate(self, prompt):
+        text = await self.behaviour.areply(prompt)
+        return SimpleNamespace(content=[SimpleNamespace(text=text)])
+
+
+class MockAnthropic:
+    """Mimics anthropic.Anthropic / anthropic.AsyncAnthropic"""
+
+    def __init__(self, behaviour, is_async=False):
+        self.messages = _MockMessages(behaviour, is_async)
+
+
+def install(latency=0.2, jitter=0.0, failure_rate=0.0, seed=None) -> MockBehaviour:
+    """Route every provider in the registry to the mocks; returns their shared behaviour"""
+    behaviour = MockBehaviour(latency, jitter, failure_rate, seed)
+    providers.register('gemini', lambda: MockGenerativeModel(behaviour))
+    providers.register('gemini-pro', lambda: MockGenerativeModel(behaviour))
+    providers.register(
+        'anthropic',
+        lambda: MockAnthropic(behaviour),
+        lambda: MockAnthropic(behaviour, is_async=True)
+    )
+    return behaviour
@@ -6,6 +6,13 @@ from django.db import models
 from django.contrib.auth.models import User
 import uuid
 
+class HealthAssessmentQuerySet(models.QuerySet):
+    def with_details(self):
+        """Load questions, their answers and the treatment plan in a fixed number of queries"""
+        return self.select_related('treatment_plan').prefetch_related(
+            models.Prefetch('questions', queryset=Question.objects.select_related('answer'))
+        )
+
 class HealthAssessment(models.Model):
     STATUS_CHOICES = [
         ('started', 'Started'),
@@ -19,9 +26,22 @@ class HealthAssessment(models.Model):
     session_id = models.CharField(max_length=100, unique=True)
     initial_concern = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='started')
+    # Answered Q&A in question order, maintained by transcript.py
+    transcript = models.JSONField(default=list, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = HealthAssessmentQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            # Keyset pagination and date-range export over all statuses
+            models.Index(fields=['created_at', 'id']),
+            # Archival picks finished assessments by last activity (see archive.py)
+            models.Index(fields=['status', 'updated_at']),
+        ]
+    
     def __str__(self):
         return f"Assessment {self.id} - {self.status}"
 
@@ -34,6 +54,13 @@ class Question(models.Model):
     
     class Meta:
         ordering = ['question_order']
+        indexes = [
+            models.Index(fields=['assessment', 'is_answered']),
+        ]
+        constraints = [
+            # Concurrent follow-up generation cannot create two questions in the same slot
+            models.UniqueConstraint(fields=['assessment', 'question_order'], name='unique_question_order'),
+        ]
     
     def __str__(self):
         return f"Q{self.question_order}: {self.question_text[:50]}"
@@ -46,6 +73,17 @@ class Answer(models.Model):
     def __str__(self):
         return f"Answer to {self.question.id}: {self.answer_text[:50]}"
 
+class AnswerSubmission(models.Model):
+    """A submit_answer request made with an Idempotency-Key; retries with the same key replay its response"""
+    key = models.CharField(max_length=100, unique=True)
+    question = models.ForeignKey(Question, on_delete=models.CASCADE, related_name='submissions')
+    # Null while the first request is still being processed
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Submission {self.key} for question {self.question_id}"
+
 class TreatmentPlan(models.Model):
     assessment = models.OneToOneField(HealthAssessment, on_delete=models.CASCADE, related_name='treatment_plan')
     diagnosis = models.TextField()
@@ -53,7 +91,49 @@ class TreatmentPlan(models.Model):
     medications = models.JSONField(default=list)
     lifestyle_changes = models.JSONField(default=list)
     followup_instructions = models.TextField()
+    # sha256 of the normalized transcript the plan was generated from (see plan_cache.py); empty if not reusable
+    transcript_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"Treatment Plan for {self.assessment.id}"
+
+class TreatmentPlanJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    assessment = models.ForeignKey(HealthAssessment, on_delete=models.CASCADE, related_name='plan_jobs')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    progress = models.PositiveSmallIntegerField(default=0)
+    stage = models.CharField(max_length=50, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Plan job {self.id} - {self.status}"
+
+    def set_progress(self, progress, stage, status='running'):
+        self.progress = progress
+        self.stage = stage
+        self.status = status
+        self.save(update_fields=['progress', 'stage', 'status', 'updated_at'])
+
+class ArchivedAssessment(models.Model):
+    """A finished assessment moved out of the live tables by archive.py.
+
+    ``document`` is the zlib-compressed JSON get_assessment returned for it.
+    """
+    id = models.UUIDField(primary_key=True, editable=False)
+    session_id = models.CharField(max_length=100, db_index=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    document = models.BinaryField()
+
+    def __str__(self):
+        return f"Archived assessment {self.id}"
@@ -0,0 +1,100 @@
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from django.db import IntegrityError, transaction
+
+from . import plan_cache, tracing
+from .llm_router import get_llm_service
+from .models import HealthAssessment, TreatmentPlan
+from .plan_parser import PLAN_FIELDS
+from .services import EKAMCPService
+
+logger = logging.getLogger(__name__)
+
+MIN_ANSWERS_FOR_PLAN = 3
+MAX_QUESTIONS = 8
+
+
+def build_treatment_plan(
+    assessment: HealthAssessment,
+    on_progress: Optional[Callable[[int, str], None]] = None
+) -> Tuple[TreatmentPlan, bool]:
+    """Generate and persist the treatment plan for an assessment.
+
+    Shared by the synchronous view and the background task; ``on_progress``
+    is called with (percent, stage) as the work advances. Returns the plan
+    and whether it came from the plan cache instead of the model.
+    """
+    def report(progress, stage):
+        if on_progress:
+            on_progress(progress, stage)
+
+    digest = plan_cache.transcript_hash(assessment)
+    treatment_plan = reuse_treatment_plan(assessment, digest)
+    if treatment_plan is not None:
+        return treatment_plan, True
+
+    # Generate treatment plan using EKA MCP
+    report(10, 'generating')
+    eka_service = EKAMCPService(get_llm_service())
+    with tracing.span('plan.generate', assessment_id=str(assessment.id)):
+        treatment_data = eka_service.generate_treatment_plan(assessment)
+
+    report(80, 'saving')
+    with tracing.span('plan.save', assessment_id=str(assessment.id)):
+        return save_treatment_plan(assessment, treatment_data, reusable_hash(eka_service, digest)), False
+
+
+def reusable_hash(eka_service: EKAMCPService, digest: str) -> str:
+    """The hash to store with a freshly generated plan; plans padded with fallback content get none"""
+    return '' if eka_service.fallback_used else digest
+
+
+def reuse_treatment_plan(assessment: HealthAssessment, digest: str) -> Optional[TreatmentPlan]:
+    """The stored plan for this transcript, saved as the assessment's own plan; None if there is none"""
+    treatment_plan = plan_cache.find(assessment, digest)
+    if treatment_plan is None:
+        return None
+    if treatment_plan.assessment_id != assessment.id:
+        # Another assessment with the same transcript; copy its plan
+        treatment_data = {field: getattr(treatment_plan, field) for field in PLAN_FIELDS}
+        return save_treatment_plan(assessment, treatment_data, digest)
+    if assessment.status != 'treatment_generated':
+        assessment.status = 'treatment_generated'
+        assessment.save(update_fields=['status', 'updated_at'])
+    return treatment_plan
+
+
+def save_treatment_plan(
+    assessment: HealthAssessment,
+    treatment_data: Dict[str, Any],
+    transcript_hash: str = ''
+) -> TreatmentPlan:
+    """Persist generated plan data and mark the assessment as done.
+
+    Writes before it reads: update_or_create's read-then-write transaction
+    fails with "database is locked" on SQLite when plans are saved concurrently.
+    """
+    fields = {
+        'diagnosis': treatment_data['diagnosis'],
+        'recommendations': treatment_data['recommendations'],
+        'medications': treatment_data.get('medications', []),
+        'lifestyle_changes': treatment_data.get('lifestyle_changes', []),
+        'followup_instructions': treatment_data['followup_instructions'],
+        'transcript_hash': transcript_hash,
+    }
+    plans = TreatmentPlan.objects.filter(assessment=assessment)
+    if plans.update(**fields):
+        treatment_plan = plans.get()
+    else:
+        try:
+            with transaction.atomic():
+                treatment_plan = TreatmentPlan.objects.create(assessment=assessment, **fields)
+        except IntegrityError:
+            # Saved by a concurrent request in the meantime; ours is as fresh
+            plans.update(**fields)
+            treatment_plan = plans.get()
+
+    assessment.status = 'treatment_generated'
+    assessment.save(update_fields=['status', 'updated_at'])
+    return treatment_plan
@@ -0,0 +1,51 @@
+"""Content-addressed reuse of treatment plans.
+
+A plan is keyed on a hash of its normalized inputs: the initial concern,
+the Q&A transcript (case and whitespace folded) and the plan system
+prompt, so changing the prompt retires every earlier entry. A repeated
+plan request for an unchanged assessment returns its stored plan, and
+when TREATMENT_PLAN_CACHE_SHARED is on, an assessment with the same
+transcript as another reuses that plan without a model call.
+
+Plans completed with fallback content are saved without a hash and are
+never reused.
+"""
+import hashlib
+import json
+from typing import Optional
+
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+
+from . import metrics, transcript
+from .models import HealthAssessment, TreatmentPlan
+from .services import PLAN_SYSTEM_PROMPT
+
+
+def _normalize(text: str) -> str:
+    return ' '.join(text.casefold().split())
+
+
+def transcript_hash(assessment: HealthAssessment) -> str:
+    payload = {
+        'prompt': PLAN_SYSTEM_PROMPT,
+        'concern': _normalize(assessment.initial_concern),
+        'qa': [[_normalize(pair['question']), _normalize(pair['answer'])] for pair in transcript.qa_pairs(assessment)],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False).encode()).hexdigest()
+
+
+def find(assessment: HealthAssessment, digest: str) -> Optional[TreatmentPlan]:
+    """The plan stored for ``digest``, preferring the assessment's own; one query"""
+    plans = TreatmentPlan.objects.filter(transcript_hash=digest)
+    if not settings.TREATMENT_PLAN_CACHE_SHARED:
+        plans = plans.filter(assessment=assessment)
+    plan = plans.annotate(
+        own=Case(When(assessment_id=assessment.id, then=Value(0)), default=Value(1), output_field=IntegerField())
+    ).order_by('own', '-created_at').first()
+    if plan is None:
+        result = 'miss'
+    else:
+        result = 'hit' if plan.assessment_id == assessment.id else 'shared_hit'
+    metrics.CACHE_REQUESTS.inc(cache='treatment_plans', result=result)
+    return plan
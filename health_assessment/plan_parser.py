@@ -0,0 +1,143 @@
+"""Tolerant extraction of the treatment plan JSON from model output.
+
+Models wrap the plan in code fences or prose, or get cut off mid-object.
+``PlanExtractor`` is fed the reply (whole, or chunk by chunk while it
+streams). It scans each character once, finds the first JSON object and
+notes when that object closes. It also tracks the last point in the
+object itself (not in a nested list or object) where the text can be cut
+and its brackets closed to give valid JSON. A truncated reply therefore
+still yields every field that was complete, and a field whose value was
+cut off is left out, so it is reported missing rather than accepted
+half-written.
+
+``validate_plan`` coerces the result to the TreatmentPlan fields and
+reports which are missing, so the caller can ask the model for just those.
+"""
+import json
+import re
+from typing import Any, Dict, List, Tuple
+
+PLAN_FIELDS = {
+    'diagnosis': str,
+    'recommendations': list,
+    'medications': list,
+    'lifestyle_changes': list,
+    'followup_instructions': str,
+}
+
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+
+class PlanExtractor:
+    def __init__(self):
+        self.text = ''
+        self.done = False
+        self._pos = 0
+        self._start = -1
+        self._end = -1
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._cut = -1
+        self._cut_closers = ''
+
+    def _mark(self, index: int):
+        # Everything before ``index`` is complete fields; closing the object gives valid JSON.
+        # Cut points inside a nested value would pass off e.g. a cut-off list as a shorter complete one.
+        if len(self._stack) == 1:
+            self._cut = index
+            self._cut_closers = self._stack[0]
+
+    def feed(self, chunk: str) -> bool:
+        """Consume the next piece of output; returns True once the object has closed"""
+        if self.done:
+            return True
+        self.text += chunk
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._start < 0:
+                if ch == '{':
+                    self._start = i
+                    self._stack.append('}')
+                    self._mark(i + 1)
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch == '{' or ch == '[':
+                self._stack.append('}' if ch == '{' else ']')
+                self._mark(i + 1)
+            elif ch == '}' or ch == ']':
+                if self._stack:
+                    self._stack.pop()
+                self._mark(i + 1)
+                if not self._stack:
+                    self.done = True
+                    self._end = i + 1
+                    self._pos = i + 1
+                    return True
+            elif ch == ',':
+                self._mark(i)
+        self._pos = len(text)
+        return False
+
+    def value(self) -> Dict[str, Any]:
+        """The object parsed so far, repaired if the output was cut off; {} if none"""
+        if self._start < 0:
+            return {}
+        candidates = []
+        if self.done:
+            whole = self.text[self._start:self._end]
+            candidates += [whole, TRAILING_COMMA.sub(r'\1', whole)]
+        else:
+            candidates.append(self.text[self._start:self._cut] + self._cut_closers)
+        for candidate in candidates:
+            try:
+                # strict=False accepts raw newlines inside strings, which models often emit
+                data = json.loads(candidate, strict=False)
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                return data
+        return {}
+
+
+def extract(text: str) -> Dict[str, Any]:
+    extractor = PlanExtractor()
+    extractor.feed(text or '')
+    return extractor.value()
+
+
+def _coerce(kind: type, value: Any):
+    if kind is str:
+        if isinstance(value, list):
+            value = ' '.join(str(item) for item in value if item)
+        elif isinstance(value, (int, float)):
+            value = str(value)
+        return value.strip() if isinstance(value, str) else ''
+    if isinstance(value, str):
+        value = [value] if value.strip() else []
+    if not isinstance(value, list):
+        return None
+    return [str(item).strip() for item in value if isinstance(item, (str, int, float)) and str(item).strip()]
+
+
+def validate_plan(data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Keep the TreatmentPlan fields with usable values; return them and the missing field names"""
+    plan = {}
+    for field, kind in PLAN_FIELDS.items():
+        if field not in data:
+            continue
+        value = _coerce(kind, data[field])
+        # An empty list is a valid answer (e.g. no medications); an empty diagnosis is not
+        if value or (kind is list and value is not None):
+            plan[field] = value
+    return plan, [field for field in PLAN_FIELDS if field not in plan]
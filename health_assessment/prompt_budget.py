@@ -0,0 +1,67 @@
+"""Token budgeting for the conversation part of prompts.
+
+Tokens are estimated locally, without a provider tokenizer: each word is
+about one token per four characters, and each punctuation mark is one
+token. That is close enough to budget on.
+
+``render_qa`` keeps the most recent answers verbatim within three quarters
+of the budget. Older answers are condensed to their first few words while
+budget remains, and any beyond that are only counted, so a long
+assessment costs a bounded number of input tokens per call.
+"""
+import re
+from typing import Dict, List
+
+TOKEN_PIECE = re.compile(r"\w+|[^\w\s]")
+SUMMARY_WORDS = 12
+
+
+def count_tokens(text: str) -> int:
+    return sum(max(1, -(-len(piece) // 4)) for piece in TOKEN_PIECE.findall(text))
+
+
+def _condense(answer: str) -> str:
+    words = answer.split()
+    if len(words) <= SUMMARY_WORDS:
+        return ' '.join(words)
+    return ' '.join(words[:SUMMARY_WORDS]) + '...'
+
+
+def render_qa(pairs: List[Dict[str, str]], budget: int) -> str:
+    """Render Q&A pairs, oldest first, in at most about ``budget`` tokens.
+
+    The latest pair is always kept verbatim.
+    """
+    recent = []
+    used = 0
+    index = len(pairs)
+    while index > 0:
+        pair = pairs[index - 1]
+        block = f"Q: {pair['question']}\nA: {pair['answer']}\n\n"
+        cost = count_tokens(block)
+        if recent and used + cost > budget * 3 // 4:
+            break
+        recent.append(block)
+        used += cost
+        index -= 1
+    recent.reverse()
+
+    older = pairs[:index]
+    if not older:
+        return ''.join(recent)
+
+    condensed = []
+    for pair in reversed(older):
+        line = f"- {pair['question']} {_condense(pair['answer'])}\n"
+        cost = count_tokens(line)
+        if used + cost > budget:
+            break
+        condensed.append(line)
+        used += cost
+    condensed.reverse()
+
+    omitted = len(older) - len(condensed)
+    header = "Earlier answers (condensed):\n"
+    if omitted:
+        header += f"- ({omitted} earlier answers omitted)\n"
+    return header + ''.join(condensed) + "\n" + ''.join(recent)
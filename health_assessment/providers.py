@@ -0,0 +1,130 @@
+"""Process-wide registry of LLM SDK clients.
+
+Clients are built once on first use and shared by every request, so the
+SDK configuration, gRPC channels and HTTP keep-alive pools are reused
+instead of being rebuilt (with a fresh TLS handshake) per call. Sync
+clients are shared across threads; async clients are cached per event
+loop because their connection pools are bound to the loop that made them.
+
+The SDKs themselves are imported by the factories, not by this module.
+Each takes hundreds of milliseconds and tens of megabytes to import, so
+migrate, the admin and workers that only ever use one provider don't
+pay for the others.
+"""
+import asyncio
+import threading
+import weakref
+from typing import TYPE_CHECKING, Any, Callable, Dict
+
+from django.conf import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+_lock = threading.Lock()
+_factories: Dict[str, Callable[[], Any]] = {}
+_async_factories: Dict[str, Callable[[], Any]] = {}
+_clients: Dict[str, Any] = {}
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+
+
+def register(name: str, factory: Callable[[], Any], async_factory: Callable[[], Any] = None):
+    """Register (or replace) the factories used to build a provider's clients"""
+    with _lock:
+        _factories[name] = factory
+        _clients.pop(name, None)
+        if async_factory is not None:
+            _async_factories[name] = async_factory
+        for clients in _async_clients.values():
+            clients.pop(name, None)
+
+
+def get(name: str) -> Any:
+    """Return the shared sync client for ``name``, building it on first use"""
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _factories[name]()
+                _clients[name] = client
+    return client
+
+
+def get_async(name: str) -> Any:
+    """Return the async client for ``name`` bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        clients = _async_clients.setdefault(loop, {})
+        client = clients.get(name)
+        if client is None:
+            client = _async_factories[name]()
+            clients[name] = client
+    return client
+
+
+def reset():
+    """Drop every built client so the next call rebuilds it"""
+    with _lock:
+        _clients.clear()
+        _async_clients.clear()
+
+
+def _http_limits() -> "httpx.Limits":
+    import httpx
+
+    return httpx.Limits(
+        max_connections=settings.LLM_HTTP_POOL_SIZE,
+        max_keepalive_connections=settings.LLM_HTTP_POOL_SIZE,
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_SECONDS,
+    )
+
+
+_genai_configured = False
+
+
+def genai():
+    """The google.generativeai module, configured with the API key on first use"""
+    global _genai_configured
+    import google.generativeai as sdk
+
+    # genai.configure swaps the module-global client; call it exactly once
+    if not _genai_configured:
+        sdk.configure(api_key=settings.GEMINI_API_KEY)
+        _genai_configured = True
+    return sdk
+
+
+def _gemini_model(model_name: str) -> Callable[[], Any]:
+    def factory():
+        return genai().GenerativeModel(model_name)
+    return factory
+
+
+def _anthropic_client():
+    import anthropic
+    import httpx
+
+    return anthropic.Anthropic(
+        api_key=settings.ANTHROPIC_API_KEY,
+        http_client=httpx.Client(limits=_http_limits()),
+        # resilience.py owns retries; the SDK's own would run past the call deadline
+        max_retries=0,
+    )
+
+
+def _anthropic_async_client():
+    import anthropic
+    import httpx
+
+    return anthropic.AsyncAnthropic(
+        api_key=settings.ANTHROPIC_API_KEY,
+        http_client=httpx.AsyncClient(limits=_http_limits()),
+        # resilience.py owns retries; the SDK's own would run past the call deadline
+        max_retries=0,
+    )
+
+
+register('gemini', _gemini_model('gemini-2.0-flash'))
+register('gemini-pro', _gemini_model('gemini-1.5-pro'))
+register('anthropic', _anthropic_client, _anthropic_async_client)
@@ -0,0 +1,206 @@
+"""Cache of generated initial questions keyed on the normalized concern.
+
+Concerns are normalized (case, punctuation, filler words) before lookup, so
+"Headache for 3 days" and "I have a headache since 3 days" share an entry.
+Fuzzy matching is opt-in: when QUESTION_CACHE_SIMILARITY is below 1.0, a miss
+on the exact key falls back to the most similar cached concern by
+character-trigram Jaccard score. Trigrams can't tell clinically different
+concerns apart ("2 year old" vs "12 year old", left vs right side), so the
+default only shares questions between identical normalized concerns.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, FrozenSet, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+STOPWORDS = frozenset("""
+    a an and am are as at be been but by do for from had has have having i i'm im
+    in is it it's its me my of on or since so that the this to was with ive i've
+""".split())
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def normalize_concern(concern: str) -> str:
+    words = _WORD_RE.findall(concern.lower())
+    return ' '.join(w for w in words if w not in STOPWORDS)
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class InMemoryBackend:
+    """Process-local TTL + LRU store"""
+
+    def __init__(self, max_entries: int, ttl: int, **kwargs):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: List[str]):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def keys(self) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [key for key, (expires_at, _) in self._data.items() if expires_at >= now]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend:
+    """Store entries in a Django cache alias (locmem, Redis, memcached...).
+
+    Eviction is left to the cache itself; a capped key index kept alongside
+    the entries makes similarity lookups possible across processes.
+    """
+    index_key = 'question-cache:index'
+
+    def __init__(self, max_entries: int, ttl: int, alias: str = 'default', **kwargs):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.cache = caches[alias]
+
+    def get(self, key: str) -> Optional[List[str]]:
+        return self.cache.get(f'question-cache:{key}')
+
+    def set(self, key: str, value: List[str]):
+        self.cache.set(f'question-cache:{key}', value, self.ttl)
+        index = [k for k in self.cache.get(self.index_key, []) if k != key]
+        index.append(key)
+        self.cache.set(self.index_key, index[-self.max_entries:], self.ttl)
+
+    def keys(self) -> List[str]:
+        return self.cache.get(self.index_key, [])
+
+    def clear(self):
+        self.cache.delete_many([f'question-cache:{k}' for k in self.keys()] + [self.index_key])
+
+
+# Result label in metrics.CACHE_REQUESTS for each counter
+RESULTS = {'hits': 'hit', 'similar_hits': 'similar_hit', 'misses': 'miss'}
+
+BACKENDS = {
+    'memory': InMemoryBackend,
+    'django': DjangoCacheBackend,
+}
+
+
+class QuestionCache:
+    def __init__(self, backend, similarity_threshold: float = 1.0):
+        self.backend = backend
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, concern: str) -> Optional[List[str]]:
+        normalized = normalize_concern(concern)
+        value = self.backend.get(f'{namespace}:{normalized}')
+        if value is not None:
+            self._count('hits')
+            return value
+
+        if self.similarity_threshold < 1.0:
+            key = self._most_similar_key(namespace, normalized)
+            value = self.backend.get(key) if key else None
+            if value is not None:
+                self._count('similar_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, namespace: str, concern: str, questions: List[str]):
+        self.backend.set(f'{namespace}:{normalize_concern(concern)}', list(questions))
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.similar_hits + self.misses
+            return {
+                'hits': self.hits,
+                'similar_hits': self.similar_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits + self.similar_hits) / lookups if lookups else 0.0,
+            }
+
+    def _most_similar_key(self, namespace: str, normalized: str) -> Optional[str]:
+        prefix = f'{namespace}:'
+        target = trigrams(normalized)
+        best_key, best_score = None, self.similarity_threshold
+        for key in self.backend.keys():
+            if not key.startswith(prefix):
+                continue
+            score = similarity(target, trigrams(key[len(prefix):]))
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _count(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+        metrics.CACHE_REQUESTS.inc(cache='questions', result=RESULTS[counter])
+
+
+_cache: Optional[QuestionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_question_cache() -> Optional[QuestionCache]:
+    """Return the process-wide cache, or None when QUESTION_CACHE_BACKEND is empty"""
+    global _cache
+    if not settings.QUESTION_CACHE_BACKEND:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                backend_name = settings.QUESTION_CACHE_BACKEND
+                backend_class = BACKENDS.get(backend_name) or import_string(backend_name)
+                backend = backend_class(
+                    max_entries=settings.QUESTION_CACHE_MAX_ENTRIES,
+                    ttl=settings.QUESTION_CACHE_TTL,
+                    alias=settings.QUESTION_CACHE_ALIAS,
+                )
+                _cache = QuestionCache(backend, settings.QUESTION_CACHE_SIMILARITY)
+    return _cache
+
+
+def reset():
+    global _cache
+    with _cache_lock:
+        _cache = None
@@ -0,0 +1,142 @@
+"""Offline replay of assessments through the question and plan services.
+
+Each case is a JSON object with an ``initial_concern`` and the scripted
+``answers`` to give, in order, plus an optional ``id``. A case runs the
+flow the API runs, calling the same services: initial questions, a
+follow-up after each round of answers while answers remain (up to
+MAX_QUESTIONS), and a treatment plan once MIN_ANSWERS_FOR_PLAN are given.
+The assessment is never saved: it lives on an unsaved HealthAssessment
+whose transcript is filled in memory, so replays leave the database
+untouched.
+
+Results are JSON lines, one per case, keyed by the case's input line. The
+output doubles as the checkpoint for resuming (see completed_lines).
+"""
+import json
+import time
+from typing import Any, Dict, Iterator, Set, Tuple
+
+from django.utils import timezone
+
+from .llm import FALLBACK_FOLLOWUP_QUESTION, FALLBACK_QUESTIONS
+from .llm_router import get_llm_service
+from .models import HealthAssessment
+from .pipeline import MAX_QUESTIONS, MIN_ANSWERS_FOR_PLAN
+from .serializers import StartAssessmentSerializer
+from .services import EKAMCPService
+
+
+class InvalidCase(ValueError):
+    """An input line that is not a valid case"""
+
+
+def parse_case(text: str) -> Dict[str, Any]:
+    try:
+        case = json.loads(text)
+    except ValueError as e:
+        raise InvalidCase(f"invalid JSON: {e}")
+    if not isinstance(case, dict):
+        raise InvalidCase("expected a JSON object")
+    serializer = StartAssessmentSerializer(data={'initial_concern': case.get('initial_concern')})
+    if not serializer.is_valid():
+        raise InvalidCase(f"initial_concern: {' '.join(serializer.errors['initial_concern'])}")
+    answers = case.get('answers', [])
+    if not isinstance(answers, list) or not all(isinstance(answer, str) for answer in answers):
+        raise InvalidCase("answers must be a list of strings")
+    return case
+
+
+def run_case(line: int, text: str) -> Dict[str, Any]:
+    """Replay one input line; failures are reported in the record rather than raised"""
+    started = time.perf_counter()
+    record = {'line': line, 'id': None}
+    try:
+        case = parse_case(text)
+        record['id'] = case.get('id')
+        record.update(replay(case['initial_concern'], case.get('answers', [])))
+        record['error'] = None
+    except Exception as e:
+        record['error'] = str(e) or type(e).__name__
+    record['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def replay(initial_concern: str, answers: list) -> Dict[str, Any]:
+    llm_service = get_llm_service()
+    assessment = HealthAssessment(initial_concern=initial_concern, created_at=timezone.now())
+    fallbacks = []
+
+    questions = list(llm_service.generate_initial_questions(initial_concern))
+    if questions == FALLBACK_QUESTIONS:
+        fallbacks.append('initial_questions')
+
+    for order, answer_text in enumerate(answers, 1):
+        if order > len(questions):
+            break
+        assessment.transcript.append({
+            'question_id': order,
+            'order': order,
+            'question': questions[order - 1],
+            'answer': answer_text,
+        })
+        # Like submit_answer, ask a follow-up once every question is answered, but only if an answer is left for it
+        all_answered = order == len(questions)
+        if all_answered and len(questions) < MAX_QUESTIONS and order < len(answers):
+            question_text = llm_service.generate_followup_question(assessment)
+            if question_text == FALLBACK_FOLLOWUP_QUESTION:
+                fallbacks.append('followup_question')
+            questions.append(question_text)
+
+    treatment_plan = None
+    if len(assessment.transcript) >= MIN_ANSWERS_FOR_PLAN:
+        eka_service = EKAMCPService(llm_service)
+        treatment_plan = eka_service.generate_treatment_plan(assessment)
+        if eka_service.fallback_used:
+            fallbacks.append('treatment_plan')
+
+    answered = [entry['answer'] for entry in assessment.transcript]
+    return {
+        'initial_concern': initial_concern,
+        'questions': [
+            {'question': question, 'answer': answered[i] if i < len(answered) else None}
+            for i, question in enumerate(questions)
+        ],
+        'treatment_plan': treatment_plan,
+        'fallbacks': fallbacks,
+    }
+
+
+def read_cases(path: str, skip: Set[int] = frozenset()) -> Iterator[Tuple[int, str]]:
+    """(line number, text) for each non-blank input line not in ``skip``, read lazily"""
+    with open(path, encoding='utf-8') as f:
+        for line, text in enumerate(f, 1):
+            if text.strip() and line not in skip:
+                yield line, text
+
+
+def completed_lines(path: str) -> Set[int]:
+    """Input lines the output already holds a successful result for.
+
+    A record cut off by a crash is truncated away, so appending resumes on
+    a clean line. Failed cases are not counted and run again; their newer
+    record supersedes the failed one.
+    """
+    done = set()
+    end = 0
+    try:
+        f = open(path, 'rb+')
+    except FileNotFoundError:
+        return done
+    with f:
+        for raw in f:
+            if not raw.endswith(b'\n'):
+                break
+            end += len(raw)
+            try:
+                record = json.loads(raw)
+            except ValueError:
+                continue
+            if not record.get('error'):
+                done.add(record['line'])
+        f.truncate(end)
+    return done
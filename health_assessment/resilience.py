@@ -0,0 +1,216 @@
+"""Deadlines, retries and circuit breaking for model calls.
+
+Every provider call runs under a per-operation deadline (LLM_DEADLINES),
+is retried with full-jitter exponential backoff while the deadline allows,
+and reports to a circuit breaker per provider. After
+LLM_BREAKER_FAILURES consecutive failures the breaker opens and calls fail
+immediately with LLMUnavailableError, so callers go straight to their
+fallback content. After LLM_BREAKER_RESET_SECONDS one trial call is let
+through; its outcome closes or re-opens the breaker.
+
+Each attempt is timed into metrics.LLM_LATENCY and, when tracing is on,
+recorded as an ``llm.call`` span.
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional
+
+from django.conf import settings
+
+from . import metrics, tracing
+
+logger = logging.getLogger(__name__)
+
+
+class LLMUnavailableError(Exception):
+    """A model call was short-circuited, timed out or exhausted its retries"""
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.short_circuits = 0
+        self.times_opened = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= settings.LLM_BREAKER_RESET_SECONDS:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.short_circuits += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            self.state = self.CLOSED
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= settings.LLM_BREAKER_FAILURES:
+                if self.state != self.OPEN:
+                    logger.error(f"Circuit for {self.name} opened after {self.consecutive_failures} failures")
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self.opened_at < settings.LLM_BREAKER_RESET_SECONDS
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'successes': self.successes,
+                'failures': self.failures,
+                'short_circuits': self.short_circuits,
+                'times_opened': self.times_opened,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def reset():
+    with _breakers_lock:
+        _breakers.clear()
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: spreads retries from many workers instead of synchronising them
+    return random.uniform(0, min(settings.LLM_RETRY_BACKOFF_MAX, settings.LLM_RETRY_BACKOFF * 2 ** attempt))
+
+
+def _retry_delay(breaker: CircuitBreaker, attempt: int, deadline: float) -> Optional[float]:
+    """How long to back off before the next attempt, or None when there won't be one"""
+    if attempt >= settings.LLM_RETRIES or breaker.is_open():
+        return None
+    return min(_backoff(attempt), max(deadline - time.monotonic(), 0))
+
+
+def _observe(breaker_name: str, operation: str, started: float, outcome: str):
+    metrics.LLM_LATENCY.observe(
+        time.perf_counter() - started, provider=breaker_name, operation=operation, outcome=outcome
+    )
+
+
+def call(breaker_name: str, operation: str, fn: Callable[[float], Any]) -> Any:
+    """Run ``fn(timeout)`` under the operation's deadline, retries and breaker"""
+    breaker = get_breaker(breaker_name)
+    deadline = time.monotonic() + settings.LLM_DEADLINES[operation]
+    last_error = None
+    for attempt in range(settings.LLM_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not breaker.allow():
+            raise LLMUnavailableError(f"Circuit for {breaker_name} is open")
+        started = time.perf_counter()
+        try:
+            with tracing.span('llm.call', provider=breaker_name, operation=operation, attempt=attempt + 1):
+                result = fn(remaining)
+        except Exception as e:
+            _observe(breaker_name, operation, started, 'error')
+            breaker.record_failure()
+            last_error = e
+            logger.error(f"{breaker_name} {operation} attempt {attempt + 1} failed: {str(e)}")
+            delay = _retry_delay(breaker, attempt, deadline)
+            if delay is None:
+                break
+            time.sleep(delay)
+            continue
+        _observe(breaker_name, operation, started, 'success')
+        breaker.record_success()
+        return result
+    raise LLMUnavailableError(f"{breaker_name} {operation} failed: {last_error or 'deadline exceeded'}") from last_error
+
+
+async def acall(breaker_name: str, operation: str, fn: Callable[[float], Awaitable[Any]]) -> Any:
+    """Async variant of call; the deadline is enforced with wait_for"""
+    breaker = get_breaker(breaker_name)
+    deadline = time.monotonic() + settings.LLM_DEADLINES[operation]
+    last_error = None
+    for attempt in range(settings.LLM_RETRIES + 1):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        if not breaker.allow():
+            raise LLMUnavailableError(f"Circuit for {breaker_name} is open")
+        started = time.perf_counter()
+        try:
+            with tracing.span('llm.call', provider=breaker_name, operation=operation, attempt=attempt + 1):
+                result = await asyncio.wait_for(fn(remaining), timeout=remaining)
+        except Exception as e:
+            _observe(breaker_name, operation, started, 'error')
+            breaker.record_failure()
+            last_error = e
+            logger.error(f"{breaker_name} {operation} attempt {attempt + 1} failed: {str(e) or type(e).__name__}")
+            delay = _retry_delay(breaker, attempt, deadline)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+            continue
+        _observe(breaker_name, operation, started, 'success')
+        breaker.record_success()
+        return result
+    raise LLMUnavailableError(f"{breaker_name} {operation} failed: {last_error or 'deadline exceeded'}") from last_error
+
+
+def stream(breaker_name: str, operation: str, fn: Callable[[float], Iterator[str]]) -> Iterator[str]:
+    """Guard ``fn(timeout)``'s chunks with the breaker; partial output cannot be retried"""
+    breaker = get_breaker(breaker_name)
+    if not breaker.allow():
+        raise LLMUnavailableError(f"Circuit for {breaker_name} is open")
+    # Timed to the last chunk; not a span, as a generator cannot hold the caller's span context
+    started = time.perf_counter()
+    try:
+        yield from fn(settings.LLM_DEADLINES[operation])
+    except GeneratorExit:
+        # The client went away; that says nothing about the provider
+        _observe(breaker_name, operation, started, 'cancelled')
+        breaker.record_success()
+        raise
+    except Exception:
+        _observe(breaker_name, operation, started, 'error')
+        breaker.record_failure()
+        raise
+    _observe(breaker_name, operation, started, 'success')
+    breaker.record_success()
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import HealthAssessment, Question, Answer, TreatmentPlan
+from .models import HealthAssessment, Question, Answer, TreatmentPlan, TreatmentPlanJob
 
 class AnswerSerializer(serializers.ModelSerializer):
     class Meta:
@@ -26,6 +26,30 @@ class HealthAssessmentSerializer(serializers.ModelSerializer):
         model = HealthAssessment
         fields = ['id', 'session_id', 'initial_concern', 'status', 'questions', 'treatment_plan', 'created_at', 'updated_at']
 
+class AssessmentSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HealthAssessment
+        fields = ['id', 'session_id', 'initial_concern', 'status', 'created_at', 'updated_at']
+
+class AssessmentFilterSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=HealthAssessment.STATUS_CHOICES, required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+class TreatmentPlanJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.UUIDField(source='id', read_only=True)
+    assessment_id = serializers.UUIDField(source='assessment.id', read_only=True)
+    treatment_plan = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = TreatmentPlanJob
+        fields = ['job_id', 'assessment_id', 'status', 'progress', 'stage', 'error', 'treatment_plan', 'created_at', 'updated_at']
+    
+    def get_treatment_plan(self, obj):
+        if obj.status != 'succeeded':
+            return None
+        return TreatmentPlanSerializer(obj.assessment.treatment_plan).data
+
 class StartAssessmentSerializer(serializers.Serializer):
     initial_concern = serializers.CharField(max_length=2000)
     session_id = serializers.CharField(max_length=100, required=False)
@@ -1,124 +1,84 @@
-import anthropic
 import requests
 import json
 import logging
 from django.conf import settings
-from typing import List, Dict, Any
-from .models import HealthAssessment, Question, Answer
+from typing import Dict, Any, Generator, Iterator, List
+from .models import HealthAssessment
+from . import metrics, prompt_budget, providers, transcript
+from .plan_parser import PLAN_FIELDS, PlanExtractor, extract, validate_plan
+from .resilience import LLMUnavailableError
 from .gemeni_service import GeminiService
+from .llm import LLMService
 
 logger = logging.getLogger(__name__)
 
-class ClaudeService:
+# Standing treatment plan instructions, sent as the system prompt where the provider has one.
+# A schema rather than a filled-in example keeps it short and stops the model copying the example.
+PLAN_SYSTEM_PROMPT = """You are a medical AI assistant generating a treatment plan from a health assessment.
+The plan must include:
+1. Diagnosis based on the provided information
+2. Specific recommendations for the patient
+3. Any necessary medications or treatments
+4. Lifestyle changes or home remedies
+5. Follow-up instructions
+The plan should be clear, actionable, and suitable for a non-medical person to understand.
+
+Return only a JSON object with exactly these keys:
+{"diagnosis": string, "recommendations": [string], "medications": [string], "lifestyle_changes": [string], "followup_instructions": string}"""
+
+class ClaudeService(LLMService):
+    provider_name = 'Claude'
+    model = "claude-3-sonnet-20240229"
+
     def __init__(self):
-        self.client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
-    
-    def generate_initial_questions(self, concern: str) -> List[str]:
-        """Generate initial questions based on the patient's concern"""
-        prompt = f"""
-        You are a medical AI assistant helping to conduct a health assessment. 
-        A patient has expressed the following concern: "{concern}"
-        
-        Generate 5 relevant, specific medical questions to better understand their condition.
-        The questions should be:
-        1. Clear and easy to understand
-        2. Medically relevant
-        3. Help narrow down potential causes
-        4. Appropriate for a non-medical person to answer
-        
-        Return only the questions, one per line, without numbering.
-        """
-        try:
-            response = self.client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            questions = [q.strip() for q in response.content[0].text.strip().split('\n') if q.strip()]
-            return questions[:5]  # Ensure we get exactly 5 questions
-            
-        except Exception as e:
-            logger.error(f"Error generating questions with Claude: {str(e)}")
-            # Fallback generic questions
-            return [
-                "How long have you been experiencing this concern?",
-                "On a scale of 1-10, how would you rate the severity?",
-                "Does anything make it better or worse?",
-                "Have you taken any medications for this?",
-                "Do you have any family history of similar conditions?"
-            ]
-    
-    def generate_followup_question(self, assessment: HealthAssessment) -> str:
-        """Generate a follow-up question based on previous answers"""
-        conversation_context = self._build_conversation_context(assessment)
-        
-        prompt = f"""
-        You are conducting a medical assessment. Based on the following conversation:
-        
-        {conversation_context}
-        
-        Generate ONE more specific follow-up question that would help better understand 
-        the patient's condition. The question should:
-        1. Build on previous answers
-        2. Help clarify any ambiguities
-        3. Gather additional relevant information
-        4. Be clear and specific
-        
-        Return only the question, nothing else.
-        """
-        
-        try:
-            response = self.client.messages.create(
-                model="claude-3-sonnet-20240229",
-                max_tokens=300,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            return response.content[0].text.strip()
-            
-        except Exception as e:
-            logger.error(f"Error generating follow-up question: {str(e)}")
-            return "Is there anything else about your symptoms that you think might be important?"
-
-    def _build_conversation_context(self, assessment: HealthAssessment) -> str:
-        """Build conversation context for Claude"""
-        context = f"Initial concern: {assessment.initial_concern}\n\n"
-        
-        questions = assessment.questions.filter(is_answered=True).order_by('question_order')
-        for question in questions:
-            context += f"Q: {question.question_text}\n"
-            if hasattr(question, 'answer'):
-                context += f"A: {question.answer.answer_text}\n\n"
-        
-        return context
+        self.client = providers.get('anthropic')
+
+    def _message_args(self, prompt: str, max_tokens: int, system: str = None) -> Dict[str, Any]:
+        args = {
+            'model': self.model,
+            'max_tokens': max_tokens,
+            'messages': [{"role": "user", "content": prompt}],
+        }
+        if system:
+            args['system'] = system
+        return args
+
+    def complete(self, prompt: str, max_tokens: int = 1000, timeout: float = None, system: str = None) -> str:
+        response = self.client.messages.create(**self._message_args(prompt, max_tokens, system), timeout=timeout)
+        return response.content[0].text
+
+    async def acomplete(self, prompt: str, max_tokens: int = 1000, timeout: float = None, system: str = None) -> str:
+        response = await providers.get_async('anthropic').messages.create(
+            **self._message_args(prompt, max_tokens, system),
+            timeout=timeout
+        )
+        return response.content[0].text
+
+    def stream(self, prompt: str, max_tokens: int = 1000, timeout: float = None, system: str = None):
+        events = self.client.messages.create(
+            **self._message_args(prompt, max_tokens, system),
+            stream=True,
+            timeout=timeout
+        )
+        for event in events:
+            if event.type == 'content_block_delta':
+                yield event.delta.text
 
 # eka mpc 
 class EKAMCPService: 
-    def __init__(self):
+    max_tokens = 2000
+    missing_fields_max_tokens = 800
+
+    def __init__(self, llm_service: LLMService = None):
         self.base_url = settings.EKA_MCP_URL
+        self.llm_service = llm_service or GeminiService()
+        # Set once any part of the returned plan is fallback content rather than model output
+        self.fallback_used = False
     
     def generate_treatment_plan(self, assessment: HealthAssessment) -> Dict[str, Any]:
         """Generate treatment plan using EKA MCP server"""
-        # Prepare assessment data for EKA MCP
-        assessment_data = {
-            "initial_concern": assessment.initial_concern,
-            "questions_and_answers": [],
-            "patient_info": {
-                "assessment_id": str(assessment.id),
-                "timestamp": assessment.created_at.isoformat()
-            }
-        }
-        
-        # Add all Q&A pairs
-        questions = assessment.questions.filter(is_answered=True).order_by('question_order')
-        for question in questions:
-            if hasattr(question, 'answer'):
-                assessment_data["questions_and_answers"].append({
-                    "question": question.question_text,
-                    "answer": question.answer.answer_text
-                })
-        
+        prompt = self._build_prompt(self._collect_assessment_data(assessment))
+        extractor = PlanExtractor()
         try:
             # response = requests.post(
             #     self.base_url,
@@ -126,68 +86,136 @@ class EKAMCPService:
             #     headers={'Content-Type': 'application/json'},
             #     timeout=30
             # )
-            gemeni_service = GeminiService()
-            prompt = f"""
-            You are a medical AI assistant helping to generate a treatment plan based on the following health assessment data:
-            Initial concern: {assessment.initial_concern}
-            Questions and answers:
-            """
-            for qa in assessment_data["questions_and_answers"]:
-                prompt += f"Q: {qa['question']}\nA: {qa['answer']}\n"
-            prompt += """
-            Generate a comprehensive treatment plan that includes:
-            1. Diagnosis based on the provided information
-            2. Specific recommendations for the patient
-            3. Any necessary medications or treatments
-            4. Lifestyle changes or home remedies
-            5. Follow-up instructions
-            The plan should be clear, actionable, and suitable for a non-medical person to understand.
-
-            Return the treatment plan in JSON format with the following structure:
-            Do not use the below content, just the structure:          
-            {
-            "diagnosis": "Based on your symptoms, this appears to be a condition that may require medical evaluation. Please consult with a healthcare provider for proper diagnosis.",
-            "recommendations": [
-                "Schedule an appointment with your primary care physician",
-                "Monitor symptoms daily and keep a symptom diary",
-                "Maintain adequate hydration (8-10 glasses of water daily)",
-                "Get sufficient rest (7-9 hours of sleep per night)",
-                "Consider stress reduction techniques like meditation or yoga"
-            ],
-            "medications": [
-                "Do not start any new medications without consulting your doctor",
-                "Over-the-counter pain relievers may be used as needed following package instructions"
-            ],
-            "lifestyle_changes": [
-                "Regular moderate exercise (30 minutes, 3-4 times per week)",
-                "Balanced diet rich in fruits and vegetables",
-                "Avoid known triggers that worsen symptoms",
-                "Practice good hygiene and self-care"
-            ],
-            "followup_instructions": "Schedule a follow-up appointment in 1-2 weeks if symptoms persist or worsen. Seek immediate medical attention if you experience severe symptoms or if your condition deteriorates."
-             }
-            """
-            response = gemeni_service.model.generate_content(prompt)
-            if not response or not response.text:
-                logger.error("EKA MCP returned empty response")
-                return self._fallback_treatment_plan()
-            response_content = response.text
-
-            if response_content:
-                raw_json = response_content.strip('` \n')
-                if raw_json.startswith('json'):
-                    raw_json = raw_json[4:].strip()
-                data = json.loads(raw_json)
-                if data:
-                    return data
-            else:
-                logger.error(f"EKA MCP returned status {response.status_code}: {response.text}")
-                return self._fallback_treatment_plan()
-                
-        except requests.RequestException as e:
+            extractor.feed(self.llm_service.call('treatment_plan', prompt, self.max_tokens, system=PLAN_SYSTEM_PROMPT))
+
+        except (requests.RequestException, LLMUnavailableError) as e:
             logger.error(f"Error calling EKA MCP service: {str(e)}")
+            metrics.LLM_FALLBACKS.inc(operation='treatment_plan')
+            self.fallback_used = True
             return self._fallback_treatment_plan()
-    
+
+        return self.complete_treatment_plan(assessment, extractor)
+
+    async def agenerate_treatment_plan(self, assessment: HealthAssessment) -> Dict[str, Any]:
+        """Async variant of generate_treatment_plan"""
+        prompt = self._build_prompt(self._collect_assessment_data(assessment))
+        extractor = PlanExtractor()
+        try:
+            extractor.feed(await self.llm_service.acall('treatment_plan', prompt, self.max_tokens, system=PLAN_SYSTEM_PROMPT))
+
+        except (requests.RequestException, LLMUnavailableError) as e:
+            logger.error(f"Error calling EKA MCP service: {str(e)}")
+            metrics.LLM_FALLBACKS.inc(operation='treatment_plan')
+            self.fallback_used = True
+            return self._fallback_treatment_plan()
+
+        return await self.acomplete_treatment_plan(assessment, extractor)
+
+    def stream_treatment_plan(self, assessment: HealthAssessment) -> Iterator[str]:
+        """Stream the raw treatment plan JSON as it is generated; raises on failure"""
+        prompt = self._build_prompt(self._collect_assessment_data(assessment))
+        return self.llm_service.open_stream('treatment_plan', prompt, self.max_tokens, system=PLAN_SYSTEM_PROMPT)
+
+    def complete_treatment_plan(self, assessment: HealthAssessment, extractor: PlanExtractor) -> Dict[str, Any]:
+        """Validate what the model produced; ask only for fields it left out or cut off"""
+        steps = self._completion_steps(assessment, extractor)
+        try:
+            prompt = next(steps)
+            try:
+                text = self.llm_service.call('treatment_plan', prompt, self.missing_fields_max_tokens)
+            except Exception as e:
+                steps.throw(e)
+            else:
+                steps.send(text)
+        except StopIteration as done:
+            return done.value
+
+    async def acomplete_treatment_plan(self, assessment: HealthAssessment, extractor: PlanExtractor) -> Dict[str, Any]:
+        """Async variant of complete_treatment_plan"""
+        steps = self._completion_steps(assessment, extractor)
+        try:
+            prompt = next(steps)
+            try:
+                text = await self.llm_service.acall('treatment_plan', prompt, self.missing_fields_max_tokens)
+            except Exception as e:
+                steps.throw(e)
+            else:
+                steps.send(text)
+        except StopIteration as done:
+            return done.value
+
+    def _completion_steps(
+        self,
+        assessment: HealthAssessment,
+        extractor: PlanExtractor
+    ) -> Generator[str, str, Dict[str, Any]]:
+        """The validation and merge shared by the sync and async paths, which only make the model call.
+
+        Yields the prompt for any missing fields and is sent the reply (or
+        thrown the call's error); returns the finished plan.
+        """
+        plan, missing = validate_plan(extractor.value())
+        if missing:
+            try:
+                text = yield self._missing_fields_prompt(self._collect_assessment_data(assessment), plan, missing)
+                plan.update(self._requested_fields(text, missing))
+            except Exception as e:
+                logger.error(f"Error requesting missing treatment plan fields {missing}: {str(e)}")
+        return self._with_fallback_fields(plan)
+
+    def _requested_fields(self, text: str, missing: List[str]) -> Dict[str, Any]:
+        extra, _ = validate_plan(extract(text))
+        return {field: value for field, value in extra.items() if field in missing}
+
+    def _with_fallback_fields(self, plan: Dict[str, Any]) -> Dict[str, Any]:
+        if not plan:
+            logger.error("EKA MCP returned no usable treatment plan")
+            metrics.LLM_FALLBACKS.inc(operation='treatment_plan')
+            self.fallback_used = True
+            return self._fallback_treatment_plan()
+        if len(plan) < len(PLAN_FIELDS):
+            metrics.LLM_FALLBACKS.inc(operation='treatment_plan_fields')
+            self.fallback_used = True
+        fallback = self._fallback_treatment_plan()
+        return {field: plan.get(field, fallback[field]) for field in PLAN_FIELDS}
+
+    def _collect_assessment_data(self, assessment: HealthAssessment) -> Dict[str, Any]:
+        """Prepare assessment data for EKA MCP"""
+        assessment_data = {
+            "initial_concern": assessment.initial_concern,
+            "questions_and_answers": transcript.qa_pairs(assessment),
+            "patient_info": {
+                "assessment_id": str(assessment.id),
+                "timestamp": assessment.created_at.isoformat()
+            }
+        }
+        return assessment_data
+
+    def _assessment_section(self, assessment_data: Dict[str, Any]) -> str:
+        qa = prompt_budget.render_qa(
+            assessment_data["questions_and_answers"], settings.PROMPT_TRANSCRIPT_BUDGETS['treatment_plan']
+        )
+        return (
+            "Health assessment data:\n"
+            f"Initial concern: {assessment_data['initial_concern']}\n"
+            f"Questions and answers:\n{qa}"
+        )
+
+    def _build_prompt(self, assessment_data: Dict[str, Any]) -> str:
+        # The instructions and output schema travel separately as PLAN_SYSTEM_PROMPT
+        return self._assessment_section(assessment_data)
+
+    def _missing_fields_prompt(self, assessment_data: Dict[str, Any], plan: Dict[str, Any], missing: List[str]) -> str:
+        fields = ', '.join(f'"{field}" ({"a list of strings" if PLAN_FIELDS[field] is list else "a string"})' for field in missing)
+        return (
+            "You are a medical AI assistant completing a treatment plan for this patient.\n"
+            f"{self._assessment_section(assessment_data)}\n"
+            f"The treatment plan so far:\n{json.dumps(plan)}\n\n"
+            f"Provide only these missing fields: {fields}. They should be clear, actionable, "
+            "and suitable for a non-medical person to understand.\n"
+            "Return a single JSON object with exactly those keys and nothing else."
+        )
+
     def _fallback_treatment_plan(self) -> Dict[str, Any]:
         """Fallback treatment plan if EKA MCP is unavailable"""
         return {
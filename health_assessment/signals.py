@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import hot_state, transcript
+from .models import Answer, HealthAssessment, Question
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """Tune SQLite connections for concurrent web traffic"""
+    if connection.vendor != 'sqlite' or not settings.SQLITE_JOURNAL_MODE:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}')
+        # Safe with WAL: only the last transactions can be lost on power failure, never corrupted
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+
+
+@receiver(post_save, sender=Answer)
+def record_answer_in_transcript(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transcript.record_answer(instance)
+
+
+def _cascaded_from_assessment(origin) -> bool:
+    """Whether a delete started at an assessment, which takes its transcript and state with it"""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model is HealthAssessment
+
+
+@receiver(post_delete, sender=Answer)
+def remove_answer_from_transcript(sender, instance, origin=None, **kwargs):
+    # Cascades (archival, cleanup) would otherwise rewrite the transcript once per answer
+    if not _cascaded_from_assessment(origin):
+        transcript.remove_answer(instance)
+
+
+
+def _invalidate_after_commit(assessment_id):
+    # After commit, so a concurrent reader cannot cache the state from before this write
+    transaction.on_commit(lambda: hot_state.invalidate(assessment_id))
+
+
+@receiver(post_save, sender=HealthAssessment)
+@receiver(post_delete, sender=HealthAssessment)
+def invalidate_assessment_state(sender, instance, **kwargs):
+    _invalidate_after_commit(instance.id)
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_state_for_question(sender, instance, origin=None, **kwargs):
+    if not _cascaded_from_assessment(origin):
+        _invalidate_after_commit(instance.assessment_id)
+
+
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def invalidate_state_for_answer(sender, instance, origin=None, **kwargs):
+    if not _cascaded_from_assessment(origin):
+        _invalidate_after_commit(instance.question.assessment_id)
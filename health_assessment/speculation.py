@@ -0,0 +1,100 @@
+"""Speculative pre-generation of the next follow-up question.
+
+When SPECULATIVE_FOLLOWUP is on, the follow-up is generated in the
+background as soon as the second-to-last open question is answered, from
+the answers known at that point. The request that answers the last
+question then picks the result up instead of waiting on a fresh LLM call.
+
+A speculation is only handed out if none of the answers it was built from
+have changed since; editing one restarts it. Speculations live in the
+process that started them, so with several workers a request served
+elsewhere simply generates the question as before.
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional
+
+from django.conf import settings
+
+from .llm import LLMService
+from .models import HealthAssessment
+
+# Bound on pending speculations kept for assessments that are never finished
+MAX_PENDING = 1000
+
+_executor = None
+_lock = threading.Lock()
+_pending: "OrderedDict[str, Speculation]" = OrderedDict()
+
+
+class Speculation:
+    def __init__(self, future: Future, answers: Dict[int, str]):
+        self.future = future
+        self.answers = answers
+
+    def is_valid_for(self, answers: Dict[int, str]) -> bool:
+        return all(answers.get(question_id) == text for question_id, text in self.answers.items())
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.SPECULATIVE_FOLLOWUP_WORKERS,
+                thread_name_prefix='speculative-followup'
+            )
+    return _executor
+
+
+def _answer_snapshot(assessment: HealthAssessment) -> Dict[int, str]:
+    return {entry['question_id']: entry['answer'] for entry in assessment.transcript}
+
+
+def maybe_start(service: LLMService, assessment: HealthAssessment, answered: int, total: int):
+    """Start (or restart) speculation when exactly one question is left open"""
+    if not settings.SPECULATIVE_FOLLOWUP or answered != total - 1:
+        return
+
+    answers = _answer_snapshot(assessment)
+    key = str(assessment.id)
+    with _lock:
+        current = _pending.get(key)
+        if current is not None and current.answers == answers:
+            return
+
+    # Build the prompt here so the background thread never touches the DB
+    prompt = service.build_followup_prompt(assessment)
+    future = _get_executor().submit(service.generate_followup_from_prompt, prompt)
+
+    with _lock:
+        previous = _pending.pop(key, None)
+        if previous is not None:
+            previous.future.cancel()
+        _pending[key] = Speculation(future, answers)
+        while len(_pending) > MAX_PENDING:
+            _, stale = _pending.popitem(last=False)
+            stale.future.cancel()
+
+
+def take(assessment: HealthAssessment) -> Optional[str]:
+    """Return the speculated follow-up if it is still valid, else None.
+
+    Waits for an in-flight speculation rather than starting a second call.
+    """
+    with _lock:
+        speculation = _pending.pop(str(assessment.id), None)
+    if speculation is None or speculation.future.cancelled():
+        return None
+    if not speculation.is_valid_for(_answer_snapshot(assessment)):
+        speculation.future.cancel()
+        return None
+    return speculation.future.result()
+
+
+def reset():
+    with _lock:
+        for speculation in _pending.values():
+            speculation.future.cancel()
+        _pending.clear()
@@ -0,0 +1,38 @@
+import logging
+
+from celery import shared_task
+
+from . import archive
+from .models import TreatmentPlanJob
+from .pipeline import build_treatment_plan
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_treatment_plan_task(job_id: str):
+    """Generate the treatment plan for a queued TreatmentPlanJob"""
+    job = TreatmentPlanJob.objects.select_related('assessment').get(id=job_id)
+    if job.status == 'succeeded':
+        return str(job.id)
+
+    job.set_progress(5, 'started')
+    try:
+        build_treatment_plan(job.assessment, on_progress=job.set_progress)
+    except Exception as e:
+        logger.error(f"Error generating treatment plan for job {job.id}: {str(e)}")
+        job.error = str(e)
+        job.status = 'failed'
+        job.save(update_fields=['error', 'status', 'updated_at'])
+        return str(job.id)
+
+    job.set_progress(100, 'done', status='succeeded')
+    return str(job.id)
+
+
+@shared_task
+def archive_assessments_task():
+    """Move finished assessments idle for ARCHIVE_AFTER_DAYS to the archive; scheduled by CELERY_BEAT_SCHEDULE"""
+    archived = archive.archive_finished()
+    logger.info(f"Archived {archived} assessments")
+    return archived
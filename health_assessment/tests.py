@@ -1,3 +1,1444 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+import httpx
+
+from health_project.celery import app as celery_app
+from . import (
+    archive, async_views, batching, export, hot_state, metrics, mock_llm, prompt_budget, providers, question_cache, replay,
+    resilience, speculation, throttling, views,
+)
+from .gemeni_service import GeminiService
+from .llm import FALLBACK_QUESTIONS, LLMService
+from .llm_router import LLMRouter, SERVICES
+from .plan_parser import PlanExtractor, extract, validate_plan
+from .services import PLAN_SYSTEM_PROMPT, ClaudeService, EKAMCPService
+from .models import ArchivedAssessment, HealthAssessment, Question, Answer, AnswerSubmission, TreatmentPlan, TreatmentPlanJob
+from .serializers import QuestionSerializer
+
+PLAN_JSON = json.dumps({
+    "diagnosis": "Tension headache",
+    "recommendations": ["Rest"],
+    "medications": [],
+    "lifestyle_changes": ["Sleep more"],
+    "followup_instructions": "See a doctor if it persists."
+})
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Stands in for genai.GenerativeModel; answers by prompt type"""
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        if 'treatment plan' in prompt:
+            text = PLAN_JSON
+        elif 'ONE more' in prompt:
+            text = "Does the pain move?"
+        else:
+            text = "Where does it hurt?\nHow long has it lasted?"
+        if stream:
+            return [FakeResponse(text[i:i + 8]) for i in range(0, len(text), 8)]
+        return FakeResponse(text)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return self.generate_content(prompt, **kwargs)
+
+
+def fake_gemini_init(service):
+    service.model = FakeGeminiModel()
+
+
+def make_assessment(answered=3):
+    assessment = HealthAssessment.objects.create(
+        session_id=f"session-{HealthAssessment.objects.count()}",
+        initial_concern="Headache for 3 days",
+        status='in_progress'
+    )
+    for order in range(1, answered + 1):
+        question = Question.objects.create(
+            assessment=assessment,
+            question_text=f"Question {order}?",
+            question_order=order,
+            is_answered=True
+        )
+        Answer.objects.create(question=question, answer_text=f"Answer {order}")
+    assessment.refresh_from_db()
+    return assessment
+
+
+def read_events(response):
+    return parse_events(b''.join(response.streaming_content))
+
+
+async def aread_events(response):
+    return parse_events(b''.join([chunk async for chunk in response.streaming_content]))
+
+
+def parse_events(body):
+    body = body.decode()
+    events = []
+    for block in body.strip().split('\n\n'):
+        event, data = block.split('\n')
+        events.append((event[len('event: '):], json.loads(data[len('data: '):])))
+    return events
+
+
+# Every test client shares one address; ThrottlingTests turn the limits back on
+_throttling_off = override_settings(THROTTLE_BACKEND='')
+
+
+def setUpModule():
+    _throttling_off.enable()
+
+
+def tearDownModule():
+    _throttling_off.disable()
+
+
+@mock.patch.object(GeminiService, '__init__', fake_gemini_init)
+class TreatmentPlanJobTests(TestCase):
+    def setUp(self):
+        # Run tasks in-process; the conf is namespaced by config_from_object
+        celery_app.conf.CELERY_TASK_ALWAYS_EAGER = True
+        self.addCleanup(setattr, celery_app.conf, 'CELERY_TASK_ALWAYS_EAGER', False)
+
+    def test_enqueue_returns_202_and_job_completes(self):
+        assessment = make_assessment()
+
+        response = self.client.post(reverse('health_assessment:enqueue_treatment_plan', args=[assessment.id]))
+
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+        status_response = self.client.get(reverse('health_assessment:treatment_plan_job', args=[job_id]))
+        body = status_response.json()
+        self.assertEqual(body['status'], 'succeeded')
+        self.assertEqual(body['progress'], 100)
+        self.assertEqual(body['treatment_plan']['diagnosis'], "Tension headache")
+        assessment.refresh_from_db()
+        self.assertEqual(assessment.status, 'treatment_generated')
+
+    def test_enqueue_requires_minimum_answers(self):
+        assessment = make_assessment(answered=2)
+
+        response = self.client.post(reverse('health_assessment:enqueue_treatment_plan', args=[assessment.id]))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(TreatmentPlanJob.objects.exists())
+
+
+class PlanCacheTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+        patcher = mock.patch.object(GeminiService, '__init__', fake_gemini_init)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(
+            FakeGeminiModel, 'generate_content', autospec=True, side_effect=FakeGeminiModel.generate_content
+        )
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def plan(self, assessment):
+        return self.client.post(reverse('health_assessment:generate_treatment_plan', args=[assessment.id])).json()
+
+    def test_repeat_request_returns_stored_plan(self):
+        assessment = make_assessment()
+
+        first = self.plan(assessment)
+        second = self.plan(assessment)
+
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['treatment_plan']['created_at'], first['treatment_plan']['created_at'])
+        self.assertEqual(self.generate.call_count, 1)
+        self.assertEqual(metrics.CACHE_REQUESTS.value(cache='treatment_plans', result='hit'), 1)
+
+    def test_identical_transcript_reuses_plan_across_assessments(self):
+        self.plan(make_assessment())
+        other = make_assessment()
+        answer = Answer.objects.get(question__assessment=other, question__question_order=1)
+        answer.answer_text = "  answer 1 "
+        answer.save()
+
+        body = self.plan(other)
+
+        self.assertTrue(body['cached'])
+        self.assertEqual(body['treatment_plan']['diagnosis'], "Tension headache")
+        self.assertEqual(self.generate.call_count, 1)
+        self.assertEqual(TreatmentPlan.objects.count(), 2)
+        other.refresh_from_db()
+        self.assertEqual(other.status, 'treatment_generated')
+
+    def test_changed_answer_misses(self):
+        assessment = make_assessment()
+        self.plan(assessment)
+        answer = Answer.objects.get(question__assessment=assessment, question__question_order=1)
+        answer.answer_text = "No"
+        answer.save()
+
+        self.assertFalse(self.plan(assessment)['cached'])
+        self.assertEqual(self.generate.call_count, 2)
+
+    @override_settings(TREATMENT_PLAN_CACHE_SHARED=False)
+    def test_shared_reuse_can_be_disabled(self):
+        self.plan(make_assessment())
+
+        self.assertFalse(self.plan(make_assessment())['cached'])
+        self.assertEqual(self.generate.call_count, 2)
+
+    def test_fallback_plan_is_not_reused(self):
+        assessment = make_assessment()
+        generate_content = self.generate.side_effect
+        self.generate.side_effect = RuntimeError("down")
+        with override_settings(LLM_RETRIES=0):
+            self.plan(assessment)
+        self.assertEqual(TreatmentPlan.objects.get(assessment=assessment).transcript_hash, '')
+
+        self.generate.side_effect = generate_content
+        body = self.plan(assessment)
+
+        self.assertFalse(body['cached'])
+        self.assertEqual(body['treatment_plan']['diagnosis'], "Tension headache")
+
+
+class GetAssessmentQueryCountTests(TestCase):
+    def assert_query_count(self, answered):
+        assessment = make_assessment(answered=answered)
+        Question.objects.create(assessment=assessment, question_text="Unanswered?", question_order=answered + 1)
+        TreatmentPlan.objects.create(assessment=assessment, diagnosis="d", followup_instructions="f")
+        url = reverse('health_assessment:get_assessment', args=[assessment.id])
+
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        questions = response.json()['questions']
+        self.assertEqual(len(questions), answered + 1)
+        self.assertEqual(questions[0]['answer']['answer_text'], "Answer 1")
+        self.assertIsNone(questions[-1]['answer'])
+        self.assertEqual(response.json()['treatment_plan']['diagnosis'], "d")
+
+    def test_two_questions(self):
+        self.assert_query_count(answered=1)
+
+    def test_eight_questions(self):
+        self.assert_query_count(answered=7)
+
+
+class AssessmentListExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('clinician', is_staff=True)
+        self.client.force_login(self.staff)
+        self.assessments = [make_assessment(answered=2) for _ in range(5)]
+        self.assessments[0].status = 'treatment_generated'
+        self.assessments[0].save(update_fields=['status'])
+        TreatmentPlan.objects.create(
+            assessment=self.assessments[0], diagnosis="Migraine", recommendations=["Rest"], followup_instructions="f"
+        )
+
+    def test_cursor_pages_cover_every_assessment_once(self):
+        url = reverse('health_assessment:list_assessments') + '?limit=2'
+        seen = []
+        while url:
+            body = self.client.get(url).json()
+            seen += [row['id'] for row in body['results']]
+            url = body['next']
+
+        expected = HealthAssessment.objects.order_by('-created_at', '-id').values_list('id', flat=True)
+        self.assertEqual(seen, [str(assessment_id) for assessment_id in expected])
+
+    def test_list_filters_by_status(self):
+        response = self.client.get(reverse('health_assessment:list_assessments'), {'status': 'treatment_generated'})
+
+        self.assertEqual([row['id'] for row in response.json()['results']], [str(self.assessments[0].id)])
+        self.assertEqual(
+            self.client.get(reverse('health_assessment:list_assessments'), {'status': 'nope'}).status_code, 400
+        )
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_export_prefetches_per_chunk(self):
+        url = reverse('health_assessment:export_assessments')
+
+        # The session and staff user, one cursor over the assessments, then a prefetch of questions
+        # and answers per chunk of two
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+            lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(len(lines), 5)
+        row = json.loads(lines[0])
+        self.assertEqual(row['treatment_plan']['diagnosis'], "Migraine")
+        self.assertEqual(row['questions'][1]['answer']['answer_text'], "Answer 2")
+
+    def test_csv_export_has_a_row_per_question(self):
+        response = self.client.get(reverse('health_assessment:export_assessments'), {'format': 'csv'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+
+        self.assertEqual(rows[0][:3], ['assessment_id', 'session_id', 'status'])
+        self.assertEqual(len(rows), 1 + 5 * 2)
+        self.assertEqual(self.client.get(reverse('health_assessment:export_assessments'), {'format': 'xml'}).status_code, 400)
+
+    async def test_export_streams_chunk_by_chunk_under_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.staff)
+        produced = []
+
+        def counted(queryset):
+            for line in export.ndjson(queryset):
+                produced.append(line)
+                yield line
+
+        with self.settings(EXPORT_CHUNK_SIZE=2), mock.patch.dict(
+            views.EXPORT_FORMATS, {'ndjson': (counted, 'application/x-ndjson')}
+        ):
+            response = await self.async_client.get(reverse('health_assessment:export_assessments'))
+
+            # A sync iterator would be read to the end before the first byte went out
+            first = await anext(response.streaming_content)
+            self.assertEqual(len(produced), 2)
+            rest = b''.join([chunk async for chunk in response.streaming_content])
+
+        self.assertEqual(len((first + rest).decode().splitlines()), 5)
+
+    def test_listing_and_export_are_staff_only(self):
+        urls = [reverse('health_assessment:list_assessments'), reverse('health_assessment:export_assessments')]
+        self.client.logout()
+        for url in urls:
+            self.assertIn(self.client.get(url).status_code, (401, 403))
+
+        self.client.force_login(User.objects.create_user('patient'))
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 403)
+
+    @override_settings(THROTTLE_BACKEND='memory', THROTTLE_RATES={'requests': (5, 60), 'exports': (0.01, 1)})
+    def test_exports_are_throttled(self):
+        throttling.reset()
+        self.addCleanup(throttling.reset)
+        url = reverse('health_assessment:export_assessments')
+
+        self.assertEqual(self.client.get(url).status_code, 200)
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    def test_admin_search_is_exact(self):
+        model_admin = admin.site._registry[HealthAssessment]
+        assessment = self.assessments[1]
+
+        def search(term):
+            queryset, _ = model_admin.get_search_results(None, HealthAssessment.objects.all(), term)
+            return list(queryset)
+
+        self.assertEqual(search(str(assessment.id)), [assessment])
+        self.assertEqual(search(assessment.session_id), [assessment])
+        self.assertEqual(search("Headache"), [])
+
+
+class ArchiveTests(TestCase):
+    def make_finished(self, days_idle):
+        assessment = make_assessment()
+        TreatmentPlan.objects.create(
+            assessment=assessment, diagnosis="Tension headache", followup_instructions="Rest."
+        )
+        HealthAssessment.objects.filter(id=assessment.id).update(
+            status='treatment_generated', updated_at=timezone.now() - timedelta(days=days_idle)
+        )
+        return assessment
+
+    def get(self, assessment):
+        return self.client.get(reverse('health_assessment:get_assessment', args=[assessment.id]))
+
+    def test_archived_assessment_reads_as_before(self):
+        old = self.make_finished(days_idle=100)
+        recent = self.make_finished(days_idle=1)
+        open_assessment = make_assessment()
+        HealthAssessment.objects.filter(id=open_assessment.id).update(updated_at=timezone.now() - timedelta(days=100))
+        before = self.get(old).json()
+
+        self.assertEqual(archive.archive_finished(days=90), 1)
+
+        self.assertEqual(set(HealthAssessment.objects.values_list('id', flat=True)), {recent.id, open_assessment.id})
+        self.assertFalse(Question.objects.filter(assessment_id=old.id).exists())
+        self.assertFalse(TreatmentPlan.objects.filter(assessment_id=old.id).exists())
+        with self.assertNumQueries(2):
+            response = self.get(old)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), before)
+
+    def test_command_moves_old_assessments_in_batches(self):
+        for _ in range(5):
+            self.make_finished(days_idle=100)
+        out = StringIO()
+
+        call_command('archive_assessments', '--batch-size', '2', stdout=out)
+
+        self.assertEqual(out.getvalue().count("Archived a batch"), 3)
+        self.assertIn("Archived 5 assessments", out.getvalue())
+        self.assertEqual(ArchivedAssessment.objects.count(), 5)
+        self.assertFalse(HealthAssessment.objects.exists())
+
+    def test_assessment_updated_during_the_batch_stays_live(self):
+        assessment = self.make_finished(days_idle=100)
+        select = archive.HealthAssessment.objects.with_details
+
+        def touch_after_read():
+            queryset = select()
+            HealthAssessment.objects.filter(id=assessment.id).update(updated_at=timezone.now())
+            return queryset
+
+        with mock.patch.object(archive.HealthAssessment.objects, 'with_details', side_effect=touch_after_read):
+            self.assertEqual(archive.archive_batch(archive.cutoff(90), 10), 0)
+
+        self.assertTrue(HealthAssessment.objects.filter(id=assessment.id).exists())
+        self.assertFalse(ArchivedAssessment.objects.exists())
+
+    def test_unknown_assessment_is_404(self):
+        response = self.client.get(reverse('health_assessment:get_assessment', args=[uuid.uuid4()]))
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(QUESTION_CACHE_BACKEND='')
+class ReplayTests(TestCase):
+    def setUp(self):
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+        patcher = mock.patch.object(GeminiService, '__init__', fake_gemini_init)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.input = os.path.join(directory.name, 'cases.jsonl')
+        self.output = os.path.join(directory.name, 'results.jsonl')
+        cases = [
+            {'id': 'a', 'initial_concern': "Headache for 3 days", 'answers': ["Monday", "7", "Dark rooms help", "No"]},
+            {'id': 'b', 'initial_concern': "Cough", 'answers': ["A week"]},
+            {'id': 'c', 'initial_concern': ""},
+        ]
+        with open(self.input, 'w') as f:
+            f.write('\n'.join(json.dumps(case) for case in cases) + '\n\n{"id": \n')
+
+    def replay(self, *args):
+        call_command('replay_assessments', self.input, '--output', self.output, '--concurrency', '2', *args, stdout=StringIO())
+        with open(self.output) as f:
+            return {record['line']: record for record in map(json.loads, f)}
+
+    def test_cases_run_through_the_services_without_touching_the_database(self):
+        with self.assertNumQueries(0):
+            records = self.replay()
+
+        full = records[1]
+        self.assertEqual(full['id'], 'a')
+        self.assertEqual(
+            [q['question'] for q in full['questions']],
+            ["Where does it hurt?", "How long has it lasted?", "Does the pain move?", "Does the pain move?"]
+        )
+        self.assertEqual([q['answer'] for q in full['questions']], ["Monday", "7", "Dark rooms help", "No"])
+        self.assertEqual(full['treatment_plan']['diagnosis'], "Tension headache")
+        self.assertEqual(full['fallbacks'], [])
+        short = records[2]
+        self.assertIsNone(short['treatment_plan'])
+        self.assertEqual([q['answer'] for q in short['questions']], ["A week", None])
+        self.assertIn('initial_concern', records[3]['error'])
+        self.assertIn('invalid JSON', records[5]['error'])
+
+    def test_resume_skips_finished_cases_and_drops_a_cut_off_record(self):
+        records = self.replay()
+        with open(self.output, 'w') as f:
+            f.write(json.dumps(records[1]) + '\n' + json.dumps(records[3]) + '\n' + json.dumps(records[2])[:40])
+
+        with mock.patch.object(replay, 'replay', wraps=replay.replay) as run:
+            resumed = self.replay('--resume')
+
+        self.assertEqual(sorted(call.args[0] for call in run.call_args_list), ["Cough"])
+        with open(self.output) as f:
+            lines = [json.loads(line)['line'] for line in f]
+        self.assertEqual(sorted(lines), [1, 2, 3, 3, 5])
+        self.assertEqual(resumed[2]['treatment_plan'], None)
+
+
+CLAUDE_MESSAGE = {
+    'id': 'msg_1', 'type': 'message', 'role': 'assistant', 'model': ClaudeService.model,
+    'content': [{'type': 'text', 'text': "Forehead"}], 'stop_reason': 'end_turn', 'stop_sequence': None,
+    'usage': {'input_tokens': 10, 'output_tokens': 1},
+}
+
+
+class ProviderRegistryTests(TestCase):
+    def setUp(self):
+        self.addCleanup(providers.reset)
+
+    def test_client_is_built_once_across_threads(self):
+        factory = mock.Mock(side_effect=object)
+        providers.register('test-provider', factory)
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            clients = list(pool.map(lambda _: providers.get('test-provider'), range(32)))
+
+        self.assertEqual(factory.call_count, 1)
+        self.assertTrue(all(client is clients[0] for client in clients))
+
+    def test_services_share_the_registered_client(self):
+        self.assertIs(GeminiService().model, GeminiService().model)
+
+    @override_settings(ANTHROPIC_API_KEY='test-key')
+    def test_claude_service_speaks_the_pinned_sdk(self):
+        sent = []
+
+        def handle_request(transport, request):
+            sent.append(json.loads(request.content))
+            return httpx.Response(200, json=CLAUDE_MESSAGE)
+
+        with mock.patch.object(httpx.HTTPTransport, 'handle_request', handle_request):
+            text = ClaudeService().complete("Where does it hurt?", max_tokens=50, system="Be brief.")
+
+        self.assertEqual(text, "Forehead")
+        self.assertEqual(sent, [{
+            'model': ClaudeService.model, 'max_tokens': 50, 'system': "Be brief.",
+            'messages': [{'role': 'user', 'content': "Where does it hurt?"}],
+        }])
+
+    @override_settings(ANTHROPIC_API_KEY='test-key')
+    def test_anthropic_client_leaves_retries_to_resilience(self):
+        sent = []
+
+        def handle_request(transport, request):
+            sent.append(request)
+            return httpx.Response(529, json={'type': 'error', 'error': {'type': 'overloaded_error', 'message': ""}})
+
+        with mock.patch.object(httpx.HTTPTransport, 'handle_request', handle_request):
+            with self.assertRaises(Exception):
+                ClaudeService().complete("Where does it hurt?")
+
+        self.assertEqual(len(sent), 1)
+
+        async def async_max_retries():
+            return providers.get_async('anthropic').max_retries
+
+        self.assertEqual(async_to_sync(async_max_retries)(), 0)
+
+    def test_startup_does_not_import_provider_sdks(self):
+        # A fresh interpreter, since this one has already imported them
+        script = (
+            "import sys, django; django.setup(); "
+            "from django.urls import get_resolver; get_resolver().url_patterns; "
+            "import health_project.celery; "
+            "print(','.join(m for m in ('anthropic', 'google.generativeai', 'httpx') if m in sys.modules))"
+        )
+        result = subprocess.run(
+            [sys.executable, '-c', script], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'health_project.settings'},
+        )
+
+        self.assertEqual(result.stdout.strip(), '')
+
+
+class QuestionCacheTests(TestCase):
+    def setUp(self):
+        question_cache.reset()
+        self.addCleanup(question_cache.reset)
+        self.model = mock.Mock()
+        self.model.generate_content.return_value = FakeResponse("Where does it hurt?\nHow long has it lasted?")
+        patcher = mock.patch.object(providers, 'get', return_value=self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_near_identical_concerns_share_questions(self):
+        first = GeminiService().generate_initial_questions("headache for 3 days")
+        second = GeminiService().generate_initial_questions("I have a headache since 3 days!")
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.model.generate_content.call_count, 1)
+        stats = question_cache.get_question_cache().stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_similar_but_different_concern_is_not_a_hit_by_default(self):
+        GeminiService().generate_initial_questions("high fever and cough in my 2 year old son")
+        GeminiService().generate_initial_questions("high fever and cough in my 12 year old son")
+
+        self.assertEqual(self.model.generate_content.call_count, 2)
+
+    @override_settings(QUESTION_CACHE_SIMILARITY=0.8)
+    def test_similar_concern_is_a_fuzzy_hit(self):
+        GeminiService().generate_initial_questions("persistent headache for 3 days")
+        GeminiService().generate_initial_questions("persistant headache for 3 days")
+
+        self.assertEqual(self.model.generate_content.call_count, 1)
+        self.assertEqual(question_cache.get_question_cache().stats()['similar_hits'], 1)
+
+    @override_settings(LLM_RETRIES=0)
+    def test_fallback_questions_are_not_cached(self):
+        self.model.generate_content.side_effect = RuntimeError("upstream down")
+        GeminiService().generate_initial_questions("back pain")
+        self.model.generate_content.side_effect = None
+
+        GeminiService().generate_initial_questions("back pain")
+
+        self.assertEqual(self.model.generate_content.call_count, 2)
+
+    def test_in_memory_backend_evicts_least_recently_used(self):
+        backend = question_cache.InMemoryBackend(max_entries=2, ttl=60)
+        backend.set('a', ['1'])
+        backend.set('b', ['2'])
+        backend.get('a')
+        backend.set('c', ['3'])
+
+        self.assertEqual(sorted(backend.keys()), ['a', 'c'])
+
+
+@override_settings(
+    THROTTLE_BACKEND='memory', THROTTLE_RATES={'requests': (1, 5), 'model': (0.01, 2)},
+    MODEL_CONCURRENCY=1, MODEL_QUEUE_TIMEOUT=0.05, QUESTION_CACHE_BACKEND=''
+)
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        throttling.reset()
+        self.addCleanup(throttling.reset)
+        patcher = mock.patch.object(GeminiService, '__init__', fake_gemini_init)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start(self, name='start_assessment', **headers):
+        return self.client.post(
+            reverse(f'health_assessment:{name}'),
+            {'initial_concern': "Headache for 3 days"},
+            content_type='application/json',
+            **headers
+        )
+
+    def test_client_over_its_burst_gets_429_with_retry_after(self):
+        self.assertEqual(self.start().status_code, 200)
+        self.assertEqual(self.start().status_code, 200)
+
+        response = self.start()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '100')
+        # The async views draw on the same buckets
+        self.assertEqual(self.start('async_start_assessment').status_code, 429)
+
+    def test_new_session_ids_and_forwarded_addresses_do_not_reset_the_bucket(self):
+        self.start(HTTP_X_SESSION_ID='a')
+        self.start(HTTP_X_SESSION_ID='b', HTTP_X_FORWARDED_FOR='10.0.0.1')
+
+        self.assertEqual(self.start(HTTP_X_SESSION_ID='c').status_code, 429)
+        self.assertEqual(self.start(HTTP_X_FORWARDED_FOR='10.0.0.2').status_code, 429)
+
+    def test_session_is_limited_across_addresses(self):
+        self.start(HTTP_X_SESSION_ID='a', REMOTE_ADDR='10.0.0.1')
+        self.start(HTTP_X_SESSION_ID='a', REMOTE_ADDR='10.0.0.2')
+
+        self.assertEqual(self.start(HTTP_X_SESSION_ID='a', REMOTE_ADDR='10.0.0.3').status_code, 429)
+        self.assertEqual(self.start(REMOTE_ADDR='10.0.0.3').status_code, 200)
+
+    def test_saturated_model_work_is_rejected_without_waiting_for_the_model(self):
+        release = throttling.admit()
+
+        response = self.start()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '1')
+        release()
+        self.assertEqual(self.start().status_code, 200)
+
+    def test_stream_holds_its_slot_until_consumed(self):
+        assessment = make_assessment()
+
+        response = self.client.get(reverse('health_assessment:stream_treatment_plan', args=[assessment.id]))
+
+        self.assertEqual(throttling.in_flight(), 1)
+        read_events(response)
+        self.assertEqual(throttling.in_flight(), 0)
+
+    async def test_async_stream_holds_its_slot_until_consumed(self):
+        assessment = await sync_to_async(make_assessment)()
+
+        response = await self.async_client.get(reverse('health_assessment:stream_treatment_plan', args=[assessment.id]))
+
+        self.assertEqual(throttling.in_flight(), 1)
+        await aread_events(response)
+        self.assertEqual(throttling.in_flight(), 0)
+
+    @override_settings(THROTTLE_BACKEND='django')
+    def test_cache_backend_limits_across_processes(self):
+        cache.clear()
+        backend = throttling.get_backend()
+
+        self.assertEqual(backend.take('model:ip:1', 0.01, 2), 0)
+        self.assertEqual(backend.take('model:ip:1', 0.01, 2), 0)
+        self.assertGreater(backend.take('model:ip:1', 0.01, 2), 99)
+        self.assertTrue(backend.acquire(1, 0))
+        self.assertFalse(backend.acquire(1, 0.01))
+        backend.release()
+        self.assertEqual(backend.in_flight(), 0)
+
+
+@mock.patch.object(GeminiService, '__init__', fake_gemini_init)
+class StreamingTests(TestCase):
+    def test_followup_question_streams_tokens_then_persisted_id(self):
+        assessment = make_assessment()
+
+        response = self.client.get(reverse('health_assessment:stream_followup_question', args=[assessment.id]))
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = read_events(response)
+        tokens = ''.join(data['text'] for event, data in events if event == 'token')
+        self.assertEqual(tokens, "Does the pain move?")
+        self.assertGreater(len(events), 2)
+        event, done = events[-1]
+        self.assertEqual(event, 'done')
+        question = Question.objects.get(id=done['question_id'])
+        self.assertEqual((question.question_text, question.question_order), ("Does the pain move?", 4))
+
+    def test_followup_stream_rejected_while_questions_are_open(self):
+        assessment = make_assessment()
+        Question.objects.create(assessment=assessment, question_text="Open?", question_order=4)
+
+        response = self.client.get(reverse('health_assessment:stream_followup_question', args=[assessment.id]))
+
+        self.assertEqual(response.status_code, 409)
+
+    def test_treatment_plan_streams_json_then_persisted_plan(self):
+        assessment = make_assessment()
+
+        response = self.client.get(reverse('health_assessment:stream_treatment_plan', args=[assessment.id]))
+
+        events = read_events(response)
+        self.assertEqual(''.join(data['text'] for event, data in events if event == 'token'), PLAN_JSON)
+        event, done = events[-1]
+        self.assertEqual(event, 'done')
+        self.assertEqual(done['treatment_plan_id'], assessment.treatment_plan.id)
+        self.assertEqual(done['treatment_plan']['diagnosis'], "Tension headache")
+
+    async def test_streams_are_sent_event_by_event_under_asgi(self):
+        assessment = await sync_to_async(make_assessment)()
+
+        response = await self.async_client.get(reverse('health_assessment:stream_treatment_plan', args=[assessment.id]))
+
+        # A sync iterator would be buffered whole, so the plan would be saved before the first event went out
+        first = await anext(response.streaming_content)
+        self.assertFalse(await TreatmentPlan.objects.filter(assessment=assessment).aexists())
+        events = parse_events(first + b''.join([chunk async for chunk in response.streaming_content]))
+        self.assertEqual(''.join(data['text'] for event, data in events if event == 'token'), PLAN_JSON)
+        self.assertEqual(events[-1][1]['treatment_plan']['diagnosis'], "Tension headache")
+
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        question_cache.reset()
+        resilience.reset()
+        self.addCleanup(question_cache.reset)
+        self.addCleanup(resilience.reset)
+        patcher = mock.patch.object(GeminiService, '__init__', fake_gemini_init)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, name, data=None, args=(), **kwargs):
+        return self.async_client.post(
+            reverse(f'health_assessment:{name}', args=args), data, content_type='application/json', **kwargs
+        )
+
+    async def test_start_then_answers_add_a_followup(self):
+        response = await self.post('async_start_assessment', {'initial_concern': "Headache for 3 days"})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(
+            [q['question_text'] for q in body['questions']], ["Where does it hurt?", "How long has it lasted?"]
+        )
+        assessment = await HealthAssessment.objects.aget(id=body['assessment_id'])
+        self.assertEqual(assessment.status, 'in_progress')
+
+        first, second = [
+            (await self.post('async_submit_answer', {'question_id': q['id'], 'answer_text': "Yes"})).json()
+            for q in body['questions']
+        ]
+        self.assertIsNone(first['next_question'])
+        self.assertEqual(second['next_question']['text'], "Does the pain move?")
+        followup = await Question.objects.aget(id=second['next_question']['id'])
+        self.assertEqual((followup.assessment_id, followup.question_order), (assessment.id, 3))
+
+    async def test_plan_is_generated_then_reused(self):
+        assessment = await sync_to_async(make_assessment)()
+
+        first = await self.post('async_generate_treatment_plan', args=[assessment.id])
+        second = await self.post('async_generate_treatment_plan', args=[assessment.id])
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.json()['treatment_plan']['diagnosis'], "Tension headache")
+        self.assertEqual([first.json()['cached'], second.json()['cached']], [False, True])
+        self.assertEqual(await TreatmentPlan.objects.filter(assessment=assessment).acount(), 1)
+
+    async def test_plan_needs_enough_answers(self):
+        assessment = await sync_to_async(make_assessment)(answered=2)
+
+        response = await self.post('async_generate_treatment_plan', args=[assessment.id])
+
+        self.assertEqual(response.status_code, 400)
+
+    async def test_unknown_ids_are_404(self):
+        plan = await self.post('async_generate_treatment_plan', args=[uuid.uuid4()])
+        answer = await self.post('async_submit_answer', {'question_id': 999999, 'answer_text': "Yes"})
+
+        self.assertEqual((plan.status_code, answer.status_code), (404, 404))
+        self.assertEqual(plan.json(), {'detail': 'Not found.'})
+
+    async def test_malformed_or_invalid_bodies_are_400(self):
+        malformed = await self.post('async_start_assessment', '{"initial_concern": ')
+        invalid = await self.post('async_submit_answer', {'answer_text': "Yes"})
+
+        self.assertEqual(malformed.status_code, 400)
+        self.assertEqual(malformed.json(), {'detail': 'Malformed JSON'})
+        self.assertEqual(invalid.status_code, 400)
+        self.assertIn('question_id', invalid.json())
+
+    async def test_other_methods_are_not_allowed(self):
+        response = await self.async_client.get(reverse('health_assessment:async_start_assessment'))
+
+        self.assertEqual(response.status_code, 405)
+
+
+class HotStateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(GeminiService, '__init__', fake_gemini_init)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        response = self.client.post(
+            reverse('health_assessment:start_assessment'),
+            {'initial_concern': "Headache for 3 days"},
+            content_type='application/json'
+        )
+        self.assessment_id = response.json()['assessment_id']
+        self.question_ids = [q['id'] for q in response.json()['questions']]
+
+    def next_question(self):
+        return self.client.get(reverse('health_assessment:next_question', args=[self.assessment_id]))
+
+    def test_next_question_is_served_from_cache(self):
+        self.client.post(
+            reverse('health_assessment:submit_answer'),
+            {'question_id': self.question_ids[0], 'answer_text': "Forehead"},
+            content_type='application/json'
+        )
+
+        with self.assertNumQueries(0):
+            response = self.next_question()
+
+        self.assertEqual(response.json()['id'], self.question_ids[1])
+        self.assertEqual(response.json(), QuestionSerializer(Question.objects.get(id=self.question_ids[1])).data)
+
+    def test_unknown_assessment_is_404(self):
+        response = self.client.get(reverse('health_assessment:next_question', args=[uuid.uuid4()]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_followup_lands_in_cached_state(self):
+        for question_id in self.question_ids:
+            response = self.client.post(
+                reverse('health_assessment:submit_answer'),
+                {'question_id': question_id, 'answer_text': "Yes"},
+                content_type='application/json'
+            )
+
+        followup_id = response.json()['next_question']['id']
+        self.assertEqual(self.next_question().json()['id'], followup_id)
+        self.assertEqual(hot_state.get(self.assessment_id)['total'], 3)
+
+    def test_saves_outside_the_views_invalidate(self):
+        self.next_question()
+        with self.captureOnCommitCallbacks(execute=True):
+            Question.objects.filter(id=self.question_ids[0]).get().delete()
+
+        self.assertEqual(self.next_question().json()['id'], self.question_ids[1])
+        self.assertEqual(hot_state.get(self.assessment_id)['total'], 1)
+
+
+class IdempotentSubmitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(GeminiService, '__init__', fake_gemini_init)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        response = self.client.post(
+            reverse('health_assessment:start_assessment'),
+            {'initial_concern': "Headache for 3 days"},
+            content_type='application/json'
+        )
+        self.question_ids = [q['id'] for q in response.json()['questions']]
+
+    def submit(self, question_id, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(
+            reverse('health_assessment:submit_answer'),
+            {'question_id': question_id, 'answer_text': "Yes"},
+            content_type='application/json',
+            **headers
+        )
+
+    @mock.patch.object(GeminiService, 'generate_followup_question', return_value="Does the pain move?")
+    def test_retry_with_same_key_replays_response(self, generate):
+        self.submit(self.question_ids[0])
+
+        first = self.submit(self.question_ids[1], key='retry-1')
+        with self.assertNumQueries(2):
+            retry = self.submit(self.question_ids[1], key='retry-1')
+
+        self.assertEqual(retry.json(), first.json())
+        self.assertIsNotNone(first.json()['next_question'])
+        generate.assert_called_once()
+        self.assertEqual(Question.objects.filter(question_order=3).count(), 1)
+
+    @mock.patch.object(GeminiService, 'generate_followup_question', return_value="Does the pain move?")
+    def test_duplicate_submission_does_not_add_another_followup(self, generate):
+        self.submit(self.question_ids[0])
+        self.submit(self.question_ids[1])
+        again = self.submit(self.question_ids[1])
+
+        self.assertEqual(again.status_code, 200)
+        self.assertIsNone(again.json()['next_question'])
+        generate.assert_called_once()
+        self.assertEqual(Question.objects.count(), 3)
+
+    @mock.patch.object(GeminiService, 'generate_followup_question', return_value="Does the pain move?")
+    def test_abandoned_claim_is_taken_over(self, generate):
+        self.submit(self.question_ids[0])
+        question = Question.objects.get(id=self.question_ids[1])
+        AnswerSubmission.objects.create(key='fresh', question=question)
+        AnswerSubmission.objects.create(key='abandoned', question=question)
+        AnswerSubmission.objects.filter(key='abandoned').update(created_at=timezone.now() - timedelta(minutes=5))
+
+        self.assertEqual(self.submit(self.question_ids[1], key='fresh').status_code, 409)
+        response = self.submit(self.question_ids[1], key='abandoned')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.json()['next_question'])
+        self.assertEqual(AnswerSubmission.objects.get(key='abandoned').response, response.json())
+
+    def test_key_reused_for_another_question_is_rejected(self):
+        self.submit(self.question_ids[0], key='shared')
+
+        response = self.submit(self.question_ids[1], key='shared')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertFalse(Question.objects.get(id=self.question_ids[1]).is_answered)
+
+    async def async_submit(self, question_id, key=None):
+        # Straight to the view so concurrent submissions interleave at its awaits
+        request = AsyncRequestFactory().post(
+            reverse('health_assessment:async_submit_answer'),
+            {'question_id': question_id, 'answer_text': "Yes"},
+            content_type='application/json',
+            headers={'Idempotency-Key': key} if key else {}
+        )
+        response = await async_views.submit_answer(request)
+        return response.status_code, json.loads(response.content)
+
+    @mock.patch.object(GeminiService, 'agenerate_followup_question')
+    async def test_async_concurrent_submissions_add_one_followup(self, generate):
+        async def slow_followup(assessment):
+            # Yield to the other submission while "the model" works
+            await asyncio.sleep(0.05)
+            return "Does the pain move?"
+        generate.side_effect = slow_followup
+        await self.async_submit(self.question_ids[0])
+
+        responses = await asyncio.gather(*(self.async_submit(self.question_ids[1]) for _ in range(2)))
+
+        self.assertEqual([status_code for status_code, _ in responses], [200, 200])
+        self.assertEqual(sum(body['next_question'] is not None for _, body in responses), 1)
+        generate.assert_called_once()
+        self.assertEqual(await Question.objects.acount(), 3)
+
+    @mock.patch.object(GeminiService, 'agenerate_followup_question', return_value="Does the pain move?")
+    async def test_async_retry_with_same_key_replays_response(self, generate):
+        await self.async_submit(self.question_ids[0])
+
+        first = await self.async_submit(self.question_ids[1], key='retry-1')
+        retry = await self.async_submit(self.question_ids[1], key='retry-1')
+        reused = await self.async_submit(self.question_ids[0], key='retry-1')
+
+        self.assertEqual(retry, first)
+        self.assertIsNotNone(first[1]['next_question'])
+        generate.assert_called_once()
+        self.assertEqual(reused[0], 422)
+
+
+class PlanParserTests(TestCase):
+    def test_extracts_object_from_prose_and_fences(self):
+        text = 'Here is the plan:\n```json\n{"diagnosis": "Migraine {likely}", "medications": ["Ibuprofen",],}\n```\nStay well!'
+
+        self.assertEqual(extract(text), {"diagnosis": "Migraine {likely}", "medications": ["Ibuprofen"]})
+
+    def test_truncated_output_keeps_complete_fields(self):
+        data = extract('{"diagnosis": "Tension headache", "recommendations": ["Rest"], "medications": ["Ibu')
+
+        plan, missing = validate_plan(data)
+
+        self.assertEqual(plan, {"diagnosis": "Tension headache", "recommendations": ["Rest"]})
+        self.assertEqual(missing, ["medications", "lifestyle_changes", "followup_instructions"])
+
+    def test_list_cut_off_is_missing_not_shortened(self):
+        for text in [
+            '{"diagnosis": "Flu", "recommendations": ["Rest", "Fluids", "See a',
+            '{"diagnosis": "Flu", "recommendations": [',
+            '{"diagnosis": "Flu", "recommendations": ["Rest", ',
+            '{"diagnosis": "Flu", "recommendations": [{"text": "Rest"}',
+        ]:
+            with self.subTest(text=text):
+                plan, missing = validate_plan(extract(text))
+
+                self.assertEqual(plan, {"diagnosis": "Flu"})
+                self.assertIn("recommendations", missing)
+
+    def test_streamed_chunks_parse_like_whole_text(self):
+        extractor = PlanExtractor()
+        chunks = [PLAN_JSON[i:i + 3] for i in range(0, len(PLAN_JSON), 3)] + [" trailing prose"]
+
+        done = [extractor.feed(chunk) for chunk in chunks]
+
+        self.assertTrue(done[-2])
+        self.assertEqual(extractor.value(), json.loads(PLAN_JSON))
+
+    def test_only_missing_fields_are_requested(self):
+        service = mock.Mock(spec=LLMService)
+        service.call.side_effect = [
+            '{"diagnosis": "Tension headache", "recommendations": ["Rest"], "medications": [], "lifes',
+            'Sure: {"lifestyle_changes": ["Sleep more"], "followup_instructions": "See a GP.", "diagnosis": "Other"}',
+        ]
+
+        plan = EKAMCPService(service).generate_treatment_plan(make_assessment())
+
+        self.assertEqual(plan["diagnosis"], "Tension headache")
+        self.assertEqual(plan["lifestyle_changes"], ["Sleep more"])
+        followup_prompt = service.call.call_args.args[1]
+        self.assertIn('"lifestyle_changes" (a list of strings), "followup_instructions" (a string)', followup_prompt)
+        self.assertNotIn('"medications" (', followup_prompt)
+
+    def test_async_path_completes_plans_like_the_sync_path(self):
+        partial = '{"diagnosis": "Tension headache", "recommendations": ["Rest"], "medications": [], "lifes'
+        assessment = make_assessment()
+        for missing_fields_reply in ['{"lifestyle_changes": ["Sleep more"]}', RuntimeError("down")]:
+            sync_service, async_service = mock.Mock(spec=LLMService), mock.Mock(spec=LLMService)
+            sync_service.call.side_effect = [partial, missing_fields_reply]
+            async_service.acall.side_effect = [partial, missing_fields_reply]
+
+            plan = EKAMCPService(sync_service).generate_treatment_plan(assessment)
+
+            self.assertEqual(async_to_sync(EKAMCPService(async_service).agenerate_treatment_plan)(assessment), plan)
+            self.assertEqual(plan["diagnosis"], "Tension headache")
+
+    def test_prose_reply_falls_back_instead_of_failing(self):
+        service = mock.Mock(spec=LLMService)
+        service.call.return_value = "I'm sorry, I can't help with that."
+
+        plan = EKAMCPService(service).generate_treatment_plan(make_assessment())
+
+        self.assertEqual(plan, EKAMCPService(service)._fallback_treatment_plan())
+
+
+@override_settings(SPECULATIVE_FOLLOWUP=True)
+class SpeculativeFollowupTests(TestCase):
+    def setUp(self):
+        self.addCleanup(speculation.reset)
+        self.model = FakeGeminiModel()
+        self.model.generate_content = mock.Mock(wraps=self.model.generate_content)
+        patcher = mock.patch.object(providers, 'get', return_value=self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.assessment = make_assessment(answered=2)
+        self.open_questions = [
+            Question.objects.create(assessment=self.assessment, question_text=f"Open {order}?", question_order=order)
+            for order in (3, 4)
+        ]
+
+    def answer(self, question, text):
+        response = self.client.post(
+            reverse('health_assessment:submit_answer'),
+            {'question_id': question.id, 'answer_text': text},
+            content_type='application/json'
+        )
+        # Let background generation finish so call counts are deterministic
+        for pending in list(speculation._pending.values()):
+            pending.future.result()
+        return response
+
+    def test_last_answer_receives_speculated_question(self):
+        self.answer(self.open_questions[0], "Mornings")
+        self.assertEqual(self.model.generate_content.call_count, 1)
+
+        response = self.answer(self.open_questions[1], "Yes")
+
+        self.assertEqual(response.json()['next_question']['text'], "Does the pain move?")
+        self.assertEqual(self.model.generate_content.call_count, 1)
+        self.assertEqual(self.assessment.questions.count(), 5)
+
+    def test_changed_answer_restarts_speculation(self):
+        self.answer(self.open_questions[0], "Mornings")
+        self.answer(self.open_questions[0], "Evenings")
+        self.assertEqual(self.model.generate_content.call_count, 2)
+        prompt = self.model.generate_content.call_args.args[0]
+        self.assertIn("Evenings", prompt)
+
+        self.answer(self.open_questions[1], "Yes")
+
+        self.assertEqual(self.model.generate_content.call_count, 2)
+
+    def test_stale_speculation_is_discarded(self):
+        self.answer(self.open_questions[0], "Mornings")
+        # Edited outside submit_answer (e.g. in the admin), so no new speculation starts
+        answer = Answer.objects.get(question=self.open_questions[0])
+        answer.answer_text = "Evenings"
+        answer.save()
+
+        self.answer(self.open_questions[1], "Yes")
+
+        self.assertEqual(self.model.generate_content.call_count, 2)
+
+
+@override_settings(QUESTION_CACHE_BACKEND='', INITIAL_QUESTION_BATCH_WINDOW_MS=10000)
+class BatchingTests(TestCase):
+    def setUp(self):
+        batching.reset()
+        self.addCleanup(batching.reset)
+        self.model = mock_llm.MockGenerativeModel(mock_llm.MockBehaviour(latency=0))
+        self.model.generate_content = mock.Mock(wraps=self.model.generate_content)
+        patcher = mock.patch.object(providers, 'get', return_value=self.model)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start_concurrently(self, concerns):
+        # The batch closes once every concern is queued, however the threads are scheduled;
+        # the long window only matters if one never arrives
+        with self.settings(INITIAL_QUESTION_BATCH_SIZE=len(concerns)), ThreadPoolExecutor(len(concerns)) as pool:
+            return list(pool.map(lambda concern: GeminiService().generate_initial_questions(concern), concerns))
+
+    def test_concurrent_concerns_share_one_model_call(self):
+        results = self.start_concurrently(["Headache", "Back pain", "Cough", "Headache"])
+
+        self.assertEqual(self.model.generate_content.call_count, 1)
+        self.assertEqual(results, [mock_llm.QUESTIONS_REPLY.split('\n')[:2]] * 4)
+        prompt = self.model.generate_content.call_args.args[0]
+        # Threads submit in any order; the duplicate concern is sent once
+        for concern in ("Headache", "Back pain", "Cough"):
+            self.assertEqual(prompt.count(f'"{concern}"'), 1)
+        self.assertNotIn('Concern 4', prompt)
+
+    def test_concern_missing_from_reply_is_asked_alone(self):
+        reply = "### Concern 1\nWhere does it hurt?\nSince when?"
+        self.model.generate_content.side_effect = [FakeResponse(reply), FakeResponse("Is it dry?\nAny fever?")]
+
+        results = self.start_concurrently(["Headache", "Cough"])
+
+        self.assertEqual(sorted(results), [["Is it dry?", "Any fever?"], ["Where does it hurt?", "Since when?"]])
+        self.assertEqual(self.model.generate_content.call_count, 2)
+
+
+class TranscriptTests(TestCase):
+    def test_context_follows_answers_without_requerying(self):
+        assessment = make_assessment(answered=2)
+        late = Question.objects.create(assessment=assessment, question_text="Late?", question_order=3, is_answered=True)
+        Answer.objects.create(question=late, answer_text="Yes")
+        first = Answer.objects.get(question__assessment=assessment, question__question_order=1)
+        first.answer_text = "Edited"
+        first.save()
+        assessment.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            context = LLMService().build_followup_prompt(assessment)
+
+        self.assertIn(
+            "Q: Question 1?\nA: Edited\n\nQ: Question 2?\nA: Answer 2\n\nQ: Late?\nA: Yes\n\n",
+            context
+        )
+
+    def test_deleted_answer_leaves_transcript(self):
+        assessment = make_assessment(answered=2)
+        Answer.objects.filter(question__question_order=2).get().delete()
+        assessment.refresh_from_db()
+
+        self.assertEqual([e['question'] for e in assessment.transcript], ["Question 1?"])
+
+
+class PromptBudgetTests(TestCase):
+    def test_long_transcript_is_condensed_within_budget(self):
+        pairs = [
+            {'question': f"Question {i}?", 'answer': f"Answer {i} " + "with a long explanation of the symptoms " * 5}
+            for i in range(1, 31)
+        ]
+
+        rendered = prompt_budget.render_qa(pairs, budget=300)
+
+        self.assertLessEqual(prompt_budget.count_tokens(rendered), 320)
+        self.assertTrue(rendered.endswith(f"Q: Question 30?\nA: {pairs[-1]['answer']}\n\n"))
+        self.assertIn("earlier answers omitted", rendered)
+        self.assertRegex(rendered, r"- Question \d+\? Answer \d+ with a long explanation of the symptoms with a long\.\.\.")
+
+    def test_short_transcript_is_unchanged(self):
+        pairs = [{'question': "Where?", 'answer': "Forehead"}, {'question': "Since?", 'answer': "Monday"}]
+
+        self.assertEqual(prompt_budget.render_qa(pairs, budget=300), "Q: Where?\nA: Forehead\n\nQ: Since?\nA: Monday\n\n")
+
+    def test_plan_instructions_travel_as_system_prompt(self):
+        service = mock.Mock(spec=LLMService)
+        service.call.return_value = PLAN_JSON
+
+        EKAMCPService(service).generate_treatment_plan(make_assessment())
+
+        _, prompt, _ = service.call.call_args.args
+        self.assertEqual(service.call.call_args.kwargs['system'], PLAN_SYSTEM_PROMPT)
+        self.assertIn("Q: Question 3?\nA: Answer 3", prompt)
+        self.assertNotIn("diagnosis", prompt)
+
+
+class SlowService(LLMService):
+    delay = 0.0
+    fails = False
+
+    def complete(self, prompt, max_tokens=None, timeout=None, system=None):
+        time.sleep(self.delay)
+        if self.fails:
+            raise RuntimeError(f"{type(self).__name__} down")
+        return type(self).__name__
+
+
+class Fast(SlowService):
+    delay = 0.01
+
+
+class Hung(SlowService):
+    delay = 0.5
+
+
+class Broken(SlowService):
+    fails = True
+
+
+@override_settings(LLM_HEDGE_MIN_DELAY=0.05)
+class LLMRouterTests(TestCase):
+    def setUp(self):
+        resilience.reset()
+
+    def router(self, *services):
+        with mock.patch.dict(SERVICES, {cls.__name__: cls for cls in services}):
+            return LLMRouter([cls.__name__ for cls in services])
+
+    def test_hedges_to_second_provider_when_first_is_slow(self):
+        router = self.router(Hung, Fast)
+
+        started = time.monotonic()
+        result = router.complete("prompt")
+
+        self.assertEqual(result, 'Fast')
+        self.assertLess(time.monotonic() - started, 0.4)
+
+    def test_fails_over_when_provider_errors(self):
+        router = self.router(Broken, Fast)
+
+        self.assertEqual(router.complete("prompt"), 'Fast')
+        self.assertEqual(router.stats['Broken'].errors, 1)
+
+    def test_prefers_provider_with_lower_observed_latency(self):
+        router = self.router(Hung, Fast)
+        for _ in range(5):
+            router.stats['Hung'].record(0.5, ok=True)
+            router.stats['Fast'].record(0.01, ok=True)
+
+        self.assertEqual(router.ranked(), ['Fast', 'Hung'])
+
+
+    def test_skips_provider_with_open_circuit(self):
+        router = self.router(Broken, Fast)
+        with override_settings(LLM_RETRIES=0, LLM_BREAKER_FAILURES=1):
+            router.call('followup_question', "prompt", 100)
+
+        self.assertEqual(router.ranked(), ['Fast'])
+
+
+class Flaky(SlowService):
+    failures_left = 0
+
+    def complete(self, prompt, max_tokens=None, timeout=None, system=None):
+        self.calls = getattr(self, 'calls', 0) + 1
+        if self.failures_left:
+            self.failures_left -= 1
+            raise RuntimeError("transient")
+        return "Where does it hurt?"
+
+
+@override_settings(LLM_RETRIES=2, LLM_RETRY_BACKOFF=0, LLM_BREAKER_FAILURES=3, LLM_BREAKER_RESET_SECONDS=60)
+class ResilienceTests(TestCase):
+    def setUp(self):
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+        self.service = Flaky()
+
+    def test_transient_failure_is_retried(self):
+        self.service.failures_left = 1
+
+        self.assertEqual(self.service.call('followup_question', "prompt", 100), "Where does it hurt?")
+        self.assertEqual(self.service.calls, 2)
+        self.assertEqual(resilience.breaker_states()['Flaky']['state'], 'closed')
+
+    @mock.patch.object(resilience, '_backoff', return_value=0)
+    def test_no_backoff_after_the_last_attempt(self, backoff):
+        self.service.failures_left = 3
+
+        with self.assertRaisesMessage(resilience.LLMUnavailableError, "transient"):
+            self.service.call('followup_question', "prompt", 100)
+
+        self.assertEqual((self.service.calls, backoff.call_count), (3, 2))
+
+    @override_settings(LLM_BREAKER_FAILURES=1)
+    @mock.patch.object(resilience, '_backoff', return_value=0)
+    def test_no_backoff_once_the_circuit_opens(self, backoff):
+        async def fail(timeout):
+            raise RuntimeError("down")
+
+        with self.assertRaisesMessage(resilience.LLMUnavailableError, "down"):
+            async_to_sync(resilience.acall)('Flaky', 'followup_question', fail)
+
+        backoff.assert_not_called()
+        self.assertEqual(resilience.breaker_states()['Flaky']['state'], 'open')
+
+    def test_open_circuit_short_circuits_to_fallback(self):
+        self.service.failures_left = 3
+        with override_settings(QUESTION_CACHE_BACKEND=''):
+            self.assertEqual(self.service.generate_initial_questions("Headache"), FALLBACK_QUESTIONS)
+            self.assertEqual(self.service.generate_initial_questions("Headache"), FALLBACK_QUESTIONS)
+
+        self.assertEqual(self.service.calls, 3)
+        breaker = resilience.breaker_states()['Flaky']
+        self.assertEqual(breaker['state'], 'open')
+        self.assertEqual(breaker['short_circuits'], 1)
+
+    def test_half_open_trial_closes_circuit(self):
+        self.service.failures_left = 3
+        with self.assertRaises(resilience.LLMUnavailableError):
+            self.service.call('followup_question', "prompt", 100)
+
+        with override_settings(LLM_BREAKER_RESET_SECONDS=0):
+            self.assertEqual(self.service.call('followup_question', "prompt", 100), "Where does it hurt?")
+        self.assertEqual(resilience.breaker_states()['Flaky']['state'], 'closed')
+
+    def test_treatment_plan_falls_back_while_circuit_is_open(self):
+        for _ in range(3):
+            resilience.get_breaker('GeminiService').record_failure()
+        assessment = make_assessment()
+
+        with mock.patch.object(GeminiService, '__init__', fake_gemini_init):
+            response = self.client.post(reverse('health_assessment:generate_treatment_plan', args=[assessment.id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(TreatmentPlan.objects.get(assessment=assessment).diagnosis[:24], "Based on your symptoms, ")
+        health = self.client.get(reverse('health_assessment:llm_health')).json()
+        self.assertEqual(health['breakers']['GeminiService']['state'], 'open')
+
+
+@override_settings(QUESTION_CACHE_BACKEND='')
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        resilience.reset()
+        self.addCleanup(resilience.reset)
+        patcher = mock.patch.object(GeminiService, '__init__', fake_gemini_init)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def start(self):
+        return self.client.post(
+            reverse('health_assessment:start_assessment'),
+            {'initial_concern': "Headache for 3 days"},
+            content_type='application/json'
+        )
+
+    def test_requests_and_model_calls_are_exported(self):
+        self.start()
+
+        body = self.client.get(reverse('metrics')).content.decode()
+
+        self.assertIn(
+            'llm_request_duration_seconds_count{provider="GeminiService",operation="initial_questions",outcome="success"} 1',
+            body
+        )
+        self.assertIn('http_request_db_queries_count{view="start_assessment"} 1', body)
+        self.assertIn('llm_circuit_open{provider="GeminiService"} 0', body)
+        self.assertGreater(
+            metrics.LLM_TOKENS.value(provider='GeminiService', operation='initial_questions', direction='prompt'), 0
+        )
+
+    async def test_async_views_are_not_adapted_to_sync(self):
+        # With DEBUG on, Django logs each middleware it has to bridge an async request through
+        with self.settings(DEBUG=True), self.assertNoLogs('django.request', level='DEBUG'):
+            response = await self.async_client.post(
+                reverse('health_assessment:async_start_assessment'),
+                {'initial_concern': "Headache for 3 days"},
+                content_type='application/json'
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            metrics.REQUEST_LATENCY.count(view='async_start_assessment', method='POST', status=200), 1
+        )
+
+    @override_settings(LLM_RETRIES=0)
+    def test_fallbacks_are_counted(self):
+        with mock.patch.object(FakeGeminiModel, 'generate_content', side_effect=RuntimeError("down")):
+            self.start()
+
+        self.assertEqual(metrics.LLM_FALLBACKS.value(operation='initial_questions'), 1)
+        self.assertEqual(
+            metrics.LLM_LATENCY.count(provider='GeminiService', operation='initial_questions', outcome='error'), 1
+        )
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test', ['stage'], buckets=(0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, stage='a')
+
+        lines = histogram.render().splitlines()
+
+        self.assertIn('test_seconds_bucket{stage="a",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="1.0"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{stage="a"} 3', lines)
+
+    def test_spans_are_written_with_parents(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'spans.jsonl')
+            with override_settings(TRACING_FILE=path):
+                self.start()
+            with open(path) as f:
+                spans = {span['name']: span for span in map(json.loads, f)}
+
+        request, call = spans['http.request'], spans['llm.call']
+        self.assertEqual(call['trace_id'], request['trace_id'])
+        self.assertEqual(call['parent_span_id'], request['span_id'])
+        self.assertEqual(request['attributes']['view'], 'start_assessment')
+        self.assertEqual(call['attributes']['operation'], 'initial_questions')
@@ -0,0 +1,334 @@
+"""Per-client rate limits and a global cap on concurrent model work.
+
+Starting an assessment, answering a question and generating a plan all
+cost model quota, so two limits keep bursts from exhausting it and the
+worker pool:
+
+* A token bucket per client and scope (THROTTLE_RATES). Every API request
+  takes a token from the client's ``requests`` bucket; endpoints that call
+  a model also take one from its ``model`` bucket. A client is always its
+  address (REMOTE_ADDR, or X-Forwarded-For behind REST_FRAMEWORK's
+  NUM_PROXIES proxies); a request naming a session in ``X-Session-ID``
+  also takes from that session's buckets, so a session is limited across
+  addresses but a new header can't buy a fresh burst. The body is left
+  unread so parse errors still reach the view.
+* At most MODEL_CONCURRENCY requests doing model work at once. A request
+  over the limit queues for up to MODEL_QUEUE_TIMEOUT seconds.
+
+A request that hits either limit gets a 429 with Retry-After straight
+away instead of waiting behind the model. THROTTLE_BACKEND keeps the
+state per process ('memory') or in a CACHES alias ('django', e.g. Redis)
+shared by every worker. The cache is updated without locks, so under
+contention it may admit slightly more than the limits.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+from rest_framework import status
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+from . import metrics
+
+SESSION_HEADER = 'HTTP_X_SESSION_ID'
+SESSION_ID_MAX_LENGTH = 100
+
+
+def _gcra(tat: Optional[float], now: float, rate: float, burst: int) -> Tuple[Optional[float], float]:
+    """A token bucket kept as one timestamp (the generic cell rate algorithm).
+
+    ``tat`` is when the bucket would be full again. Returns the new value
+    and 0 if a token was available, else None and the seconds until one is.
+    """
+    interval = 1 / rate
+    new_tat = max(tat or now, now) + interval
+    excess = new_tat - now - burst * interval
+    if excess > 0:
+        return None, excess
+    return new_tat, 0.0
+
+
+class InMemoryBackend:
+    """Process-local buckets and slots"""
+
+    def __init__(self, max_clients: int, **kwargs):
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._slot_freed = threading.Condition()
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.time()
+        with self._lock:
+            tat, wait = _gcra(self._buckets.get(key), now, rate, burst)
+            if tat is not None:
+                self._buckets[key] = tat
+                self._buckets.move_to_end(key)
+                while len(self._buckets) > self.max_clients:
+                    # The client seen longest ago; its bucket has most likely refilled
+                    self._buckets.popitem(last=False)
+            return wait
+
+    def acquire(self, limit: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._slot_freed:
+            while self._in_flight >= limit:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._slot_freed.wait(remaining)
+            self._in_flight += 1
+            return True
+
+    def release(self):
+        with self._slot_freed:
+            self._in_flight -= 1
+            self._slot_freed.notify()
+
+    def in_flight(self) -> int:
+        with self._slot_freed:
+            return self._in_flight
+
+
+class DjangoCacheBackend:
+    """Buckets and slots in a Django cache alias, shared by every process using it.
+
+    Slots are one counter, updated with the cache's atomic incr/decr. The
+    counter expires ``slot_ttl`` seconds after it was created, which frees
+    any slots held by a worker that died.
+    """
+    slots_key = 'throttle:model-slots'
+    slot_ttl = 300
+    poll_interval = 0.05
+
+    def __init__(self, alias: str = 'default', **kwargs):
+        self.cache = caches[alias]
+
+    def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.time()
+        cache_key = f'throttle:{key}'
+        tat, wait = _gcra(self.cache.get(cache_key), now, rate, burst)
+        if tat is not None:
+            self.cache.set(cache_key, tat, math.ceil(tat - now) + 1)
+        return wait
+
+    def acquire(self, limit: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            self.cache.add(self.slots_key, 0, self.slot_ttl)
+            try:
+                if self.cache.incr(self.slots_key) <= limit:
+                    return True
+                self.cache.decr(self.slots_key)
+            except ValueError:
+                # The counter expired between add and incr
+                pass
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll_interval, remaining))
+
+    def release(self):
+        try:
+            self.cache.decr(self.slots_key)
+        except ValueError:
+            # The counter expired and starts again from zero
+            pass
+
+    def in_flight(self) -> int:
+        return max(self.cache.get(self.slots_key, 0), 0)
+
+
+BACKENDS = {
+    'memory': InMemoryBackend,
+    'django': DjangoCacheBackend,
+}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Return the process-wide backend, or None when THROTTLE_BACKEND is empty"""
+    global _backend
+    if not settings.THROTTLE_BACKEND:
+        return None
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                backend_name = settings.THROTTLE_BACKEND
+                backend_class = BACKENDS.get(backend_name) or import_string(backend_name)
+                _backend = backend_class(
+                    max_clients=settings.THROTTLE_MAX_CLIENTS,
+                    alias=settings.THROTTLE_CACHE_ALIAS,
+                )
+    return _backend
+
+
+def reset():
+    global _backend
+    with _backend_lock:
+        _backend = None
+
+
+def client_idents(request) -> List[str]:
+    """The bucket owners for a request: its address, then its session when it names one"""
+    idents = [f'ip:{BaseThrottle().get_ident(request)}']
+    session_id = request.META.get(SESSION_HEADER)
+    if session_id:
+        idents.append(f'session:{session_id[:SESSION_ID_MAX_LENGTH]}')
+    return idents
+
+
+def take(scopes: Iterable[str], idents: List[str]) -> float:
+    """Take a token from each of the client's buckets; the longest wait among the empty ones, else 0"""
+    backend = get_backend()
+    if backend is None:
+        return 0.0
+    waits = [0.0]
+    for scope in scopes:
+        rate, burst = settings.THROTTLE_RATES[scope]
+        for ident in idents:
+            wait = backend.take(f'{scope}:{ident}', rate, burst)
+            if wait:
+                # The address comes first, so a throttled client's made-up session ids never get a bucket
+                break
+        metrics.THROTTLE_DECISIONS.inc(scope=scope, result='throttled' if wait else 'allowed')
+        waits.append(wait)
+    return max(waits)
+
+
+def admit() -> Optional[Callable[[], None]]:
+    """Wait up to MODEL_QUEUE_TIMEOUT for a model-work slot.
+
+    Returns the function that gives the slot back (call it exactly once),
+    or None if no slot freed up in time.
+    """
+    backend = get_backend()
+    if backend is None or not settings.MODEL_CONCURRENCY:
+        return lambda: None
+    started = time.perf_counter()
+    admitted = backend.acquire(settings.MODEL_CONCURRENCY, settings.MODEL_QUEUE_TIMEOUT)
+    metrics.ADMISSION_WAIT.observe(time.perf_counter() - started, result='admitted' if admitted else 'rejected')
+    return backend.release if admitted else None
+
+
+def in_flight() -> Optional[int]:
+    backend = get_backend()
+    return backend.in_flight() if backend else None
+
+
+def retry_after() -> float:
+    """Suggested wait after an admission rejection: the time the request already queued"""
+    return max(settings.MODEL_QUEUE_TIMEOUT, 1)
+
+
+def throttled_response(wait: float) -> JsonResponse:
+    """A 429 shaped like DRF's, for the plain Django views"""
+    response = JsonResponse({'detail': Throttled(wait).detail}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+    response['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+class ClientRateThrottle(BaseThrottle):
+    """Token bucket per client; the default throttle for every API view"""
+    scopes = ('requests',)
+
+    def allow_request(self, request, view):
+        self.wait_seconds = take(self.scopes, client_idents(request))
+        return not self.wait_seconds
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class ModelRateThrottle(ClientRateThrottle):
+    """Both buckets, for views that call a model"""
+    scopes = ('requests', 'model')
+
+
+class _HeldStream:
+    """Streaming content that gives the slot back when the stream ends or is closed unread"""
+
+    def __init__(self, chunks, release: Callable[[], None]):
+        self._chunks = iter(chunks)
+        self._release = release
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._chunks)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+            if hasattr(self._chunks, 'close'):
+                self._chunks.close()
+
+
+class _HeldAsyncStream:
+    """_HeldStream for async streaming content, served under ASGI"""
+
+    def __init__(self, chunks, release: Callable[[], None]):
+        self._chunks = chunks.__aiter__()
+        self._release = release
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self._chunks.__anext__()
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        # Called by the response when the server closes it; the content itself is left to finish or be collected
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+
+def hold_slot(response, release: Callable[[], None]):
+    """Give the slot back once ``response`` is done; streams keep it until they end"""
+    if not response.streaming:
+        release()
+        return response
+    held = _HeldAsyncStream if response.is_async else _HeldStream
+    response.streaming_content = held(response.streaming_content, release)
+    return response
+
+
+def model_work(view_func):
+    """Run a DRF function view in a model-work slot, raising Throttled if none frees up in time.
+
+    Goes under ``@api_view`` so the throttles have already run.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        release = admit()
+        if release is None:
+            raise Throttled(wait=retry_after())
+        try:
+            response = view_func(request, *args, **kwargs)
+        except BaseException:
+            release()
+            raise
+        return hold_slot(response, release)
+    return wrapper
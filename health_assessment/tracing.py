@@ -0,0 +1,114 @@
+"""Optional spans for following one request through the flow.
+
+``span(name, **attributes)`` times a block and links it to the enclosing
+span, so each request yields a tree: the request itself (middleware), the
+model call attempts (resilience.py) and the treatment plan stages
+(pipeline.py). Field names follow OpenTelemetry's span model, so the output
+can be loaded into its tooling.
+
+Finished spans are appended as JSON lines to TRACING_FILE. With the
+setting empty, spans are not recorded at all. Work handed to thread pools
+(router hedging, batching) starts a new trace, as context does not follow
+it into the pool.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from django.conf import settings
+
+_current: ContextVar[Optional["Span"]] = ContextVar('current_span', default=None)
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.status = 'OK'
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_span_id,
+            'name': self.name,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'duration_ms': (self.end_ns - self.start_ns) / 1e6,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+class NullSpan:
+    """Stands in for a span when tracing is off"""
+
+    def set(self, key: str, value: Any):
+        pass
+
+
+class FileExporter:
+    """Append finished spans to a file, one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter() -> Optional[FileExporter]:
+    global _exporter
+    path = settings.TRACING_FILE
+    if not path:
+        return None
+    with _exporter_lock:
+        if _exporter is None or _exporter.path != path:
+            _exporter = FileExporter(path)
+        return _exporter
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Any]:
+    exporter = get_exporter()
+    if exporter is None:
+        yield NullSpan()
+        return
+    current = Span(name, _current.get(), attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = 'ERROR'
+        current.set('error', type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        current.end_ns = time.time_ns()
+        exporter.export(current)
+
+
+def reset():
+    global _exporter
+    with _exporter_lock:
+        _exporter = None
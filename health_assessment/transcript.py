@@ -0,0 +1,58 @@
+"""Per-assessment Q&A transcript used to assemble prompts.
+
+Answered questions are kept on ``HealthAssessment.transcript`` as a list
+ordered by question_order, updated whenever an Answer is saved or deleted
+(see signals.py). Building a prompt then reads one already-loaded field
+instead of re-querying every question and its answer on each turn.
+"""
+from typing import Any, Dict, List
+
+from django.conf import settings
+from django.db import transaction
+
+from . import prompt_budget
+from .models import Answer, HealthAssessment
+
+
+def _entry(answer: Answer) -> Dict[str, Any]:
+    question = answer.question
+    return {
+        'question_id': question.id,
+        'order': question.question_order,
+        'question': question.question_text,
+        'answer': answer.answer_text,
+    }
+
+
+def _update(assessment: HealthAssessment, question_id: int, entry: Dict[str, Any] = None):
+    with transaction.atomic():
+        current = HealthAssessment.objects.select_for_update().values_list('transcript', flat=True).get(id=assessment.id)
+        entries = [e for e in current if e['question_id'] != question_id]
+        if entry is not None:
+            if entries and entry['order'] >= entries[-1]['order']:
+                entries.append(entry)
+            else:
+                entries = sorted(entries + [entry], key=lambda e: e['order'])
+        HealthAssessment.objects.filter(id=assessment.id).update(transcript=entries)
+    # Keep the caller's (possibly cached) instance in step with the row
+    assessment.transcript = entries
+
+
+def record_answer(answer: Answer):
+    """Add or replace the entry for ``answer``'s question"""
+    _update(answer.question.assessment, answer.question_id, _entry(answer))
+
+
+def remove_answer(answer: Answer):
+    _update(answer.question.assessment, answer.question_id)
+
+
+def qa_pairs(assessment: HealthAssessment) -> List[Dict[str, str]]:
+    return [{'question': e['question'], 'answer': e['answer']} for e in assessment.transcript]
+
+
+def render_context(assessment: HealthAssessment) -> str:
+    """Render the conversation so far in the format the prompts expect, within the follow-up token budget"""
+    qa = prompt_budget.render_qa(qa_pairs(assessment), settings.PROMPT_TRANSCRIPT_BUDGETS['followup_question'])
+    return f"Initial concern: {assessment.initial_concern}\n\n{qa}"
+
@@ -1,12 +1,25 @@
 from django.urls import path
-from . import views
+from . import views, async_views
 
 app_name = 'health_assessment'
 
 urlpatterns = [
+    path('assessments/', views.list_assessments, name='list_assessments'),
+    path('assessments/export/', views.export_assessments, name='export_assessments'),
     path('assessment/start/', views.start_assessment, name='start_assessment'),
     path('assessment/<uuid:assessment_id>/', views.get_assessment, name='get_assessment'),
     path('assessment/<uuid:assessment_id>/next-question/', views.get_next_question, name='next_question'),
+    path('assessment/<uuid:assessment_id>/followup/stream/', views.stream_followup_question, name='stream_followup_question'),
     path('answer/submit/', views.submit_answer, name='submit_answer'),
     path('treatment-plan/<uuid:assessment_id>/', views.generate_treatment_plan, name='generate_treatment_plan'),
+    path('treatment-plan/<uuid:assessment_id>/stream/', views.stream_treatment_plan, name='stream_treatment_plan'),
+    path('treatment-plan/<uuid:assessment_id>/jobs/', views.enqueue_treatment_plan, name='enqueue_treatment_plan'),
+    path('jobs/<uuid:job_id>/', views.get_treatment_plan_job, name='treatment_plan_job'),
+    path('cache/questions/stats/', views.question_cache_stats, name='question_cache_stats'),
+    path('llm/health/', views.llm_health, name='llm_health'),
+
+    # Async variants, intended to be served through health_project.asgi
+    path('async/assessment/start/', async_views.start_assessment, name='async_start_assessment'),
+    path('async/answer/submit/', async_views.submit_answer, name='async_submit_answer'),
+    path('async/treatment-plan/<uuid:assessment_id>/', async_views.generate_treatment_plan, name='async_generate_treatment_plan'),
 ]
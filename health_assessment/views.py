@@ -1,21 +1,47 @@
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.exceptions import NotAuthenticated, PermissionDenied
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db import transaction
+from django.utils import timezone
+from django.views.decorators.http import require_GET
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Q
+import json
 import uuid
 import logging
+from datetime import timedelta
+from itertools import islice
 
-from .models import HealthAssessment, Question, Answer, TreatmentPlan
+from .models import HealthAssessment, Question, Answer, AnswerSubmission, TreatmentPlanJob
 from .serializers import (
+    AssessmentFilterSerializer, AssessmentSummarySerializer,
     HealthAssessmentSerializer, StartAssessmentSerializer, 
-    SubmitAnswerSerializer, QuestionSerializer, TreatmentPlanSerializer
+    SubmitAnswerSerializer, TreatmentPlanSerializer,
+    TreatmentPlanJobSerializer
 )
-from .services import ClaudeService, EKAMCPService
-from .gemeni_service import GeminiService, GeminiServiceAdvanced
+from .services import EKAMCPService
+from .llm_router import get_llm_service, get_router
+from .llm import FALLBACK_FOLLOWUP_QUESTION
+from .plan_parser import PlanExtractor
+from .pipeline import (
+    MAX_QUESTIONS, MIN_ANSWERS_FOR_PLAN, build_treatment_plan, reusable_hash, reuse_treatment_plan, save_treatment_plan
+)
+from .tasks import generate_treatment_plan_task
+from .question_cache import get_question_cache
+from .throttling import ModelRateThrottle, model_work
+from . import archive, batching, export, hot_state, metrics, plan_cache, resilience, speculation, throttling
 logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
+@throttle_classes([ModelRateThrottle])
+@model_work
 def start_assessment(request):
     """Start a new health assessment"""
     serializer = StartAssessmentSerializer(data=request.data)
@@ -26,44 +52,41 @@ def start_assessment(request):
     session_id = data.get('session_id', str(uuid.uuid4()))
     
     try:
+        # Generate initial questions before opening the transaction so the
+        # database is not locked for the duration of the model call
+        llm_service = get_llm_service()
+        questions = llm_service.generate_initial_questions(data['initial_concern'])
+        
         with transaction.atomic():
-            # Create assessment
             assessment = HealthAssessment.objects.create(
                 session_id=session_id,
                 initial_concern=data['initial_concern'],
                 status='started'
             )
             
-            # Generate initial questions using Claude
-            # claude_service = ClaudeService()
-            gemeni_service = GeminiService()
-            # questions = claude_service.generate_initial_questions(data['initial_concern'])
-            questions = gemeni_service.generate_initial_questions(data['initial_concern'])
-            
-            # Create question objects
-            question_objs = []
-            for i, question_text in enumerate(questions, 1):
-                q = Question.objects.create(
-                    assessment=assessment,
-                    question_text=question_text,
-                    question_order=i
-                )
-                question_objs.append({
-                    'id': q.id,
-                    'question_text': q.question_text,
-                    'question_order': q.question_order,
-                    'is_answered': q.is_answered
-                })
+            created_questions = Question.objects.bulk_create([
+                Question(assessment=assessment, question_text=question_text, question_order=i)
+                for i, question_text in enumerate(questions, 1)
+            ])
             
             assessment.status = 'in_progress'
-            assessment.save()
-            
-            return Response({
-                'assessment_id': assessment.id,
-                'session_id': assessment.session_id,
-                'questions': question_objs,
-                'status': 'success'
-            })
+            assessment.save(update_fields=['status', 'updated_at'])
+        
+        hot_state.store(assessment.id, hot_state.build(assessment.status, len(created_questions), 0, created_questions))
+        
+        question_objs = [{
+            'id': q.id,
+            'question_text': q.question_text,
+            'question_order': q.question_order,
+            'is_answered': q.is_answered
+        } for q in created_questions]
+        
+        return Response({
+            'assessment_id': assessment.id,
+            'session_id': assessment.session_id,
+            'questions': question_objs,
+            'status': 'success'
+        })
             
     except Exception as e:
         logger.error(f"Error starting assessment: {str(e)}")
@@ -72,59 +95,188 @@ def start_assessment(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+IDEMPOTENCY_KEY_MAX_LENGTH = 100
+# Seconds past the follow-up deadline after which an unfinished claim counts as abandoned
+IDEMPOTENCY_CLAIM_MARGIN = 30
+
+def _claim_idempotency_key(key, question):
+    """Reserve ``key`` for this submission; returns the (body, status) to reply with instead if it was already used.
+
+    Shared with the async view, so it returns data rather than a response.
+    """
+    # Look before inserting so a retry costs one indexed read
+    submission = AnswerSubmission.objects.filter(key=key).first()
+    if submission is not None and submission.response is None and submission.created_at < _abandoned_before():
+        # The request holding the claim died without saving a response or releasing the key
+        AnswerSubmission.objects.filter(pk=submission.pk, response__isnull=True).delete()
+        submission = None
+    if submission is None:
+        try:
+            with transaction.atomic():
+                AnswerSubmission.objects.create(key=key, question=question)
+            return None
+        except IntegrityError:
+            submission = AnswerSubmission.objects.filter(key=key).first()
+    if submission is None or submission.response is None:
+        # The first request is still running (or has just failed and released the key)
+        return {'error': 'A request with this Idempotency-Key is in progress.'}, status.HTTP_409_CONFLICT
+    if submission.question_id != question.id:
+        return {'error': 'This Idempotency-Key was used for another question.'}, status.HTTP_422_UNPROCESSABLE_ENTITY
+    return submission.response, status.HTTP_200_OK
+
+def _abandoned_before():
+    seconds = settings.LLM_DEADLINES['followup_question'] + IDEMPOTENCY_CLAIM_MARGIN
+    return timezone.now() - timedelta(seconds=seconds)
+
+def _replay_response(reply, response_class=Response):
+    """The response for a ``_claim_idempotency_key`` reply, as a DRF Response or a JsonResponse"""
+    body, status_code = reply
+    response = response_class(body, status=status_code)
+    if status_code == status.HTTP_409_CONFLICT:
+        response['Retry-After'] = '1'
+    return response
+
+def _release_idempotency_key(key):
+    # Release the key so the client's retry is processed afresh
+    AnswerSubmission.objects.filter(key=key, response__isnull=True).delete()
+
+def _save_idempotent_response(key, payload):
+    AnswerSubmission.objects.filter(key=key).update(response=payload)
+
+def _add_followup(assessment, order, question_text):
+    """Create the follow-up at ``order``; returns (question, created), or the existing one if the slot was taken"""
+    try:
+        with transaction.atomic():
+            return Question.objects.create(
+                assessment=assessment,
+                question_text=question_text,
+                question_order=order
+            ), True
+    except IntegrityError:
+        return Question.objects.get(assessment=assessment, question_order=order), False
+
+def _record_answer(question, answer_text):
+    assessment = question.assessment
+    with transaction.atomic():
+        # Writing first takes the row lock (the database write lock on SQLite), so submissions
+        # for one assessment take turns from here on instead of failing to upgrade a read
+        HealthAssessment.objects.filter(id=assessment.id).update(updated_at=timezone.now())
+        state = hot_state.get(assessment.id)
+
+        # Create or update answer
+        answer, created = Answer.objects.get_or_create(
+            question=question,
+            defaults={'answer_text': answer_text}
+        )
+        if not created:
+            # Reuse the loaded question so the transcript update lands on our instance
+            answer.question = question
+            answer.answer_text = answer_text
+            answer.save(update_fields=['answer_text', 'created_at'])
+
+        # Only the request that actually marks the question answered may ask for a follow-up
+        newly_answered = Question.objects.filter(id=question.id, is_answered=False).update(is_answered=True) == 1
+        question.is_answered = True
+        counts = assessment.questions.aggregate(
+            total=Count('id'),
+            answered=Count('id', filter=Q(is_answered=True))
+        )
+
+    # The cached open questions are reused only if they agree with the counts read under the lock
+    pending = None
+    if state['total'] == counts['total'] and state['answered'] + newly_answered == counts['answered']:
+        pending = [q for q in state['pending'] if q['id'] != question.id]
+    return state['status'], counts['total'], counts['answered'], pending, newly_answered
+
+def _needs_followup(newly_answered, total_questions, answered_questions):
+    # Only the request that actually marked the last open question answered may ask for one
+    return newly_answered and answered_questions == total_questions and answered_questions < MAX_QUESTIONS
+
+def _store_answer_state(assessment, state_status, total_questions, answered_questions, pending):
+    """Refresh the hot state after an answer; ``pending`` is None when the cached open questions went stale"""
+    if pending is not None:
+        hot_state.store(assessment.id, {
+            'status': state_status,
+            'total': total_questions,
+            'answered': answered_questions,
+            'pending': pending,
+        })
+    else:
+        hot_state.invalidate(assessment.id)
+
+def _answer_payload(next_question, answered_questions):
+    return {
+        'status': 'success',
+        'message': 'Answer submitted successfully',
+        'next_question': {
+            'id': next_question.id,
+            'text': next_question.question_text
+        } if next_question else None,
+        'can_finish': answered_questions >= 3  # Allow finishing after 3 questions
+    }
+
 @api_view(['POST'])
+@throttle_classes([ModelRateThrottle])
+@model_work
 def submit_answer(request):
-    """Submit an answer to a question"""
+    """Submit an answer to a question.
+
+    A retry carrying the same ``Idempotency-Key`` header gets the first
+    response back; the answer is not written again and no model is called.
+    """
     serializer = SubmitAnswerSerializer(data=request.data)
     if not serializer.is_valid():
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     data = serializer.validated_data
+    key = request.headers.get('Idempotency-Key', '')
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return Response(
+            {'error': f'Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     
     try:
-        question = get_object_or_404(Question, id=data['question_id'])
-        
-        # Create or update answer
-        answer, created = Answer.objects.get_or_create(
-            question=question,
-            defaults={'answer_text': data['answer_text']}
-        )
-        
-        if not created:
-            answer.answer_text = data['answer_text']
-            answer.save()
-        
-        question.is_answered = True
-        question.save()
-        
-        # Check if we should generate a follow-up question
+        question = get_object_or_404(Question.objects.select_related('assessment'), id=data['question_id'])
         assessment = question.assessment
-        answered_questions = assessment.questions.filter(is_answered=True).count()
-        total_questions = assessment.questions.count()
-        
-        next_question = None
-        if answered_questions == total_questions and answered_questions < 8:  # Max 8 questions
-            # Generate follow-up question
-            # claude_service = ClaudeService()
-            gemeni_service = GeminiService()
-            # followup_question_text = claude_service.generate_followup_question(assessment)
-            followup_question_text = gemeni_service.generate_followup_question(assessment)
-            
-            next_question = Question.objects.create(
-                assessment=assessment,
-                question_text=followup_question_text,
-                question_order=total_questions + 1
+        if key:
+            replay = _claim_idempotency_key(key, question)
+            if replay is not None:
+                return _replay_response(replay)
+        
+        try:
+            state_status, total_questions, answered_questions, pending, newly_answered = _record_answer(
+                question, data['answer_text']
             )
+            
+            # Check if we should generate a follow-up question
+            next_question = None
+            llm_service = get_llm_service()
+            if _needs_followup(newly_answered, total_questions, answered_questions):
+                # Generate follow-up question, unless one was already speculated
+                followup_question_text = speculation.take(assessment)
+                if followup_question_text is None:
+                    followup_question_text = llm_service.generate_followup_question(assessment)
+                
+                next_question, created = _add_followup(assessment, total_questions + 1, followup_question_text)
+                total_questions += 1
+                if created and pending is not None:
+                    pending.append(hot_state.question_payload(next_question))
+                else:
+                    pending = None
+            elif total_questions < MAX_QUESTIONS:
+                speculation.maybe_start(llm_service, assessment, answered_questions, total_questions)
+            
+            _store_answer_state(assessment, state_status, total_questions, answered_questions, pending)
+            payload = _answer_payload(next_question, answered_questions)
+        except Exception:
+            if key:
+                _release_idempotency_key(key)
+            raise
         
-        return Response({
-            'status': 'success',
-            'message': 'Answer submitted successfully',
-            'next_question': {
-                'id': next_question.id,
-                'text': next_question.question_text
-            } if next_question else None,
-            'can_finish': answered_questions >= 3  # Allow finishing after 3 questions
-        })
+        if key:
+            _save_idempotent_response(key, payload)
+        return Response(payload)
         
     except Exception as e:
         logger.error(f"Error submitting answer: {str(e)}")
@@ -135,19 +287,99 @@ def submit_answer(request):
 
 @api_view(['GET'])
 def get_assessment(request, assessment_id):
-    """Get assessment details"""
+    """Get assessment details, from the archive once the assessment has been archived"""
     try:
-        assessment = get_object_or_404(HealthAssessment, id=assessment_id)
-        serializer = HealthAssessmentSerializer(assessment)
-        return Response(serializer.data)
+        assessment = HealthAssessment.objects.with_details().filter(id=assessment_id).first()
+        if assessment is None:
+            data = archive.load(assessment_id)
+        else:
+            data = HealthAssessmentSerializer(assessment).data
     except Exception as e:
         logger.error(f"Error getting assessment: {str(e)}")
         return Response(
             {'error': 'Failed to get assessment'}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+    if data is None:
+        raise Http404
+    return Response(data)
+
+class AssessmentCursorPagination(CursorPagination):
+    """Keyset pagination, newest first; pages cost the same however deep the cursor is"""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    page_size_query_param = 'limit'
+    max_page_size = 500
+
+def _filtered_assessments(params):
+    """Assessments matching the status/created_after/created_before query params, or a 400 response"""
+    filters = AssessmentFilterSerializer(data=params)
+    if not filters.is_valid():
+        return None, filters.errors
+    data = filters.validated_data
+    queryset = HealthAssessment.objects.all()
+    if 'status' in data:
+        queryset = queryset.filter(status=data['status'])
+    if 'created_after' in data:
+        queryset = queryset.filter(created_at__gte=data['created_after'])
+    if 'created_before' in data:
+        queryset = queryset.filter(created_at__lt=data['created_before'])
+    return queryset, None
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def list_assessments(request):
+    """List assessments newest first, filtered by status and creation date"""
+    queryset, errors = _filtered_assessments(request.query_params)
+    if errors:
+        return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+    paginator = AssessmentCursorPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(AssessmentSummarySerializer(page, many=True).data)
+
+EXPORT_FORMATS = {
+    'ndjson': (export.ndjson, 'application/x-ndjson'),
+    'csv': (export.csv_rows, 'text/csv'),
+}
+
+EXPORT_SCOPES = ('requests', 'exports')
+
+@require_GET
+def export_assessments(request):
+    """Stream matching assessments with questions, answers and plans as NDJSON (default) or CSV.
+
+    A plain Django view: DRF reserves the ``format`` query parameter for
+    renderer selection. Like the listing it is for logged-in staff only,
+    and each client may start only a few exports a minute.
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'detail': NotAuthenticated.default_detail}, status=status.HTTP_403_FORBIDDEN)
+    if not request.user.is_staff:
+        return JsonResponse({'detail': PermissionDenied.default_detail}, status=status.HTTP_403_FORBIDDEN)
+    wait = throttling.take(EXPORT_SCOPES, throttling.client_idents(request))
+    if wait:
+        return throttling.throttled_response(wait)
+
+    export_format = request.GET.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse(
+            {'format': [f'Choose one of: {", ".join(EXPORT_FORMATS)}.']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    queryset, errors = _filtered_assessments(request.GET)
+    if errors:
+        return JsonResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+
+    rows, content_type = EXPORT_FORMATS[export_format]
+    # Under ASGI, a chunk of rows per trip to the sync thread rather than one
+    content = _streaming_content(request, rows(queryset), batch=settings.EXPORT_CHUNK_SIZE)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="assessments.{export_format}"'
+    return response
 
 @api_view(['POST'])
+@throttle_classes([ModelRateThrottle])
+@model_work
 def generate_treatment_plan(request, assessment_id):
     """Generate treatment plan for completed assessment"""
     try:
@@ -155,42 +387,18 @@ def generate_treatment_plan(request, assessment_id):
         
         # Check if assessment has enough answers
         answered_questions = assessment.questions.filter(is_answered=True).count()
-        if answered_questions < 3:
+        if answered_questions < MIN_ANSWERS_FOR_PLAN:
             return Response(
                 {'error': 'Not enough questions answered. Minimum 3 required.'}, 
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Generate treatment plan using EKA MCP
-        eka_service = EKAMCPService()
-        treatment_data = eka_service.generate_treatment_plan(assessment)
-        
-        # Save treatment plan
-        treatment_plan, created = TreatmentPlan.objects.get_or_create(
-            assessment=assessment,
-            defaults={
-                'diagnosis': treatment_data['diagnosis'],
-                'recommendations': treatment_data['recommendations'],
-                'medications': treatment_data.get('medications', []),
-                'lifestyle_changes': treatment_data.get('lifestyle_changes', []),
-                'followup_instructions': treatment_data['followup_instructions']
-            }
-        )
-        
-        if not created:
-            treatment_plan.diagnosis = treatment_data['diagnosis']
-            treatment_plan.recommendations = treatment_data['recommendations']
-            treatment_plan.medications = treatment_data.get('medications', [])
-            treatment_plan.lifestyle_changes = treatment_data.get('lifestyle_changes', [])
-            treatment_plan.followup_instructions = treatment_data['followup_instructions']
-            treatment_plan.save()
-        
-        assessment.status = 'treatment_generated'
-        assessment.save()
+        treatment_plan, cached = build_treatment_plan(assessment)
         
         serializer = TreatmentPlanSerializer(treatment_plan)
         return Response({
             'status': 'success',
+            'cached': cached,
             'treatment_plan': serializer.data
         })
         
@@ -204,13 +412,14 @@ def generate_treatment_plan(request, assessment_id):
 @api_view(['GET'])
 def get_next_question(request, assessment_id):
     """Get the next unanswered question"""
+    state = hot_state.get(assessment_id)
+    if state is None:
+        raise Http404
     try:
-        assessment = get_object_or_404(HealthAssessment, id=assessment_id)
-        next_question = assessment.questions.filter(is_answered=False).first()
+        next_question = hot_state.next_question(state)
         
         if next_question:
-            serializer = QuestionSerializer(next_question)
-            return Response(serializer.data)
+            return Response(next_question)
         else:
             return Response({'message': 'No more questions'}, status=status.HTTP_204_NO_CONTENT)
             
@@ -220,4 +429,212 @@ def get_next_question(request, assessment_id):
             {'error': 'Failed to get next question'}, 
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
-    
+
+@api_view(['POST'])
+@throttle_classes([ModelRateThrottle])
+def enqueue_treatment_plan(request, assessment_id):
+    """Queue treatment plan generation and return a job to poll"""
+    try:
+        assessment = get_object_or_404(HealthAssessment, id=assessment_id)
+        
+        answered_questions = assessment.questions.filter(is_answered=True).count()
+        if answered_questions < MIN_ANSWERS_FOR_PLAN:
+            return Response(
+                {'error': 'Not enough questions answered. Minimum 3 required.'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        job = TreatmentPlanJob.objects.create(assessment=assessment)
+        generate_treatment_plan_task.delay(str(job.id))
+        job.refresh_from_db()
+        
+        serializer = TreatmentPlanJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        
+    except Exception as e:
+        logger.error(f"Error queueing treatment plan: {str(e)}")
+        return Response(
+            {'error': 'Failed to queue treatment plan', 'details': str(e)}, 
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+@api_view(['GET'])
+def get_treatment_plan_job(request, job_id):
+    """Get the status of a treatment plan job"""
+    job = get_object_or_404(TreatmentPlanJob.objects.select_related('assessment__treatment_plan'), id=job_id)
+    serializer = TreatmentPlanJobSerializer(job)
+    return Response(serializer.data)
+
+@api_view(['GET'])
+def question_cache_stats(request):
+    """Hit/miss counters of the initial-question cache"""
+    cache = get_question_cache()
+    if cache is None:
+        return Response({'enabled': False})
+    return Response({'enabled': True, **cache.stats()})
+
+@api_view(['GET'])
+def llm_health(request):
+    """Circuit breaker state and question batching per provider, plus the router's latency stats when it is in use"""
+    data = {
+        'service': settings.LLM_SERVICE,
+        'breakers': resilience.breaker_states(),
+        'batching': batching.stats(),
+    }
+    if settings.LLM_SERVICE == 'router':
+        data['router'] = get_router().snapshot()
+    return Response(data)
+
+def _runtime_metrics():
+    """Gauges for the state other modules keep, read at scrape time"""
+    circuit_open = metrics.Gauge('llm_circuit_open', 'Whether the provider\'s circuit breaker is open', ['provider'])
+    short_circuits = metrics.Gauge(
+        'llm_circuit_short_circuits', 'Calls refused by the provider\'s open circuit breaker', ['provider']
+    )
+    for name, state in resilience.breaker_states().items():
+        circuit_open.set(int(state['state'] == 'open'), provider=name)
+        short_circuits.set(state['short_circuits'], provider=name)
+
+    batches = metrics.Gauge('initial_question_batches', 'Batched initial-question dispatches', ['provider'])
+    batch_prompts = metrics.Gauge('initial_question_batch_prompts', 'Prompts sent in batches', ['provider'])
+    for name, stats in batching.stats().items():
+        batches.set(stats['batches'], provider=name)
+        batch_prompts.set(stats['prompts'], provider=name)
+
+    gauges = [circuit_open, short_circuits, batches, batch_prompts]
+    in_flight = throttling.in_flight()
+    if in_flight is not None:
+        model_work_in_flight = metrics.Gauge('model_work_in_flight', 'Requests holding a model-work slot')
+        model_work_in_flight.set(in_flight)
+        gauges.append(model_work_in_flight)
+    if settings.LLM_SERVICE == 'router':
+        router_p95 = metrics.Gauge('llm_router_p95_seconds', 'Router\'s windowed p95 latency per provider', ['provider'])
+        router_errors = metrics.Gauge('llm_router_error_rate', 'Router\'s smoothed error rate per provider', ['provider'])
+        for name, stats in get_router().snapshot().items():
+            if stats['p95_s'] is not None:
+                router_p95.set(stats['p95_s'], provider=name)
+            router_errors.set(stats['error_rate'], provider=name)
+        gauges += [router_p95, router_errors]
+    return gauges
+
+def prometheus_metrics(request):
+    """Prometheus scrape endpoint for this process"""
+    return HttpResponse(metrics.render(_runtime_metrics()), content_type=metrics.CONTENT_TYPE)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _aiterate(items, batch=1):
+    """Pull a sync generator ``batch`` items at a time on the request's sync thread.
+
+    Under ASGI, Django buffers a sync iterator whole before sending it, so
+    nothing would go out until the last item was made.
+    """
+    pull = sync_to_async(lambda: list(islice(items, batch)))
+    try:
+        while chunk := await pull():
+            for item in chunk:
+                yield item
+    finally:
+        await sync_to_async(items.close)()
+
+def _streaming_content(request, items, batch=1):
+    """``items`` as the handler serving ``request`` streams them: as is for WSGI, async for ASGI"""
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        return _aiterate(items, batch)
+    return items
+
+def _sse_response(request, events):
+    events = _streaming_content(request, events)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep nginx from buffering the stream
+    return response
+
+@api_view(['GET'])
+@throttle_classes([ModelRateThrottle])
+@model_work
+def stream_followup_question(request, assessment_id):
+    """Stream the next follow-up question as server-sent events.
+
+    Emits ``token`` events while the model writes, ``reset`` if generation
+    failed part-way and the fallback replaces it, then a final ``done``
+    event with the persisted question.
+    """
+    assessment = get_object_or_404(HealthAssessment, id=assessment_id)
+    answered_questions = assessment.questions.filter(is_answered=True).count()
+    total_questions = assessment.questions.count()
+    if answered_questions != total_questions or total_questions >= MAX_QUESTIONS:
+        return Response(
+            {'error': 'No follow-up question is due for this assessment.'},
+            status=status.HTTP_409_CONFLICT
+        )
+
+    def events():
+        chunks = []
+        try:
+            for chunk in get_llm_service().stream_followup_question(assessment):
+                chunks.append(chunk)
+                yield _sse('token', {'text': chunk})
+            question_text = ''.join(chunks).strip()
+        except Exception as e:
+            logger.error(f"Error streaming follow-up question: {str(e)}")
+            question_text = ''
+        if not question_text:
+            if chunks:
+                yield _sse('reset', {})
+            question_text = FALLBACK_FOLLOWUP_QUESTION
+            metrics.LLM_FALLBACKS.inc(operation='followup_question')
+            yield _sse('token', {'text': question_text})
+
+        # A submission that raced us may have filled the slot already; hand out that question instead
+        question, _ = _add_followup(assessment, total_questions + 1, question_text)
+        question_text = question.question_text
+        yield _sse('done', {'question_id': question.id, 'question_order': question.question_order, 'text': question_text})
+
+    return _sse_response(request, events())
+
+@api_view(['GET'])
+@throttle_classes([ModelRateThrottle])
+@model_work
+def stream_treatment_plan(request, assessment_id):
+    """Stream treatment plan generation as server-sent events.
+
+    Emits ``token`` events with raw JSON as it arrives and a final ``done``
+    event carrying the persisted plan. A plan reused from the plan cache is
+    sent as the ``done`` event alone.
+    """
+    assessment = get_object_or_404(HealthAssessment, id=assessment_id)
+    answered_questions = assessment.questions.filter(is_answered=True).count()
+    if answered_questions < MIN_ANSWERS_FOR_PLAN:
+        return Response(
+            {'error': 'Not enough questions answered. Minimum 3 required.'}, 
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    def events():
+        digest = plan_cache.transcript_hash(assessment)
+        treatment_plan = reuse_treatment_plan(assessment, digest)
+        cached = treatment_plan is not None
+        if not cached:
+            eka_service = EKAMCPService(get_llm_service())
+            # Parse while tokens arrive; whatever was complete survives a stream that breaks off
+            extractor = PlanExtractor()
+            try:
+                for chunk in eka_service.stream_treatment_plan(assessment):
+                    yield _sse('token', {'text': chunk})
+                    if extractor.feed(chunk):
+                        break
+            except Exception as e:
+                logger.error(f"Error streaming treatment plan: {str(e)}")
+            treatment_data = eka_service.complete_treatment_plan(assessment, extractor)
+
+            treatment_plan = save_treatment_plan(assessment, treatment_data, reusable_hash(eka_service, digest))
+        yield _sse('done', {
+            'treatment_plan_id': treatment_plan.id,
+            'cached': cached,
+            'treatment_plan': TreatmentPlanSerializer(treatment_plan).data
+        })
+
+    return _sse_response(request, events())
+
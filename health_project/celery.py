@@ -0,0 +1,16 @@
+"""
+Celery config for the health_project project.
+
+Workers are started with ``celery -A health_project worker``. Settings
+prefixed with ``CELERY_`` in health_project/settings.py configure the app.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'health_project.settings')
+
+app = Celery('health_project')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -1,6 +1,7 @@
 
 import os
 from pathlib import Path
+from urllib.parse import unquote, urlparse
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -24,6 +25,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'health_assessment.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -55,13 +57,71 @@ TEMPLATES = [
 WSGI_APPLICATION = 'health_project.wsgi.application'
 
 # Database
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+# DATABASE_URL selects a server database, e.g. postgres://user:pass@db:5432/health.
+# Without it the local SQLite file is used, tuned for a single node (WAL journal).
+# Only backends that return primary keys from bulk_create, which the views rely on.
+DATABASE_ENGINES = {
+    'postgres': 'django.db.backends.postgresql',
+    'postgresql': 'django.db.backends.postgresql',
+    'sqlite': 'django.db.backends.sqlite3',
 }
 
+def database_from_url(url):
+    parsed = urlparse(url)
+    engine = DATABASE_ENGINES[parsed.scheme]
+    if engine == 'django.db.backends.sqlite3':
+        return {'ENGINE': engine, 'NAME': unquote(parsed.path)}
+    return {
+        'ENGINE': engine,
+        'NAME': unquote(parsed.path.lstrip('/')),
+        'USER': unquote(parsed.username or ''),
+        'PASSWORD': unquote(parsed.password or ''),
+        'HOST': parsed.hostname or '',
+        'PORT': str(parsed.port or ''),
+        # Keep connections open between requests instead of reconnecting each time
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        # Required behind a transaction-pooling PgBouncer
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_POOLER', 'False').lower() == 'true',
+    }
+
+if os.getenv('DATABASE_URL'):
+    DATABASES = {'default': database_from_url(os.getenv('DATABASE_URL'))}
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+            'OPTIONS': {
+                # Seconds a writer waits on a locked database before failing
+                'timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+            },
+        }
+    }
+
+# Journal mode applied to each new SQLite connection; 'wal' lets readers run alongside the writer
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'wal')
+
+# Cache
+# CACHE_URL selects a shared Redis cache, e.g. redis://redis:6379/1; without it each process keeps its own
+if os.getenv('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Per-assessment status, counters and open questions (see health_assessment/hot_state.py)
+HOT_STATE_CACHE_ALIAS = os.getenv('HOT_STATE_CACHE_ALIAS', 'default')
+HOT_STATE_TTL = int(os.getenv('HOT_STATE_TTL', '3600'))
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
@@ -73,6 +133,12 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'health_assessment.throttling.ClientRateThrottle',
+    ],
+    # Reverse proxies in front of the app; X-Forwarded-For is ignored when 0, so clients can't spoof
+    # their address for throttling
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', '0')),
 }
 
 # CORS Settings
@@ -92,10 +158,113 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-# API Keys
+# API Keys; from the environment only, never committed
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY')
+GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
 EKA_MCP_URL = os.getenv('EKA_MCP_URL', 'http://localhost:8080/api/treatment')
 
+# Shared LLM client pools (see health_assessment/providers.py)
+LLM_HTTP_POOL_SIZE = int(os.getenv('LLM_HTTP_POOL_SIZE', '20'))
+LLM_HTTP_KEEPALIVE_SECONDS = float(os.getenv('LLM_HTTP_KEEPALIVE_SECONDS', '60'))
+
+# LLM provider selection (see health_assessment/llm_router.py)
+# One of gemini, gemini-advanced, claude, or router to pick per call among LLM_ROUTER_PROVIDERS
+LLM_SERVICE = os.getenv('LLM_SERVICE', 'gemini')
+LLM_ROUTER_PROVIDERS = [p for p in os.getenv('LLM_ROUTER_PROVIDERS', 'gemini,claude').split(',') if p]
+LLM_ROUTER_WINDOW = int(os.getenv('LLM_ROUTER_WINDOW', '100'))
+LLM_ROUTER_WORKERS = int(os.getenv('LLM_ROUTER_WORKERS', '32'))
+# Hedge to the next provider once a call runs past this percentile of its provider's latency
+LLM_HEDGE_PERCENTILE = int(os.getenv('LLM_HEDGE_PERCENTILE', '95'))
+LLM_HEDGE_MIN_DELAY = float(os.getenv('LLM_HEDGE_MIN_DELAY', '1.0'))
+
+# Model call deadlines, retries and circuit breaking (see health_assessment/resilience.py)
+# Total seconds per operation, shared by all retries of one call
+LLM_DEADLINES = {
+    'initial_questions': float(os.getenv('LLM_DEADLINE_INITIAL_QUESTIONS', '15')),
+    'followup_question': float(os.getenv('LLM_DEADLINE_FOLLOWUP_QUESTION', '10')),
+    'treatment_plan': float(os.getenv('LLM_DEADLINE_TREATMENT_PLAN', '45')),
+}
+LLM_RETRIES = int(os.getenv('LLM_RETRIES', '2'))
+LLM_RETRY_BACKOFF = float(os.getenv('LLM_RETRY_BACKOFF', '0.5'))
+LLM_RETRY_BACKOFF_MAX = float(os.getenv('LLM_RETRY_BACKOFF_MAX', '4'))
+# Consecutive failures that open a provider's circuit, and how long it stays open
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv('LLM_BREAKER_RESET_SECONDS', '30'))
+
+# Token budget for the Q&A part of prompts; older answers are condensed beyond it
+# (see health_assessment/prompt_budget.py)
+PROMPT_TRANSCRIPT_BUDGETS = {
+    'followup_question': int(os.getenv('PROMPT_BUDGET_FOLLOWUP_QUESTION', '800')),
+    'treatment_plan': int(os.getenv('PROMPT_BUDGET_TREATMENT_PLAN', '2000')),
+}
+
+# Initial-question cache (see health_assessment/question_cache.py)
+# Backend is 'memory', 'django' (any CACHES alias, e.g. Redis) or a dotted path; empty disables it
+QUESTION_CACHE_BACKEND = os.getenv('QUESTION_CACHE_BACKEND', 'memory')
+QUESTION_CACHE_ALIAS = os.getenv('QUESTION_CACHE_ALIAS', 'default')
+QUESTION_CACHE_TTL = int(os.getenv('QUESTION_CACHE_TTL', '86400'))
+QUESTION_CACHE_MAX_ENTRIES = int(os.getenv('QUESTION_CACHE_MAX_ENTRIES', '1000'))
+# Opt-in minimum trigram similarity for a fuzzy hit; the default 1.0 only matches identical
+# normalized concerns. Lower it with care: "fever in my 2 year old" and "... 12 year old" score 0.85
+QUESTION_CACHE_SIMILARITY = float(os.getenv('QUESTION_CACHE_SIMILARITY', '1.0'))
+
+# Micro-batch concurrent initial-question prompts (see health_assessment/batching.py)
+# Milliseconds to collect prompts before dispatching; 0 sends each prompt on its own
+INITIAL_QUESTION_BATCH_WINDOW_MS = int(os.getenv('INITIAL_QUESTION_BATCH_WINDOW_MS', '0'))
+INITIAL_QUESTION_BATCH_SIZE = int(os.getenv('INITIAL_QUESTION_BATCH_SIZE', '8'))
+# 'prompt' combines a batch into one model call; 'fanout' sends bounded concurrent calls
+INITIAL_QUESTION_BATCH_MODE = os.getenv('INITIAL_QUESTION_BATCH_MODE', 'prompt')
+INITIAL_QUESTION_BATCH_WORKERS = int(os.getenv('INITIAL_QUESTION_BATCH_WORKERS', '8'))
+
+# Let an assessment reuse the plan stored for an identical transcript of another one
+# (see health_assessment/plan_cache.py); an assessment always reuses its own unchanged plan
+TREATMENT_PLAN_CACHE_SHARED = os.getenv('TREATMENT_PLAN_CACHE_SHARED', 'True').lower() == 'true'
+
+# Pre-generate the last follow-up question in the background (see health_assessment/speculation.py)
+SPECULATIVE_FOLLOWUP = os.getenv('SPECULATIVE_FOLLOWUP', 'False').lower() == 'true'
+SPECULATIVE_FOLLOWUP_WORKERS = int(os.getenv('SPECULATIVE_FOLLOWUP_WORKERS', '4'))
+
+# Assessments fetched per round trip by the streaming export (see health_assessment/export.py)
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Spans of each request, model call and plan stage, appended as JSON lines (see
+# health_assessment/tracing.py); empty disables tracing. Metrics are always on at /metrics.
+TRACING_FILE = os.getenv('TRACING_FILE', '')
+
+# Rate limiting and admission control (see health_assessment/throttling.py)
+# Backend is 'memory' (per process), 'django' (a CACHES alias, e.g. Redis, shared by all workers)
+# or a dotted path; empty disables both limits
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'memory')
+THROTTLE_CACHE_ALIAS = os.getenv('THROTTLE_CACHE_ALIAS', 'default')
+THROTTLE_MAX_CLIENTS = int(os.getenv('THROTTLE_MAX_CLIENTS', '10000'))
+# Token buckets per client: (sustained requests per second, burst)
+THROTTLE_RATES = {
+    'requests': (float(os.getenv('THROTTLE_REQUESTS_RATE', '5')), int(os.getenv('THROTTLE_REQUESTS_BURST', '60'))),
+    'model': (float(os.getenv('THROTTLE_MODEL_RATE', '0.5')), int(os.getenv('THROTTLE_MODEL_BURST', '15'))),
+    # Full exports, per staff client
+    'exports': (float(os.getenv('THROTTLE_EXPORTS_RATE', '0.02')), int(os.getenv('THROTTLE_EXPORTS_BURST', '3'))),
+}
+# Requests doing model work at once, and how long a request over the limit waits for a slot; 0 disables it
+MODEL_CONCURRENCY = int(os.getenv('MODEL_CONCURRENCY', '32'))
+MODEL_QUEUE_TIMEOUT = float(os.getenv('MODEL_QUEUE_TIMEOUT', '2'))
+
+# Finished assessments idle this long move to the archive, this many per transaction
+# (see health_assessment/archive.py)
+ARCHIVE_AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+ARCHIVE_BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# Run tasks in-process instead of on a worker (tests and single-process dev)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', 'False').lower() == 'true'
+CELERY_TASK_EAGER_PROPAGATES = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Periodic tasks, run by ``celery -A health_project beat``
+CELERY_BEAT_SCHEDULE = {
+    'archive-assessments': {
+        'task': 'health_assessment.tasks.archive_assessments_task',
+        'schedule': float(os.getenv('ARCHIVE_INTERVAL_SECONDS', '86400')),
+    },
+}
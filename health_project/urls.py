@@ -2,8 +2,11 @@ from django.contrib import admin
 from django.urls import path, include
 from django.views.generic import TemplateView
 
+from health_assessment.views import prometheus_metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('health_assessment.urls')),
+    path('metrics', prometheus_metrics, name='metrics'),
     path('', TemplateView.as_view(template_name='index.html'), name='home'),
 ]
\ No newline at end of file